@@ -47,6 +47,13 @@ class _SparseCoding(object):
                 abs(self.z).sum()*self.alpha)
 
 
+def warmup(n_jobs=1, hostfile=None):
+    """Spawn the pool of MPI workers in the background, see
+    c_dicod.mpi_pool.warmup"""
+    from .c_dicod.mpi_pool import warmup
+    return warmup(n_jobs=n_jobs, hostfile=hostfile)
+
+
 class SparseCodingImplementationError(Exception):
     """Error for in the implementation of a _Decomposition object"""
     def __init__(self, msg):
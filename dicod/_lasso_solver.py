@@ -2,7 +2,7 @@ import logging
 import numpy as np
 from time import time
 
-from .utils import CostCurve, get_log_rate
+from .utils import CostCurve, get_log_rate, arrays_nbytes
 
 log = logging.getLogger('dicod')
 if len(log.handlers) == 0:
@@ -34,12 +34,29 @@ class _LassoSolver(object):
         name of the solver.
     debug : int,
         verbosity of the logger.
+    callbacks : list (default: None)
+        objects notified during the solve through their optional methods
+            - on_iter(solver): after the stopping check of an iteration,
+              every callback_every iterations. Return True to stop.
+            - on_log(solver, it, time, cost): when a cost is recorded.
+            - on_stop(solver): at the end of the solve.
+    callback_every : int (default: 1)
+        number of iterations between two calls of on_iter.
+
+    Attributes
+    ----------
+    cost_curve : CostCurve
+        iterations, times and costs recorded when logging.
+    timings : dict
+        time spent in init, p_update, logging and the stopping checks
+        (stop) during the last solve, in seconds.
     '''
 
     id_solver = 0
 
     def __init__(self, max_iter=1e6, timeout=40, stop='dz', tol=1e-10,
-                 logging=False, log_rate='log1.6', name=None, debug=0):
+                 logging=False, log_rate='log1.6', name=None, debug=0,
+                 callbacks=None, callback_every=1):
         log.setLevel(max(3 - debug, 1) * 10)
 
         # Logging system
@@ -52,6 +69,10 @@ class _LassoSolver(object):
         self.timeout = timeout
         self.max_iter = max_iter
 
+        # Instrumentation of the solve
+        self.callbacks = callbacks if callbacks else []
+        self.callback_every = callback_every
+
         # Name for debugging
         self.id = _LassoSolver.id_solver
         _LassoSolver.id_solver += 1
@@ -66,6 +87,11 @@ class _LassoSolver(object):
     def __repr__(self):
         return self.name
 
+    @property
+    def nbytes(self):
+        '''Size in bytes of the arrays of the solver, without the problem'''
+        return sum(arrays_nbytes(self).values())
+
     def _init_algo(self):
         pass
 
@@ -84,12 +110,23 @@ class _LassoSolver(object):
         self.it += 1
 
         # Perform the computation for the iteration
+        timings = self.timings
         t_start_it = time()
         dz = self.p_update()
-        self.time += time() - t_start_it
+        t_end_it = time()
+        self.time += t_end_it - t_start_it
+        timings['p_update'] += t_end_it - t_start_it
         if self.logging and self.it >= self.next_log:
-            self.record(self.it, self.time, self.pb.cost())
+            self.record(self.it, self.time, self._cost())
+            t_log = time()
+            timings['logging'] += t_log - t_end_it
+            t_end_it = t_log
         stop = self._stop(dz)
+        timings['stop'] += time() - t_end_it
+        if self._on_iter and self.it % self.callback_every == 0:
+            for on_iter in self._on_iter:
+                if on_iter(self):
+                    self.finished = stop = True
         if stop:
             self.end()
         return stop
@@ -102,6 +139,11 @@ class _LassoSolver(object):
         self.pb -= self.alpha * grad
         return np.sum(abs(grad))
 
+    def _cost(self):
+        '''Cost of the current point, recorded in the cost curve
+        '''
+        return self.pb.cost()
+
     def _stop(self, dz):
         '''Implement stopping criterion
         '''
@@ -134,6 +176,7 @@ class _LassoSolver(object):
         self._init_algo()
         self.t_init = time() - self.t_start
         self.time += self.t_init
+        self.timings['init'] = self.t_init
         if self.logging:
             self.record(self.it, self.time, self.pb.cost())
 
@@ -145,12 +188,18 @@ class _LassoSolver(object):
         log.debug('{} - End - iteration {}, time {:.4}s'
                   .format(self, self.it, self.time))
         log.debug('Total time: {:.4}s'.format(self.runtime))
+        log.debug('Timings: {}'.format(', '.join(
+            '{} {:.4}s'.format(k, t) for k, t in self.timings.items())))
+        for on_stop in self._callbacks('on_stop'):
+            on_stop(self)
 
     def record(self, it, time, cost):
         self.cost_curve.iterations.append(it + 1)
         self.cost_curve.times.append(time)
         self.cost_curve.pobj.append(cost)
         self.next_log = self.log_rate(it + 1)
+        for on_log in self._callbacks('on_log'):
+            on_log(self, it, time, cost)
 
     def reset(self):
         # initiate loop variables
@@ -158,6 +207,14 @@ class _LassoSolver(object):
         self.time = 0
         self.finished = False
         self.cost_curve = CostCurve([], [], [])
+        self.timings = dict(init=0., p_update=0., logging=0., stop=0.)
+        self._on_iter = self._callbacks('on_iter')
+
+    def _callbacks(self, name):
+        '''Methods name of the callbacks which define it
+        '''
+        return [getattr(cb, name) for cb in self.callbacks
+                if hasattr(cb, name)]
 
     def fit(self, pb):
         self.reset()
@@ -1,5 +1,7 @@
 import numpy as np
 
+from .utils import arrays_nbytes
+
 
 class ImplementationError(Exception):
     """Implementation Error"""
@@ -36,6 +38,11 @@ class _Problem(object):
     def reset(self):
         self.pt = np.copy(self.x0)
 
+    @property
+    def nbytes(self):
+        '''Size in bytes of the arrays of the problem'''
+        return sum(arrays_nbytes(self).values())
+
     def __iadd__(self, update):
         self.pt += update
 
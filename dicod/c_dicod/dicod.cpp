@@ -12,6 +12,7 @@
 #include <iomanip>
 #include <stdlib.h>
 #include <math.h>
+#include <sys/resource.h>
 #include "convolution_fftw.h"
 #include "MPI_operations.h"
 using namespace FFTW_Convolution;
@@ -23,8 +24,46 @@ using namespace FFTW_Convolution;
 
 #define DEBUG true
 
-//Object handeling the computation
-DICOD::DICOD(Intercomm* _parentComm){
+typedef chrono::high_resolution_clock::time_point time_point;
+
+// Seconds elapsed since t
+static double elapsed(time_point t){
+	return chrono::duration_cast<chrono::duration<double>>(
+		chrono::high_resolution_clock::now() - t).count();
+}
+
+// Solve a batch of independent problems. Each worker pulls the next
+// problem from the root as soon as it is free and solves it alone.
+void solve_batch(Intercomm *parentComm){
+	double dz;
+	DICOD *dcp = new DICOD(parentComm, COMM_SELF, true);
+	while(dcp->next_task()){
+		dz = 100.;
+		while(!dcp->stop(dz))
+			dz = dcp->step();
+	}
+	parentComm->Barrier();
+	delete dcp;
+}
+
+// Solve the problem for a sequence of lmbd received from the root. Each
+// solve starts from the code and beta of the previous one.
+void solve_path(Intercomm *parentComm, Intracomm comm){
+	double dz;
+	DICOD *dcp = new DICOD(parentComm, comm);
+	do{
+		dz = 100.;
+		while(!dcp->stop(dz))
+			dz = dcp->step();
+		dcp->send_snapshot(-1);
+		dcp->end();
+	}while(dcp->next_lmbd());
+	delete dcp;
+}
+
+//Object handeling the computation, with the other workers in comm. In batch
+//mode, the worker only receives the dictionary at construction.
+DICOD::DICOD(Intercomm* _parentComm, Intracomm _comm, bool batch){
 	// Init time measurement for initialization
 	t_start = chrono::high_resolution_clock::now();
 
@@ -32,16 +71,22 @@ DICOD::DICOD(Intercomm* _parentComm){
 	cout << fixed << setprecision(2);
 
 	parentComm = _parentComm;
+	comm = _comm;
 
 	// Initiate arrays
 	alpha_k = NULL, DD=NULL, D=NULL;
+	blk_off = NULL, blk = NULL;
+	masked = NULL;
 	sig = NULL, beta = NULL, pt=NULL;
+	end_neigh = NULL;
 	runtime = 0;
 	max_probe = 0;
+	task_id = -1;
+	run_id = -1;
 
 	// Greetings
-	world_size = parentComm->Get_size();	// # processus
-	world_rank = parentComm->Get_rank();	// Rank in the processus pool
+	world_size = comm.Get_size();	// # processus
+	world_rank = comm.Get_rank();	// Rank in the processus pool
 	if(DEBUG){
 		// Get the machine this process is running on
 		char* procName = new char[MAX_PROCESSOR_NAME];
@@ -56,9 +101,12 @@ DICOD::DICOD(Intercomm* _parentComm){
 	}
 	int seed =  chrono::duration_cast<chrono::milliseconds>(
                    t_start.time_since_epoch()).count();
-	rng.seed(world_rank*seed);
+	rng.seed(parentComm->Get_rank()*seed);
 
-	this->receive_task();
+	if(batch)
+		this->receive_dictionary();
+	else
+		this->receive_task();
 }
 
 // Destructor, delete all arrays
@@ -70,10 +118,94 @@ DICOD::~DICOD(){
 	delete[] pt;
 	delete[] beta;
 	delete[] end_neigh;
+	delete[] blk_off;
+	delete[] blk;
+	delete[] masked;
 }
 
 // Handle initial communication
 void DICOD::receive_task(){
+	receive_dictionary();
+
+	L = T-S+1;   // Size of the code
+	L_proc = L / world_size + 1;
+	proc_off = world_rank*L_proc;
+	L_proc = min(proc_off+L_proc, L)-proc_off;
+	L_proc_S = L_proc+S-1;
+
+	// Receive the signal to process
+	delete[] sig;
+	sig = new double[L_proc_S*dim];
+	// cout << world_rank << "waiting for " << 100+world_rank 
+	// 	 << " size: " << L_proc_S*dim << endl;
+	parentComm->Recv(sig, L_proc_S*dim, DOUBLE, 0, 100+world_rank);
+	// cout << world_rank << "received" << endl;
+	confirm_array(parentComm, sig[0], sig[L_proc_S*dim-1]);
+
+	// Init algo and wait for everyone
+	time_point t_algo = chrono::high_resolution_clock::now();
+	_init_algo();
+	time_point t_barrier = chrono::high_resolution_clock::now();
+	stats[ST_T_INIT_ALGO] = elapsed(t_algo);
+	tracer.span(TR_INIT, t_algo, t_barrier);
+	parentComm->Barrier();
+
+	chrono::high_resolution_clock::time_point t_end = chrono::high_resolution_clock::now();
+	chrono::duration<double> time_span = chrono::duration_cast<chrono::duration<double>>(t_end - t_start);
+	t_init = time_span.count();
+	t_start = chrono::high_resolution_clock::now();
+	tracer.span(TR_BARRIER, t_barrier, t_start);
+}
+
+// Batch mode: send the result of the previous problem to the root and
+// receive the next one. Return false once the queue is empty.
+bool DICOD::next_task(){
+	int header[2] = {task_id, (int) iter};
+	parentComm->Send(header, 2, INT, 0, TAG_TASK_REQ);
+	if(task_id >= 0){
+		double stats[2] = {compute_cost(), runtime};
+		parentComm->Send(pt, K*L_proc, DOUBLE, 0, TAG_TASK_RESULT);
+		parentComm->Send(stats, 2, DOUBLE, 0, TAG_TASK_RESULT);
+	}
+
+	// Receive the problem id, its size, lmbd and its signal
+	parentComm->Recv(header, 2, INT, 0, TAG_TASK);
+	task_id = header[0];
+	if(task_id < 0)
+		return false;
+	T = header[1];
+	double* task = new double[dim*T+1];
+	parentComm->Recv(task, dim*T+1, DOUBLE, 0, TAG_TASK);
+	lmbd = task[0];
+
+	L = T-S+1;
+	L_proc = L, proc_off = 0;
+	L_proc_S = T;
+	delete[] sig;
+	sig = new double[L_proc_S*dim];
+	copy(task+1, task+dim*T+1, sig);
+	delete[] task;
+
+	t_start = chrono::high_resolution_clock::now();
+	_init_algo();
+	runtime = 0;
+	return true;
+}
+
+// Path mode: receive the next lmbd, or a negative value at the end of the
+// path, and restart the coordinate descent from the current code.
+bool DICOD::next_lmbd(){
+	parentComm->Bcast(&lmbd, 1, DOUBLE, 0);
+	if(lmbd < 0)
+		return false;
+	t_start = chrono::high_resolution_clock::now();
+	_reset_run();
+	runtime = 0;
+	return true;
+}
+
+// Receive the dictionary and the constants of the algorithm
+void DICOD::receive_dictionary(){
 
 	// Update dictionary constants
 	delete[] alpha_k;
@@ -101,35 +233,63 @@ void DICOD::receive_task(){
 	positive = ((int) constants[11] == 1);	// Use to only activate positive updates
 	algo =(int) constants[12];				// Coordinate choice algorihtm
 	patience = (int) constants[13];			// Max number of 0 updates in ALGO_RANDOM
+	packed_DD = ((int) constants[14] == 1);	// DD only holds the pairs k <= k'
+	DD_threshold = constants[15];			// Threshold for the blocks of DD
+	sparse_DD = (DD_threshold > 0);
+	beta_refresh = (int) constants[16];		// # iterations between refresh
+	run_id = (int) constants[17];			// Id of the control messages
+	n_masked = (int) constants[18];			// # of masked code intervals
+	trace = ((int) constants[19] == 1);		// Record the timeline of the solve
 	delete[] constants;
 
-	if(world_rank == 0 && (DEBUG || debug))
-		cout << "DEBUG - MPI_worker - Start with algorihtm : "
-			 << ((ALGO_GS==algo)?"Gauss-Southwell":"Random") << endl;
-
-	L = T-S+1;   // Size of the code
-	L_proc = L / world_size + 1;
-	proc_off = world_rank*L_proc;
-	L_proc = min(proc_off+L_proc, L)-proc_off;
-	L_proc_S = L_proc+S-1;
+	// Receive the significant blocks of DD, encoded as the K+1 offsets
+	// of the blocks of each atom followed by the triplets (k, start, end)
+	delete[] blk_off;
+	delete[] blk;
+	blk_off = NULL, blk = NULL;
+	if(sparse_DD){
+		int n_blk;
+		double* blocks = receive_bcast(parentComm, n_blk);
+		blk_off = new int[K+1];
+		blk = new int[n_blk-K-1];
+		for(int i=0; i < K+1; i++)
+			blk_off[i] = (int) blocks[i];
+		for(int i=K+1; i < n_blk; i++)
+			blk[i-K-1] = (int) blocks[i];
+		delete[] blocks;
 
-	// Receive the signal to process
-	delete[] sig;
-	sig = new double[L_proc_S*dim];
-	// cout << world_rank << "waiting for " << 100+world_rank 
-	// 	 << " size: " << L_proc_S*dim << endl;
-	parentComm->Recv(sig, L_proc_S*dim, DOUBLE, 0, 100+world_rank);
-	// cout << world_rank << "received" << endl;
-	confirm_array(parentComm, sig[0], sig[L_proc_S*dim-1]);
+		// Largest lag of DD[:, k0] skipped by the sparse updates
+		int stride;
+		double *DD_k;
+		vector<int> t_start, t_end;
+		DD_skipped.assign(K, 0);
+		for(int k0=0; k0 < K; k0++){
+			_get_blocks(k0, t_start, t_end);
+			for(int k=0; k < K; k++){
+				DD_k = _DD_row(k, k0, stride);
+				for(int tau=0; tau < 2*S-1; tau++)
+					if(tau < t_start[k] || tau >= t_end[k])
+						DD_skipped[k0] = max(DD_skipped[k0],
+											 fabs(DD_k[stride*tau]));
+			}
+		}
+	}
 
-	// Init algo and wait for everyone
-	_init_algo();
-	parentComm->Barrier();
+	// Receive the intervals [start, end) of the code which stay at 0, for
+	// instance between the signals packed in one problem
+	delete[] masked;
+	masked = NULL;
+	if(n_masked > 0){
+		double* intervals = receive_bcast(parentComm);
+		masked = new int[2*n_masked];
+		for(int i=0; i < 2*n_masked; i++)
+			masked[i] = (int) intervals[i];
+		delete[] intervals;
+	}
 
-	chrono::high_resolution_clock::time_point t_end = chrono::high_resolution_clock::now();
-	chrono::duration<double> time_span = chrono::duration_cast<chrono::duration<double>>(t_end - t_start);
-	t_init = time_span.count();
-	t_start = chrono::high_resolution_clock::now();
+	if(world_rank == 0 && (DEBUG || debug))
+		cout << "DEBUG - MPI_worker - Start with algorihtm : "
+			 << ((ALGO_GS==algo)?"Gauss-Southwell":"Random") << endl;
 }
 
 // Init the algo
@@ -166,33 +326,84 @@ void DICOD::_init_algo(){
 	clear_workspace(ws);
 	delete[] kernel;
 
+	// One residual per atom and center of the updates, from -(S-1) to
+	// L_proc+S-2 to hold the updates of the neighbors
+	dz_residual.assign(sparse_DD?K*(L_proc+2*S-2):0, 0);
+	beta_err.assign(sparse_DD?L_proc+2*S-2:0, 0);
+	dz_touched.clear();
+	_reset_run();
+
+}
+
+// Reset the state of the coordinate descent, but not the code and beta
+void DICOD::_reset_run(){
 	iter = 0;
 	pause = false;
 	go = true;
 	next_probe = 0;
 	up_probe = PROBE_UP_START;
+	max_probe = 0;
+	probe_result.clear();
+	probe_try.clear();
+	fill(stats, stats+N_STATS, 0);
+	tracer.reset(trace);
 	log_dz.clear();
-	log_i0.clear();
-	log_skip.clear();
-	log_time.clear();
+	if(logging)
+		update_log.reset(parentComm);
 
 	// Init the segment choosing and stoping
 	current_seg = 0, n_zero = 0, n_skip = 0;
 	seg_dz = 0.;
 	seg_size = ceil(L_proc * 1. / n_seg);
 
+	delete[] end_neigh;
 	end_neigh = new bool[2];
 	end_neigh[0] = (world_rank == 0);
 	end_neigh[1] = (world_rank == world_size-1);
+
+	// Intervals of the local code which can be updated, as [start, end)
+	active.clear();
+	mask_t.clear();
+	int t_active = 0, m_start, m_end;
+	if(n_masked > 0)
+		mask_t.assign(L_proc, 0);
+	for(int m = 0; m < n_masked; m++){
+		m_start = max(0, masked[2*m]-proc_off);
+		m_end = min(L_proc, masked[2*m+1]-proc_off);
+		if(m_start >= m_end)
+			continue;
+		fill(mask_t.begin()+m_start, mask_t.begin()+m_end, 1);
+		if(m_start > t_active){
+			active.push_back(t_active);
+			active.push_back(m_start);
+		}
+		t_active = m_end;
+	}
+	if(t_active < L_proc){
+		active.push_back(t_active);
+		active.push_back(L_proc);
+	}
 }
 
 // On step of the coordinate descent
 double DICOD::step(){
-	if(pause)
+	time_point t_step = chrono::high_resolution_clock::now();
+	if(pause){
 		this_thread::sleep_for(chrono::milliseconds(PAUSE_DELAY));
+		time_point t_wake = chrono::high_resolution_clock::now();
+		stats[ST_T_PAUSED] += elapsed(t_step);
+		tracer.span(TR_PAUSED, t_step, t_wake);
+		t_step = t_wake;
+	}
 
-	process_queue();
-	int i, k, t, k_off;
+	int n_msg = process_queue();
+	t_compute = chrono::high_resolution_clock::now();
+	stats[ST_T_QUEUE] += chrono::duration_cast<chrono::duration<double>>(
+		t_compute - t_step).count();
+	if(n_msg > 0)
+		tracer.span(TR_QUEUE, t_step, t_compute);
+	process_ctrl();
+	int i, k, t, k_off, a, t_start_a, t_end_a;
 	int k0 = 1, t0 = -1;
 	double ak, dz = 0, adz = tol;
 	double beta_i, sign_beta_i;
@@ -220,18 +431,22 @@ double DICOD::step(){
 		for(k = 0; k < K; k++){
 			ak = alpha_k[k];
 			k_off = k*L_proc;
-			for (t=seg_start; t < seg_end; t++){
-				i = k_off+t;
-				beta_i = -beta[i];
-				sign_beta_i = (beta_i >= 0)?1:-1;
-				if(positive)
-					sign_beta_i = (beta_i >= 0)?1:0;
-				beta_i = max(0., fabs(beta_i)-lmbd) * sign_beta_i/ak;
-				if(adz < fabs(beta_i-pt[i])){
-					k0 = k;
-					t0 = t;
-					dz = pt[i]-beta_i;
-					adz = fabs(dz);
+			for(a = 0; a < (int) active.size(); a += 2){
+				t_start_a = max(seg_start, active[a]);
+				t_end_a = min(seg_end, active[a+1]);
+				for (t=t_start_a; t < t_end_a; t++){
+					i = k_off+t;
+					beta_i = -beta[i];
+					sign_beta_i = (beta_i >= 0)?1:-1;
+					if(positive)
+						sign_beta_i = (beta_i >= 0)?1:0;
+					beta_i = max(0., fabs(beta_i)-lmbd) * sign_beta_i/ak;
+					if(adz < fabs(beta_i-pt[i])){
+						k0 = k;
+						t0 = t;
+						dz = pt[i]-beta_i;
+						adz = fabs(dz);
+					}
 				}
 			}
 		}
@@ -253,7 +468,7 @@ double DICOD::step(){
 		beta_i = max(0., fabs(beta_i)-lmbd)*sign_beta_i/ak;
 
 		// If the update is not null
-		if(fabs(beta_i-pt[i]) > tol){
+		if(fabs(beta_i-pt[i]) > tol && (mask_t.empty() || !mask_t[t])){
 			k0 = k;
 			t0 = t;
 			dz = pt[i] - beta_i;
@@ -262,8 +477,10 @@ double DICOD::step(){
 	}
 
 	// Increase n_zero
-	if(adz <= tol)
+	if(adz <= tol){
 		n_zero += 1;
+		stats[ST_ZERO_STEPS]++;
+	}
 	else
 		n_zero = 0;
 
@@ -275,6 +492,24 @@ double DICOD::step(){
 		return _return_dz(0.);
 	}
 
+	// The lags of DD skipped since the last refresh bound the error on
+	// beta[k0, t0]. Compute the update again with the exact beta when they
+	// could change more than half of it.
+	if(sparse_DD && !dz_touched.empty()){
+		double err = 0;
+		for(t=t0; t < t0+2*S-1; t++)
+			err += beta_err[t];
+		if(err > alpha_k[k0]*adz/2){
+			_refresh_beta();
+			i = k0*L_proc+t0;
+			beta_i = -beta[i];
+			sign_beta_i = (beta_i >= 0)?1:-1;
+			if(positive)
+				sign_beta_i = (beta_i >= 0)?1:0;
+			dz = pt[i] - max(0., fabs(beta_i)-lmbd)*sign_beta_i/alpha_k[k0];
+		}
+	}
+
 	// Increase iteration count
 	iter += 1;
 
@@ -283,18 +518,21 @@ double DICOD::step(){
 		chrono::duration<double> time_span = chrono::duration_cast<chrono::duration<double>>(t_end - t_start);
 		double seconds = time_span.count();
 
-		log_time.push_back(seconds);
-		log_dz.push_back(-dz);
-		log_skip.push_back(n_skip);
-		log_i0.push_back((double) k0*L+proc_off+t0);
+		update_log.push((int64_t) k0*L+proc_off+t0, seconds, -dz, n_skip);
 	}
-	else if (n_seg > 1){
+	if(n_seg > 1){
+		// Only the last updates are used to stop the segmented algorithm
 		log_dz.push_back(-dz);
+		if(log_dz.size() > (size_t) 2*n_seg)
+			log_dz.pop_front();
 	}
 
 	// Else update the point
 	pt[k0*L_proc+t0] -= dz;
 	_update_beta(dz, k0, t0);
+	// beta is also refreshed before pausing, see stop
+	if(sparse_DD && iter % beta_refresh == 0)
+		_refresh_beta();
 
 	// Reset skip counter
 	n_skip = 0;
@@ -305,6 +543,8 @@ double DICOD::step(){
 // Handle the computation to avoid ending computation before convergence in
 // Random algorithm and in segmented iterations
 double DICOD::_return_dz(double dz){
+	if(tracer.on())
+		tracer.span(TR_COMPUTE, t_compute, chrono::high_resolution_clock::now());
 
 	if(n_seg > 1){
 		// For segmented algorithm, return the max of dz
@@ -333,10 +573,8 @@ double DICOD::_return_dz(double dz){
 void DICOD::_update_beta(double dz, int k0, int t0){
 	if(dz == 0)
 		return;
-	//Loop variables
-	int k, tau;
 	//Offset variables
-	int beta_off, DD_off, s_DD= 2*S-1;
+	int s_DD= 2*S-1;
 	int DD_start, cod_start, ll;
 	//Hold previous beta for the current indice
 	int i0 = k0*L_proc+t0;
@@ -348,20 +586,114 @@ void DICOD::_update_beta(double dz, int k0, int t0){
 	ll = min(L_proc, t0+S) - cod_start;
 
 	// Update local beta coefficients
-	beta_off = cod_start;
-	DD_off = k0*s_DD + DD_start;
-	for(k=0; k < K; k++){
-		for(tau=0; tau < ll; tau++)
-			beta[beta_off+tau] -= DD[DD_off+tau]*dz;
-		beta_off += L_proc;
-		DD_off += K*s_DD;
-	}
+	_apply_DD(dz, k0, cod_start, DD_start, ll);
 	beta[i0] = p_beta_i0;
 	if (DD_start > 0 && world_rank > 0)
 		send_update_msg(world_rank-1, dz, k0, -DD_start, 0, DD_start);
 	else if (t0 > L_proc-S && world_rank < world_size-1)
 		send_update_msg(world_rank+1, dz, k0, 0, ll, s_DD-ll);
 }
+// Return a pointer on the lags of DD[k, k0], to be read with the given
+// stride. With the packed storage, only the pairs k <= k0 are stored and
+// DD[k, k0](t) = DD[k0, k](-t) is read backward.
+double* DICOD::_DD_row(int k, int k0, int &stride){
+	int s_DD = 2*S-1;
+	stride = 1;
+	if(!packed_DD)
+		return DD + (k*K+k0)*s_DD;
+	if(k <= k0)
+		return DD + (k*(2*K-k+1)/2+k0-k)*s_DD;
+	stride = -1;
+	return DD + (k0*(2*K-k0+1)/2+k-k0+1)*s_DD - 1;
+}
+
+// Update beta[:, cod_start:cod_start+ll] with the lags
+// DD_start:DD_start+ll of DD[:, k0]. With sparse_DD, only the significant
+// blocks of DD sent by the root are used and dz is kept in dz_residual
+// until the next refresh.
+void DICOD::_apply_DD(double dz, int k0, int cod_start, int DD_start,
+					  int ll){
+	int b, k, tau, t_end, stride;
+	int DD_end = DD_start+ll;
+	double *DD_k, *beta_k;
+	if(!sparse_DD){
+		for(k=0; k < K; k++){
+			DD_k = _DD_row(k, k0, stride);
+			beta_k = beta + k*L_proc + cod_start - DD_start;
+			for(tau=DD_start; tau < DD_end; tau++)
+				beta_k[tau] -= DD_k[stride*tau]*dz;
+		}
+		return;
+	}
+	for(b=blk_off[k0]; b < blk_off[k0+1]; b++){
+		k = blk[3*b];
+		DD_k = _DD_row(k, k0, stride);
+		beta_k = beta + k*L_proc + cod_start - DD_start;
+		t_end = min(DD_end, blk[3*b+2]);
+		for(tau=max(DD_start, blk[3*b+1]); tau < t_end; tau++)
+			beta_k[tau] -= DD_k[stride*tau]*dz;
+	}
+	// The updates are indexed by their center cod_start-DD_start+S-1
+	int c = cod_start - DD_start + 2*S-2;
+	int i = k0*(L_proc+2*S-2) + c;
+	if(dz_residual[i] == 0)
+		dz_touched.push_back(i);
+	dz_residual[i] += dz;
+	beta_err[c] += DD_skipped[k0]*fabs(dz);
+}
+
+// Set [t_start[k], t_end[k]) to the block of DD[k, k0] sent by the root,
+// empty when the atoms k and k0 are incoherent
+void DICOD::_get_blocks(int k0, vector<int> &t_start, vector<int> &t_end){
+	t_start.assign(K, 0);
+	t_end.assign(K, 0);
+	for(int b=blk_off[k0]; b < blk_off[k0+1]; b++){
+		t_start[blk[3*b]] = blk[3*b+1];
+		t_end[blk[3*b]] = blk[3*b+2];
+	}
+}
+
+// Apply the updates skipped by the sparse blocks of DD so beta is exact.
+// Return true if beta has changed.
+bool DICOD::_refresh_beta(){
+	if(dz_touched.empty())
+		return false;
+	int i, k, k0 = -1, t, tau, stride, DD_start, cod_start, DD_end;
+	int n_res = L_proc+2*S-2;
+	double dz, *DD_k, *beta_k;
+	vector<int> t_start, t_end;
+	// Sort the updates by atom to look up its blocks once
+	sort(dz_touched.begin(), dz_touched.end());
+	for(vector<int>::iterator it = dz_touched.begin();
+		it != dz_touched.end(); it++){
+		i = *it;
+		dz = dz_residual[i];
+		beta_err[i % n_res] = 0;
+		if(dz == 0)
+			continue;
+		dz_residual[i] = 0;
+		if(i / n_res != k0){
+			k0 = i / n_res;
+			_get_blocks(k0, t_start, t_end);
+		}
+		// Apply the lags of DD[:, k0] outside of the blocks
+		t = i % n_res - S+1;
+		cod_start = max(0, t-S+1);
+		DD_start = cod_start - t + S-1;
+		DD_end = DD_start + min(L_proc, t+S) - cod_start;
+		for(k=0; k < K; k++){
+			DD_k = _DD_row(k, k0, stride);
+			beta_k = beta + k*L_proc + cod_start - DD_start;
+			for(tau=DD_start; tau < min(DD_end, t_start[k]); tau++)
+				beta_k[tau] -= DD_k[stride*tau]*dz;
+			for(tau=max(DD_start, t_end[k]); tau < DD_end; tau++)
+				beta_k[tau] -= DD_k[stride*tau]*dz;
+		}
+	}
+	dz_touched.clear();
+	return true;
+}
+
 void DICOD::send_update_msg(int dest, double dz, int k0,
 							int cod_start, int DD_start, int ll)
 {
@@ -372,30 +704,33 @@ void DICOD::send_update_msg(int dest, double dz, int k0,
 	msg[3] = (double) cod_start;
 	msg[4] = (double) DD_start;
 	msg[5] = (double) ll;
-	COMM_WORLD.Isend(msg, HEADER, DOUBLE,
+	comm.Isend(msg, HEADER, DOUBLE,
 					 dest, TAG_UP);
 	messages.push_back(msg);
+	stats[(dest < world_rank)?ST_UP_SENT_LEFT:ST_UP_SENT_RIGHT]++;
+	stats[ST_BYTES_SENT] += HEADER*sizeof(double);
 }
 
 double DICOD::_check_convergence(){
 
-	int k, t, i = 0;
+	int k, t, i, a;
 	int sign_b;
 	double b, ak, dz, adz = 0;
 	//Find argmax of |z_i - z'_i|
-	for(k = 0; k < K; k++){
+	for(k = 0; k < K && adz <= tol; k++){
 		ak = alpha_k[k];
-		for (t=0; t < L_proc; t++){
-			b = -beta[i];
-			sign_b = (b >= 0)?1:-1;
-			if(positive)
-				sign_b = (b >= 0)?1:0;
-			dz = fabs(max(0., fabs(b) - lmbd)*sign_b/ak - pt[i]);
-			adz = max(adz, dz);
-			if (adz > tol)
-				break;
-			i ++;
-		}
+		for(a = 0; a < (int) active.size() && adz <= tol; a += 2)
+			for (t=active[a]; t < active[a+1]; t++){
+				i = k*L_proc+t;
+				b = -beta[i];
+				sign_b = (b >= 0)?1:-1;
+				if(positive)
+					sign_b = (b >= 0)?1:0;
+				dz = fabs(max(0., fabs(b) - lmbd)*sign_b/ak - pt[i]);
+				adz = max(adz, dz);
+				if (adz > tol)
+					break;
+			}
 	}
 	if (adz > tol)
 		n_zero = 0;
@@ -410,7 +745,10 @@ bool DICOD::stop(double dz){
 	_stop |= (iter >= max_iter);
 	_stop |= (seconds >= timeout);
 	if(!go){
-		COMM_WORLD.Barrier();
+		if(runtime == 0)
+			runtime = seconds;
+		comm.Barrier();
+		tracer.span(TR_BARRIER, t_end, chrono::high_resolution_clock::now());
 		if(world_rank == 0 && (debug || DEBUG))
 			cout << "\nINFO - MPI_worker - Reach optimal solution in "
 				 << seconds << endl;
@@ -420,6 +758,10 @@ bool DICOD::stop(double dz){
 		cout << "DEBUG - MPI_worker - Reach timeout" << endl;
 	if((debug || DEBUG) && iter >= max_iter && world_rank == 0)
 		cout << "DEBUG - MPI_worker - Reach max iteration" << endl;
+	// The updates with the sparse DD were computed with an approximate
+	// beta, check them again with the exact one before pausing
+	if(fabs(dz) <= tol && sparse_DD && _refresh_beta())
+		dz = 2*tol;
 	if(fabs(dz) <= tol){
 		// If just enter pause, probe other for paused
 		if(world_rank == 0){
@@ -437,6 +779,8 @@ bool DICOD::stop(double dz){
 			}
 			if(next_probe <= seconds){
 				Ibroadcast(REQ_PROBE);
+				stats[ST_PROBES]++;
+				tracer.instant(TR_PROBE);
 				up_probe = max(up_probe*1.2, PROBE_MAX);
 				next_probe = seconds + up_probe;
 			}
@@ -449,7 +793,8 @@ bool DICOD::stop(double dz){
 	if(_stop){
 		if(runtime == 0)
 			runtime = seconds;
-		COMM_WORLD.Barrier();
+		comm.Barrier();
+		tracer.span(TR_BARRIER, t_end, chrono::high_resolution_clock::now());
 	}
 	if(world_rank == 0 && (debug || DEBUG) &&  (iter % 1000 == 0 || pause)){
 		double progress = max(iter * 100.0 / max_iter, seconds * 100.0 / timeout);
@@ -461,31 +806,43 @@ bool DICOD::stop(double dz){
 }
 
 void DICOD::reduce_pt(){
-	long int i;
+	time_point t_reduce = chrono::high_resolution_clock::now();
 	double cost = compute_cost();
-	parentComm->Barrier();
+	time_point t_barrier = chrono::high_resolution_clock::now();
+	stats[ST_T_COST] = elapsed(t_reduce);
+	tracer.span(TR_COST, t_reduce, t_barrier);
+
+	// Send the end of the log, received by the root while it waits
+	if(logging)
+		update_log.finish();
+
+	// Signal the end of the computation to the root and answer its control
+	// messages until it stops sending them, with a second barrier
+	MPI_Request req[2];
+	int done = 0;
+	MPI_Ibarrier((MPI_Comm) *parentComm, &req[0]);
+	MPI_Ibarrier((MPI_Comm) *parentComm, &req[1]);
+	while(!done){
+		process_ctrl();
+		MPI_Testall(2, req, &done, MPI_STATUSES_IGNORE);
+	}
+	tracer.span(TR_BARRIER, t_barrier, chrono::high_resolution_clock::now());
 	parentComm->Send(pt, L_proc*K, DOUBLE, 0, 200+world_rank);
 	parentComm->Gather(&cost, 1, DOUBLE, NULL, 0, DOUBLE, 0);
 	parentComm->Gather(&iter, 1, INT, NULL, 0, INT, 0);
 	parentComm->Gather(&runtime, 1, DOUBLE, NULL, 0, DOUBLE, 0);
 	parentComm->Gather(&t_init, 1, DOUBLE, NULL, 0, DOUBLE, 0);
+	stats[ST_UPDATES] = iter;
+	stats[ST_T_REDUCE] = elapsed(t_reduce);
+	struct rusage usage;
+	getrusage(RUSAGE_SELF, &usage);
+	stats[ST_MAX_RSS] = usage.ru_maxrss * 1024.;	// in kilobytes on Linux
+	parentComm->Gatherv(stats, N_STATS, DOUBLE, NULL, NULL, NULL, DOUBLE, 0);
+	if(trace)
+		tracer.send(parentComm, t_start);
 
-	if (logging){
-		parentComm->Barrier();
-		double* _log = new double[4*iter];
-		list<double>::iterator it_dz, it_time, it_i0, it_skip;
-		for(i=0, it_dz=log_dz.begin(), it_time=log_time.begin(),
-			it_i0=log_i0.begin(), it_skip=log_skip.begin();
-			it_i0 != log_i0.end();
-			i++, it_dz++, it_i0++, it_time++, it_skip++){
-			_log[4*i] = *it_i0;
-			_log[4*i+1] = *it_time;
-			_log[4*i+2] = *it_dz;
-			_log[4*i+3] = *it_skip;
-		}
-		parentComm->Send(_log, 4*iter, DOUBLE, 0, 300+world_rank);
-		delete[] _log;
-	}
+	if (logging)
+		update_log.wait();
 }
 
 double DICOD::compute_cost(){
@@ -508,10 +865,10 @@ double DICOD::compute_cost(){
 		}
 	if(world_rank > 0){
 
-		COMM_WORLD.Isend(msg, dim*(S-1), DOUBLE, world_rank-1, TAG_MSG_COST);
+		comm.Isend(msg, dim*(S-1), DOUBLE, world_rank-1, TAG_MSG_COST);
 	}
 	if(world_rank < world_size-1){
-		COMM_WORLD.Recv(msg_in, dim*(S-1), DOUBLE, world_rank+1, TAG_MSG_COST);
+		comm.Recv(msg_in, dim*(S-1), DOUBLE, world_rank+1, TAG_MSG_COST);
 		for(d=0; d< dim; d++)
 			for(s=0; s < S-1; s++)
 				rec[d*L_proc_S + L_proc + s] += msg_in[d * (S -1) + s];
@@ -540,7 +897,7 @@ double DICOD::compute_cost(){
 	while(its != pt+K*L_proc)
 		z_l1 += fabs(*its++);
 	cost = Er + lmbd*z_l1;
-	COMM_WORLD.Barrier();
+	comm.Barrier();
 	delete[] msg;
 	delete[] rec;
 	return cost;
@@ -559,21 +916,26 @@ void DICOD::end(){
 	int size_msg, src, tag;
 	double* msg;
 	while(!(end_neigh[0] && end_neigh[1])){
-		COMM_WORLD.Probe(ANY_SOURCE, ANY_TAG, s);
+		comm.Probe(ANY_SOURCE, ANY_TAG, s);
 		size_msg = s.Get_count(DOUBLE);
 		src = s.Get_source();
 		tag = s.Get_tag();
 		msg = new double[size_msg];
-		COMM_WORLD.Recv(msg, size_msg, DOUBLE, src, tag);
+		comm.Recv(msg, size_msg, DOUBLE, src, tag);
 		if(msg[0] == STOP && msg[1] >= 0)
 			end_neigh[(int) msg[1]] = true;
-		if((debug || DEBUG) && msg[0] == UP && !go)
-			cout << "WARNING - MPI_worker" << world_rank
-				 <<" - Missed wake up" << endl;
+		if(msg[0] == UP){
+			if((debug || DEBUG) && !go)
+				cout << "WARNING - MPI_worker" << world_rank
+					 <<" - Missed wake up" << endl;
+			// Keep beta consistent with the code of the neighbors, for
+			// the next solve of a path
+			_recv_update(msg, src);
+		}
 		delete[] msg;
 	}
 
-	COMM_WORLD.Barrier();
+	comm.Barrier();
 	while(!messages.empty()){
 		delete[] messages.front();
 		messages.pop_front();
@@ -583,22 +945,20 @@ void DICOD::end(){
 	parentComm->Barrier();
 }
 
-// Process the message queue
-void DICOD::process_queue(){
+// Process the message queue and return the number of messages
+int DICOD::process_queue(){
 	Status s;
 	int size_msg, src, tag;
 	double* msg;
-	int ll, k, tau, i_try, l_msg;
-	int DD_off, beta_off, k0, DD_start, cod_start, s_DD;
+	int i_try, l_msg;
 	int compt = 0, probe_val;
-	double dz;
-	while(COMM_WORLD.Iprobe(ANY_SOURCE, ANY_TAG, s) && (compt < 10000)){
+	while(comm.Iprobe(ANY_SOURCE, ANY_TAG, s) && (compt < 10000)){
 		compt += 1;
 		size_msg = s.Get_count(DOUBLE);
 		src = s.Get_source();
 		tag = s.Get_tag();
 		msg = new double[size_msg];
-		COMM_WORLD.Recv(msg, size_msg, DOUBLE, src, tag);
+		comm.Recv(msg, size_msg, DOUBLE, src, tag);
 		switch((int) msg[0]){
 			case STOP:
 				go = false;
@@ -619,19 +979,9 @@ void DICOD::process_queue(){
 				}
 				break;
 			case UP:
-				dz = msg[1];
-				k0 = (int) msg[2];
-				cod_start = (L_proc + (int) msg[3])%L_proc;
-				DD_start = (int) msg[4];
-				ll = (int) msg[5];
-				s_DD = 2*S-1;
-
-				for(k=0; k<K; k++){
-					beta_off = k*L_proc + cod_start;
-					DD_off = k*K*s_DD + k0*s_DD + DD_start;
-					for(tau=0; tau< ll; tau ++)
-						beta[beta_off+tau] -= dz*DD[DD_off+tau];
-				}
+				_recv_update(msg, src);
+				if(pause)
+					tracer.instant(TR_WAKE);
 				pause = false;
 				runtime = 0;
 				n_zero = 0;
@@ -639,7 +989,72 @@ void DICOD::process_queue(){
 		}
 		delete[] msg;
 	}
+	return compt;
 }
+// Apply to beta the update of a neighbor
+void DICOD::_recv_update(double* msg, int src){
+	double dz = msg[1];
+	int k0 = (int) msg[2];
+	int cod_start = (L_proc + (int) msg[3])%L_proc;
+	int DD_start = (int) msg[4];
+	int ll = (int) msg[5];
+	_apply_DD(dz, k0, cod_start, DD_start, ll);
+	stats[(src < world_rank)?ST_UP_RECV_LEFT:ST_UP_RECV_RIGHT]++;
+	stats[ST_BETA_NEIGH] += K*ll;
+}
+
+// Process the control messages of the root for the current run. The
+// messages left from a previous run are dropped.
+void DICOD::process_ctrl(){
+	Status s;
+	int msg[2];
+	while(parentComm->Iprobe(0, TAG_CTRL, s)){
+		parentComm->Recv(msg, 2, INT, 0, TAG_CTRL);
+		if(msg[1] != run_id)
+			continue;
+		switch(msg[0]){
+			case CTRL_INTERRUPT:
+				if(world_rank == 0 && (debug || DEBUG))
+					cout << "\nDEBUG - MPI_worker - Interrupted by the root"
+						 << endl;
+				go = false;
+				break;
+			case CTRL_SNAPSHOT:
+				send_snapshot(-1);
+				break;
+		}
+	}
+}
+
+// Send the current code to the root, as the indices and values of its non
+// zero coefficients, after the iterations and the time spent in the solve.
+// If seconds < 0, send the runtime of the solve, or the elapsed time if it
+// is still running.
+void DICOD::send_snapshot(double seconds){
+	int i, k, t, nnz = 0;
+	for(i=0; i < K*L_proc; i++)
+		nnz += (pt[i] != 0);
+	double* msg = new double[3+2*nnz];
+	chrono::duration<double> time_span = chrono::duration_cast<
+		chrono::duration<double>>(chrono::high_resolution_clock::now() -
+								  t_start);
+	if(seconds < 0)
+		seconds = (runtime > 0)?runtime:time_span.count();
+	msg[0] = iter;
+	msg[1] = seconds;
+	msg[2] = nnz;
+	i = 3;
+	for(k=0; k < K; k++)
+		for(t=0; t < L_proc; t++)
+			if(pt[k*L_proc+t] != 0){
+				msg[i] = k*L+proc_off+t;
+				msg[i+nnz] = pt[k*L_proc+t];
+				i++;
+			}
+	parentComm->Send(msg, 3+2*nnz, DOUBLE, 0, TAG_SNAPSHOT);
+	delete[] msg;
+}
+
 void DICOD::Ibroadcast(int msg_t){
 	int sz = 2;
 	double* msg = new double[sz];
@@ -655,8 +1070,9 @@ void DICOD::Ibroadcast(int msg_t){
 			msg[1] = i_try;
 	}
 	for(int i = 1; i < world_size; i ++)
-		COMM_WORLD.Send(msg, sz, DOUBLE, i, 3);
+		comm.Send(msg, sz, DOUBLE, i, 3);
 	messages.push_back(msg);
+	stats[ST_BYTES_SENT] += (world_size-1)*sz*sizeof(double);
 }
 void DICOD::probe_reply(){
 	int l_msg = probe_try.size()+2;
@@ -668,8 +1084,10 @@ void DICOD::probe_reply(){
 	for(it=probe_try.begin(), i=0;
 		it != probe_try.end(); it++, i++)
 		msg[i+2] = *it;
-	COMM_WORLD.Isend(msg, l_msg, DOUBLE, 0, 4);
+	comm.Isend(msg, l_msg, DOUBLE, 0, 4);
 	messages.push_back(msg);
+	stats[ST_BYTES_SENT] += l_msg*sizeof(double);
+	tracer.instant(TR_PROBE);
 	probe_try.clear();
 }
 void DICOD::send_msg(int msg_type, int arg, bool up){
@@ -679,9 +1097,10 @@ void DICOD::send_msg(int msg_type, int arg, bool up){
 	msg[1] = (double) arg;
 	int dest = world_rank+(2*up-1);
 	if(dest > -1 && dest < world_size){
-		COMM_WORLD.Isend(msg, sz, DOUBLE,
+		comm.Isend(msg, sz, DOUBLE,
 						 dest, 34+(2*up-1));
 		messages.push_back(msg);
+		stats[ST_BYTES_SENT] += sz*sizeof(double);
 	}
 	else{
 		cout << "ERROR - MPI_worker" << world_rank
@@ -5,10 +5,14 @@
 #include <mpi.h>
 #include <time.h>
 #include <unordered_map>
+#include <algorithm>
 #include <list>
+#include <vector>
 #include <chrono>
 #include <thread>
 #include <random>
+#include "update_log.h"
+#include "trace.h"
 
 //Define messages info
 #define STOP 0
@@ -27,6 +31,35 @@
 #define HEADER 7
 #define TAG_UP 2742
 
+// Batch mode message tags
+#define TAG_TASK 4300
+#define TAG_TASK_REQ 4301
+#define TAG_TASK_RESULT 4302
+
+// Control messages of the root during a solve
+#define TAG_CTRL 4303
+#define TAG_SNAPSHOT 4304
+#define CTRL_INTERRUPT 0
+#define CTRL_SNAPSHOT 1
+
+// Performance counters of a solve, gathered by the root, see dicod.py
+#define N_STATS 15
+#define ST_UPDATES 0			// Updates applied
+#define ST_ZERO_STEPS 1			// Steps without update
+#define ST_UP_SENT_LEFT 2		// UP messages sent to each neighbor
+#define ST_UP_SENT_RIGHT 3
+#define ST_UP_RECV_LEFT 4		// UP messages received from each neighbor
+#define ST_UP_RECV_RIGHT 5
+#define ST_BYTES_SENT 6			// Bytes sent to the other workers
+#define ST_BETA_NEIGH 7			// Coefficients of beta updated by neighbors
+#define ST_PROBES 8				// Probe rounds for the end of the solve
+#define ST_T_QUEUE 9			// Time spent in process_queue
+#define ST_T_PAUSED 10			// Time spent paused
+#define ST_T_INIT_ALGO 11		// Time spent in _init_algo
+#define ST_T_COST 12			// Time spent in compute_cost
+#define ST_T_REDUCE 13			// Time spent in reduce_pt
+#define ST_MAX_RSS 14			// Peak resident memory of the worker in bytes
+
 using namespace MPI;
 using namespace std;
 
@@ -35,7 +68,8 @@ class DICOD
 {
 	public:
 		//Construction and destruction
-		DICOD(Intercomm* _parentComm);
+		DICOD(Intercomm* _parentComm, Intracomm _comm=COMM_WORLD,
+			  bool batch=false);
 		~DICOD();
 
 		//Manage the process
@@ -48,10 +82,15 @@ class DICOD
 		const char* is_paused(){ return (pause)?"paused":"not paused";}
 		void reduce_pt();
 		void receive_task();
+		void receive_dictionary();
+		bool next_task();
+		bool next_lmbd();
+		void send_snapshot(double seconds);
 
 	private:
 		//Private Attributes
 		Intercomm *parentComm;
+		Intracomm comm;
 
 		double *sig, *beta, *pt; // Signal, beta
 		double *alpha_k, *DD, *D;
@@ -61,14 +100,26 @@ class DICOD
 		int L_proc, L_proc_S, proc_off;
 		int T, dim, S, K, L;
 		int world_size, world_rank;
-		int algo, patience, max_probe;
+		int algo, patience, max_probe, task_id, run_id;
 		double next_probe, up_probe, runtime, t_init;
 		chrono::high_resolution_clock::time_point t_start;
-		bool pause, go, debug, logging, positive;
+		bool pause, go, debug, logging, positive, packed_DD, trace;
+		bool sparse_DD;
+		double DD_threshold;
+		int beta_refresh, *blk_off, *blk;
+		int n_masked, *masked;
+		vector<int> active;
+		vector<char> mask_t;
+		vector<double> dz_residual, beta_err, DD_skipped;
+		vector<int> dz_touched;
 		list<double*> messages;
 		unordered_map<int, int> probe_result;
 		list<int> probe_try;
-		list<double> log_dz, log_time, log_i0, log_skip;
+		list<double> log_dz;
+		UpdateLog update_log;
+		double stats[N_STATS];
+		Tracer tracer;
+		time_point t_compute;
 		mt19937 rng;
 
 		// Segment routine variables
@@ -85,7 +136,15 @@ class DICOD
 		double _check_convergence();
 		void _init_algo();
 		void _update_beta(double dz, int k, int t);
-		void process_queue();
+		double* _DD_row(int k, int k0, int &stride);
+		void _apply_DD(double dz, int k0, int cod_start, int DD_start,
+					   int ll);
+		void _get_blocks(int k0, vector<int> &t_start, vector<int> &t_end);
+		bool _refresh_beta();
+		int process_queue();
+		void _recv_update(double* msg, int src);
+		void process_ctrl();
+		void _reset_run();
 		void send_update_msg(int dest, double dz, int k0, int cod_start, int DD_start, int ll);
 		void send_msg(int msg_type, int arg, bool up);
 		void Ibroadcast(int msg_t);
@@ -93,6 +152,9 @@ class DICOD
 
 };
 
+void solve_batch(Intercomm *parentComm);
+void solve_path(Intercomm *parentComm, Intracomm comm);
+
 /*
 void solve_DICOD(Intercomm *parentComm, int& rank, bool& debug){
 	double dz = 100.;
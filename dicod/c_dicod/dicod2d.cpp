@@ -26,9 +26,9 @@ using namespace FFTW_Convolution;
 
 
 // solve a problem in 2D with DICOD algorithm
-void solve_DICOD(Intercomm *parentComm){
+void solve_DICOD(Intercomm *parentComm, Intracomm comm){
 	double dz = 100.;
-	DICOD2D *dcp = new DICOD2D(parentComm);
+	DICOD2D *dcp = new DICOD2D(parentComm, comm);
 	dcp->start();
 	while(!dcp->stop(dz))
 		dz = dcp->step();
@@ -40,13 +40,14 @@ void solve_DICOD(Intercomm *parentComm){
 }
 
 //Object to handle computations
-DICOD2D::DICOD2D(Intercomm* _parentComm){
+DICOD2D::DICOD2D(Intercomm* _parentComm, Intracomm _comm){
 	int plen;
 
 	// init time measurement for initialization
 	t_start = chrono::high_resolution_clock::now();
 
 	parentComm = _parentComm;
+	comm = _comm;
 
 	// initiate arrays
 	alpha_k = NULL, DD=NULL, D=NULL;
@@ -56,8 +57,8 @@ DICOD2D::DICOD2D(Intercomm* _parentComm){
 	Get_processor_name(proc_name, plen);
 
 	// greetings
-	world_size = parentComm->Get_size();	// # processus
-	world_rank = parentComm->Get_rank();	// rank in the processus pool
+	world_size = comm.Get_size();	// # processus
+	world_rank = comm.Get_rank();	// rank in the processus pool
 	if(DEBUG){
 		// get the machine this process is running on
 		cout << "DEBUG:job" << world_rank << " - Start processor "
@@ -88,7 +89,11 @@ void DICOD2D::start(){
 
 
 	// init algo and wait for everyone
+	tracer.reset(trace);
+	time_point t_algo = chrono::high_resolution_clock::now();
 	_init_algo();
+	time_point t_barrier = chrono::high_resolution_clock::now();
+	tracer.span(TR_INIT, t_algo, t_barrier);
 	parentComm->Barrier();
 
 	// get a timer to evaluate the performances
@@ -96,6 +101,7 @@ void DICOD2D::start(){
 	if((debug || DEBUG) && world_rank == 0)
 		cout << "DEBUG:jobs - End initialization in " << t_init << endl;
 	t_start = chrono::high_resolution_clock::now();
+	tracer.span(TR_BARRIER, t_barrier, t_start);
 }
 
 // handle initial communication
@@ -139,6 +145,8 @@ void DICOD2D::_rcv_task(){
 	positive = ((int) constants[14] == 1);	// use to only activate positive updates
 	algo =(int) constants[15];				// coordinate choice algorihtm
 	patience = (int) constants[16];			// max number of 0 updates in ALGO_RANDOM
+	packed_DD = ((int) constants[17] == 1);	// DD only holds the pairs k <= k'
+	trace = ((int) constants[18] == 1);		// record the timeline of the solve
 	delete[] constants;
 
 	if(algo == ALGO_GS)
@@ -225,9 +233,8 @@ void DICOD2D::_init_algo(){
 	up_count = 0;
 	next_probe = 0;
 	up_probe = PROBE_MSG_UP_START;
-	log_dz.clear();
-	log_i0.clear();
-	log_t.clear();
+	if(logging)
+		update_log.reset(parentComm);
 
 	// init the segment choosing and stoping
 	cur_h_seg = 0;
@@ -358,11 +365,16 @@ double DICOD2D::_choose_coord_Rand(int seg_h_start, int seg_h_end,
 
 // on step of the coordinate descent
 double DICOD2D::step(){
-	if(pause)
+	if(pause){
+		time_point t_pause = chrono::high_resolution_clock::now();
 		this_thread::sleep_for(chrono::milliseconds(PAUSE_DELAY));
+		tracer.span(TR_PAUSED, t_pause, chrono::high_resolution_clock::now());
+	}
 
 	time_point t_step_start = chrono::high_resolution_clock::now();
 	process_queue();
+	if(tracer.on())
+		t_compute = chrono::high_resolution_clock::now();
 	//int i, k, t, k_off;
 	int k0 = -1, w0, h0;
 	double dz, adz;
@@ -439,9 +451,8 @@ double DICOD2D::step(){
 	if(logging){
 		double seconds = _get_time_span();
 
-		log_t.push_back(seconds);
-		log_dz.push_back(-dz);
-		log_i0.push_back((double) k0*L+(h_off+h0)*w_cod+w_off+w0);
+		update_log.push((int64_t) k0*L+(h_off+h0)*w_cod+w_off+w0, seconds,
+						-dz, 0);
 	}
 
 	// update beta
@@ -467,6 +478,8 @@ double DICOD2D::step(){
 // handle the computation to avoid ending computation before convergence in
 // random algorithm and in segmented iterations
 double DICOD2D::_return_dz(double dz){
+	if(tracer.on())
+		tracer.span(TR_COMPUTE, t_compute, chrono::high_resolution_clock::now());
 	if(dz <= tol)
 		n_zero += 1;
 	if(n_zero < patience)
@@ -480,8 +493,7 @@ void DICOD2D::_update_beta(double dz, int k0, int h0, int w0){
 	int k, h_tau, w_tau;
 
 	//Offset variables
-	int DD_off, beta_off;
-	int s_DD= (2*h_dic-1)*(2*w_dic-1);
+	int DD_off, beta_off, stride;
 	int h_DD_start, w_DD_start, h_cod_start, w_cod_start, h_ll, w_ll;
 
 	//Hold previous beta for the current indice
@@ -497,12 +509,14 @@ void DICOD2D::_update_beta(double dz, int k0, int h0, int w0){
 	w_ll = min(w_proc, w0+w_dic) - w_cod_start;
 
 	// update beta localy
+	double *DD_k;
 	for(k=0; k < K; k++){
 		beta_off = k*L_proc + h_cod_start*w_proc + w_cod_start;
-		DD_off = k*K*s_DD + k0*s_DD + h_DD_start*(2*w_dic-1) + w_DD_start;
+		DD_k = _DD_row(k, k0, stride);
+		DD_off = h_DD_start*(2*w_dic-1) + w_DD_start;
 		for(h_tau=0; h_tau < h_ll; h_tau++){
 			for(w_tau=0; w_tau < w_ll; w_tau++)
-				beta[beta_off+w_tau] -= DD[DD_off+w_tau]*dz;
+				beta[beta_off+w_tau] -= DD_k[stride*(DD_off+w_tau)]*dz;
 			beta_off += w_proc;
 			DD_off += (2*w_dic-1);
 		}
@@ -516,6 +530,20 @@ void DICOD2D::_update_beta(double dz, int k0, int h0, int w0){
 					w_cod_start, w_DD_start, w_ll);
 }
 
+// return a pointer on the lags of DD[k, k0], to be read with the given
+// stride. With the packed storage, only the pairs k <= k0 are stored and
+// DD[k, k0](h, w) = DD[k0, k](-h, -w) is read backward.
+double* DICOD2D::_DD_row(int k, int k0, int &stride){
+	int s_DD = (2*h_dic-1)*(2*w_dic-1);
+	stride = 1;
+	if(!packed_DD)
+		return DD + (k*K+k0)*s_DD;
+	if(k <= k0)
+		return DD + (k*(2*K-k+1)/2+k0-k)*s_DD;
+	stride = -1;
+	return DD + (k0*(2*K-k0+1)/2+k-k0+1)*s_DD - 1;
+}
+
 // send updates messages to neighbors
 void DICOD2D::send_updates(double dz, int k0, int w0, int h0,
 							int h_cod_start, int h_DD_start, int h_ll,
@@ -586,7 +614,7 @@ void DICOD2D::send_update_msg(int dest, double dz, int k0,
 	up_count++;
 
 	// send the message
-	Request req = COMM_WORLD.Isend(msg, HEADER_2D, DOUBLE,
+	Request req = comm.Isend(msg, HEADER_2D, DOUBLE,
 					dest, TAG_MSG_UP);
 	messages.push_back(msg);
 	reqs.push_back(req);
@@ -605,7 +633,9 @@ bool DICOD2D::stop(double dz){
 
 	// if we have reach an optimal solution, stop the algorithm
 	if(!go){
-		COMM_WORLD.Barrier();
+		time_point t_barrier = chrono::high_resolution_clock::now();
+		comm.Barrier();
+		tracer.span(TR_BARRIER, t_barrier, chrono::high_resolution_clock::now());
 		if(world_rank == 0 && (debug || DEBUG))
 			cout << "INFO - MPI_Workers- Reach optimal solution in " << seconds
 				<< endl;
@@ -628,7 +658,9 @@ bool DICOD2D::stop(double dz){
 				go = false;
 				pause = true;
 				runtime = seconds;
-				COMM_WORLD.Barrier();
+				time_point t_barrier = chrono::high_resolution_clock::now();
+				comm.Barrier();
+				tracer.span(TR_BARRIER, t_barrier, chrono::high_resolution_clock::now());
 				return true;
 			}
 			// else if it just enter the pause state, initiate the probe process
@@ -641,6 +673,7 @@ bool DICOD2D::stop(double dz){
 			// probe the other process to know if they are still running
 			if(next_probe <= seconds){
 				Ibroadcast(MSG_REQ_PROBE);
+				tracer.instant(TR_PROBE);
 				up_probe = min(up_probe*1.2, PROBE_MAX);
 				next_probe = seconds + up_probe;
 			}
@@ -671,6 +704,7 @@ bool DICOD2D::stop(double dz){
 				seconds = _get_time_span();
 				if(next_probe <= seconds){
 					Ibroadcast(MSG_REQ_PROBE);
+					tracer.instant(TR_PROBE);
 					up_probe = min(up_probe*1.2, PROBE_MAX);
 					next_probe = seconds + up_probe;
 				}
@@ -679,7 +713,9 @@ bool DICOD2D::stop(double dz){
 			cout << "DEBUG:job0 - Finished to wait for other process. go: "
 				<< go << endl;
 		}
-		COMM_WORLD.Barrier();
+		time_point t_barrier = chrono::high_resolution_clock::now();
+		comm.Barrier();
+		tracer.span(TR_BARRIER, t_barrier, chrono::high_resolution_clock::now());
 		_clean_up();
 		delete[] msg;
 		msg = NULL;
@@ -690,7 +726,9 @@ bool DICOD2D::stop(double dz){
 }
 
 void DICOD2D::send_result(){
+	time_point t_cost = chrono::high_resolution_clock::now();
 	double cost = compute_cost();
+	tracer.span(TR_COST, t_cost, chrono::high_resolution_clock::now());
 	double *A = NULL, *B = NULL;
 
 	A = new double[K*K*(2*h_dic-1)*(2*w_dic-1)];
@@ -702,7 +740,14 @@ void DICOD2D::send_result(){
 		double dur = chrono::duration_cast<d_duration>(t_ab2 - t_ab).count();
 		cout << "DEBUG:jobs - AB computation took " << dur << "s" << endl;
 	}
-	parentComm->Barrier();
+	// Send the end of the log, received by the root while it waits
+	if(logging)
+		update_log.finish();
+	MPI_Request req;
+	time_point t_barrier = chrono::high_resolution_clock::now();
+	MPI_Ibarrier((MPI_Comm) *parentComm, &req);
+	MPI_Wait(&req, MPI_STATUS_IGNORE);
+	tracer.span(TR_BARRIER, t_barrier, chrono::high_resolution_clock::now());
 	parentComm->Send(pt, K*L_proc, DOUBLE, ROOT, TAG_MSG_ROOT+world_rank);
 
 	// Gather computed constants
@@ -719,20 +764,11 @@ void DICOD2D::send_result(){
 						NULL_SIZE, DOUBLE, ROOT);
 	parentComm->Gather(&t_init, UNIT_MSG, DOUBLE, NULL,
 						NULL_SIZE, DOUBLE, ROOT);
+	if(trace)
+		tracer.send(parentComm, t_start);
 
-	if (logging){
-		double* _log = new double[3*iter];
-		list<double>::iterator itz, itt, iti;
-		int i = 0;
-		for(itz=log_dz.begin(), itt=log_t.begin(), iti=log_i0.begin();
-			iti != log_i0.end(); itz++, itt++, iti++, i++){
-			_log[3*i] = *iti;
-			_log[3*i+1] = *itt;
-			_log[3*i+2] = *itz;
-		}
-		parentComm->Send(_log, 3*iter, DOUBLE, ROOT, TAG_MSG_ROOT+world_rank);
-		delete[] _log;
-	}
+	if (logging)
+		update_log.wait();
 }
 
 double DICOD2D::compute_cost(){
@@ -793,16 +829,16 @@ double DICOD2D::compute_cost(){
 		}
 	clear_workspace(ws);
 	if(w_rank > 0)
-		COMM_WORLD.Isend(msg_right, dim*h_proc_S*(w_dic-1), DOUBLE,
+		comm.Isend(msg_right, dim*h_proc_S*(w_dic-1), DOUBLE,
 							world_rank-1, TAG_MSG_COST);
 	if(w_rank > 0 && h_rank > 0)
-		COMM_WORLD.Isend(msg_corner, dim*(h_dic-1)*(w_dic-1), DOUBLE,
+		comm.Isend(msg_corner, dim*(h_dic-1)*(w_dic-1), DOUBLE,
 							world_rank-w_world-1, TAG_MSG_COST);
 	if(h_rank > 0)
-		COMM_WORLD.Isend(msg_bottom, dim*(h_dic-1)*w_proc_S, DOUBLE,
+		comm.Isend(msg_bottom, dim*(h_dic-1)*w_proc_S, DOUBLE,
 							world_rank-w_world, TAG_MSG_COST);
 	if(w_rank < w_world-1){
-		COMM_WORLD.Recv(msg_in_right, dim*h_proc_S*(w_dic-1), DOUBLE,
+		comm.Recv(msg_in_right, dim*h_proc_S*(w_dic-1), DOUBLE,
 						world_rank+1, TAG_MSG_COST);
 		val_msg = msg_in_right;
 		for(d=0; d< dim; d++){
@@ -817,7 +853,7 @@ double DICOD2D::compute_cost(){
 	}
 	if(h_rank < h_world-1){
 		val_msg = msg_in_bottom;
-		COMM_WORLD.Recv(msg_in_bottom, dim*(h_dic-1)*w_proc_S, DOUBLE,
+		comm.Recv(msg_in_bottom, dim*(h_dic-1)*w_proc_S, DOUBLE,
 						world_rank+w_world, TAG_MSG_COST);
 		for(d=0; d < dim; d++){
 			rec_off = d*L_rec;
@@ -831,7 +867,7 @@ double DICOD2D::compute_cost(){
 	}
 	if(w_rank < w_world-1 && h_rank < h_world-1){
 		val_msg = msg_in_corner;
-		COMM_WORLD.Recv(msg_in_corner, dim*(h_dic-1)*(w_dic-1), DOUBLE,
+		comm.Recv(msg_in_corner, dim*(h_dic-1)*(w_dic-1), DOUBLE,
 						world_rank+w_world+1, TAG_MSG_COST);
 		for(d=0; d < dim; d++){
 			msg_off = d*(h_dic-1)*(w_dic-1);
@@ -882,7 +918,7 @@ double DICOD2D::compute_cost(){
 	while(its != pt+K*L_proc)
 		z_l1 += fabs(*its++);
 	cost = Er + lmbd * z_l1;
-	COMM_WORLD.Barrier();
+	comm.Barrier();
 	delete[] msg_right;
 	delete[] msg_corner;
 	delete[] msg_bottom;
@@ -939,7 +975,7 @@ void DICOD2D::_extended_point(double* out){
 					memcpy(msg_val, pt+dk, w_msg*sizeof(double));
 				}
 			}
-			COMM_WORLD.Isend(msg, msg_size, DOUBLE, dst, TAG_MSG_AB);
+			comm.Isend(msg, msg_size, DOUBLE, dst, TAG_MSG_AB);
 			msgs[i] = msg;
 		}
 	}
@@ -952,7 +988,7 @@ void DICOD2D::_extended_point(double* out){
 
 			msg_size = K*(params[3]-params[2])*w_msg;
 			msg = new double[msg_size];
-			COMM_WORLD.Recv(msg, msg_size, DOUBLE, from,
+			comm.Recv(msg, msg_size, DOUBLE, from,
 							TAG_MSG_AB);
 			msg_val = msg;
 			for(k=0; k < K; k++){
@@ -975,7 +1011,7 @@ void DICOD2D::_extended_point(double* out){
 			memcpy(out+dk, pt_val, w_proc*sizeof(double));
 		}
 
-	COMM_WORLD.Barrier();
+	comm.Barrier();
 	for(i = 0; i < 8; i++)
 		delete[] msgs[i];
 
@@ -1078,12 +1114,12 @@ void DICOD2D::end(){
 	double* msg;
 	while(!(end_neigh[0] && end_neigh[1] && end_neigh[2] && end_neigh[3] &&
 			end_neigh[4] && end_neigh[5] && end_neigh[6] && end_neigh[7])){
-		COMM_WORLD.Probe(ANY_SOURCE, ANY_TAG, s);
+		comm.Probe(ANY_SOURCE, ANY_TAG, s);
 		size_msg = s.Get_count(DOUBLE);
 		src = s.Get_source();
 		tag = s.Get_tag();
 		msg = new double[size_msg];
-		COMM_WORLD.Recv(msg, size_msg, DOUBLE, src, tag);
+		comm.Recv(msg, size_msg, DOUBLE, src, tag);
 		if(msg[0] == MSG_STOP && msg[1] >= 0)
 			end_neigh[(int) msg[1]] = true;
 		if(msg[0] == MSG_UP && !go)
@@ -1092,7 +1128,7 @@ void DICOD2D::end(){
 		delete[] msg;
 	}
 
-	COMM_WORLD.Barrier();
+	comm.Barrier();
 	while(!messages.empty()){
 		delete[] messages.front();
 		messages.pop_front();
@@ -1112,18 +1148,19 @@ void DICOD2D::process_queue(){
 	double dz;
 	int DD_start, i_try, k0;
 	int h_beta_start, w_beta_start, h_ll, w_ll, k, w_tau, h_tau;
-	int beta_off, dic_off, l_msg, s_DD, compt = 0;
+	int beta_off, dic_off, l_msg, stride, compt = 0;
+	double *DD_k;
 	int probe_success = 1;
 	unordered_map<int, int>::iterator it;
 
 	time_point t_procQ_start = chrono::high_resolution_clock::now();
-	while(COMM_WORLD.Iprobe(ANY_SOURCE, ANY_TAG, s)){
+	while(comm.Iprobe(ANY_SOURCE, ANY_TAG, s)){
 		compt += 1;
 		size_msg = s.Get_count(DOUBLE);
 		src = s.Get_source();
 		tag = s.Get_tag();
 		msg = new double[size_msg];
-		COMM_WORLD.Recv(msg, size_msg, DOUBLE, src, tag);
+		comm.Recv(msg, size_msg, DOUBLE, src, tag);
 		switch((int) msg[0]){
 			case MSG_STOP:
 				go = false;
@@ -1151,16 +1188,16 @@ void DICOD2D::process_queue(){
 				DD_start = (int) msg[5];
 				h_ll = (int) msg[6];
 				w_ll = (int) msg[7];
-				s_DD = (2*h_dic-1)*(2*w_dic-1);
 
 				// update beta localy
 				bool test = false;
 				for(k=0; k < K; k++){
 					beta_off = k*L_proc + h_beta_start*w_proc + w_beta_start;
-					dic_off = k*K*s_DD + k0*s_DD + DD_start;
+					DD_k = _DD_row(k, k0, stride);
+					dic_off = DD_start;
 					for(h_tau=0; h_tau < h_ll; h_tau++){
 						for(w_tau=0; w_tau < w_ll; w_tau++){
-							beta[beta_off+w_tau] -= DD[dic_off+w_tau]*dz;
+							beta[beta_off+w_tau] -= DD_k[stride*(dic_off+w_tau)]*dz;
 							// if(fabs(pt[beta_off+w_tau]+beta[beta_off+w_tau])
 							// 		> max_adz)
 							// 	test = true;
@@ -1178,6 +1215,8 @@ void DICOD2D::process_queue(){
 				// 			<< " for " << (int) msg[3] << "/ " << h_proc
 				//			<< ", " << (int) msg[4] << "/ " << w_proc
 				//			<< " with " << dz<< endl;
+				if(pause && !wrap_up)
+					tracer.instant(TR_WAKE);
 				pause = wrap_up;
 				n_zero = 0;
 				up = (int) msg[8];
@@ -1199,6 +1238,8 @@ void DICOD2D::process_queue(){
 	time_point t_procQ_end = chrono::high_resolution_clock::now();
 	d_duration time_span = chrono::duration_cast<d_duration>(
 		t_procQ_end - t_procQ_start);
+	if(compt > 0)
+		tracer.span(TR_QUEUE, t_procQ_start, t_procQ_end);
 
 	// cout << scientific;
 	// cout.precision(3);
@@ -1225,7 +1266,7 @@ void DICOD2D::Ibroadcast(int msg_t){
 			msg[1] = i_try;
 	}
 	for(int i = 1; i < world_size; i ++){
-		Request req = COMM_WORLD.Isend(msg, sz, DOUBLE, i, 3);
+		Request req = comm.Isend(msg, sz, DOUBLE, i, 3);
 		reqs.push_back(req);
 		messages.push_back(NULL);
 		n_msg++;
@@ -1243,11 +1284,12 @@ void DICOD2D::probe_reply(){
 	for(it=probe_try.begin(), i=0;
 		it != probe_try.end(); it++, i++)
 		msg[i+2] = *it;
-	Request req = COMM_WORLD.Isend(msg, l_msg, DOUBLE, 0, 4);
+	Request req = comm.Isend(msg, l_msg, DOUBLE, 0, 4);
 	messages.push_back(msg);
 	reqs.push_back(req);
 	n_msg++;
 	probe_try.clear();
+	tracer.instant(TR_PROBE);
 }
 void DICOD2D::_send_msg(int dest, int msg_type, int arg, bool wait){
 	int sz = 2;
@@ -1255,7 +1297,7 @@ void DICOD2D::_send_msg(int dest, int msg_type, int arg, bool wait){
 	msg[0] = (double) msg_type;
 	msg[1] = (double) arg;
 	if(dest > -1 && dest < world_size){
-		Request req = COMM_WORLD.Isend(msg, sz, DOUBLE,
+		Request req = comm.Isend(msg, sz, DOUBLE,
 							dest, TAG_MSG_SERVICE);
 		if(wait){
 			while(!req.Test())
@@ -10,6 +10,8 @@
 #include <thread>
 #include <random>
 #include "constants.h"
+#include "update_log.h"
+#include "trace.h"
 
 using namespace MPI;
 using namespace std;
@@ -22,7 +24,7 @@ class DICOD2D
 {
 	public:
 		//Construction and destruction
-		DICOD2D(Intercomm* _parentComm);
+		DICOD2D(Intercomm* _parentComm, Intracomm _comm=COMM_WORLD);
 		~DICOD2D();
 
 		//Manage the process
@@ -40,6 +42,7 @@ class DICOD2D
 	private:
 		//Private Attributes
 		Intercomm *parentComm;			// Communicator for MPI operations
+		Intracomm comm;					// Communicator with the other workers
 
 		double *sig, *beta, *pt; 		// Signal, beta and current point
 		double *D, *alpha_k, *DD;		// Dicitonary, norm of the dict and cross correlation
@@ -48,6 +51,8 @@ class DICOD2D
 		double lmbd, tol, timeout;
 		int max_iter, n_seg, algo, patience;
 		bool debug, logging, positive;
+		bool packed_DD;					// DD only holds the pairs k <= k'
+		bool trace;						// Record the timeline of the solve
 
 		// dimension of the problem
 		int dim, K, h_dic, w_dic, S;	// Dimensions of the dictionary
@@ -90,8 +95,9 @@ class DICOD2D
 		list<int> probe_try;			// Hold the received probe requests
 		unordered_map<int, int> probe_result;
 										// Hold the number of processes that reply to a given probe
-		list<double> log_dz, log_t, log_i0;
-										// List that hold all the update time and value
+		UpdateLog update_log;			// Log of the update times and values
+		Tracer tracer;					// Timeline of the solve
+		time_point t_compute;			// Start of the updates of the current step
 
 
     	//Private Methods
@@ -103,6 +109,7 @@ class DICOD2D
 		double compute_cost();
 		void _compute_AB(double*, double*);
 		void _update_beta(double dz, int k, int h, int w);
+		double* _DD_row(int k, int k0, int &stride);
 		void process_queue();
 		void _clean_up();
 		void _signal_end();
@@ -122,6 +129,6 @@ class DICOD2D
 };
 
 
-void solve_DICOD(Intercomm *parentComm);
+void solve_DICOD(Intercomm *parentComm, Intracomm comm=COMM_WORLD);
 
 #endif
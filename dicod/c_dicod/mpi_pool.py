@@ -1,18 +1,37 @@
-from mpi4py import MPI
 from os import path
 from time import time, sleep
+from concurrent.futures import Future
 import numpy as np
 import threading
 
 DEBUG = True
 
+
+class _LazyMPI(object):
+    '''Proxy of mpi4py.MPI, only imported on first use
+
+    Importing mpi4py.MPI initializes the MPI runtime, which is slow and
+    fails on hosts without MPI, so the solvers which do not spawn workers
+    should not pay for it.
+    '''
+    def __getattr__(self, name):
+        from mpi4py import MPI as _MPI
+        value = getattr(_MPI, name)
+        setattr(self, name, value)
+        return value
+
+
+MPI = _LazyMPI()
+
 MNG_STOP = 0
 MNG_RESIZE_SERVER = 1
 MNG_RESIZE_CLIENT = 2
+MNG_SPLIT_POOL = 6
 
 # // CONTROL MSG TAG
 TAG_MNG_MSG = 0
 TAG_PORT_MSG = 1
+TAG_RESIZE_MSG = 2
 
 RUN = 0
 BROKEN = 1
@@ -21,28 +40,76 @@ TERMINATE = 2
 
 _local = threading.local()
 
+# Pool split in sub-groups, shared by all the threads
+_split_pool = None
+
+# Future of the pool spawned by warmup, until a thread attaches to it
+_warmup = None
+
+
+def warmup(n_jobs=1, hostfile=None):
+    '''Spawn a pool of workers in a background thread
+
+    The next call to get_reusable_pool attaches to this pool instead of
+    spawning its own, so the first fit does not pay for the Spawn.
+
+    Return
+    ------
+    future: concurrent.futures.Future
+        Future of the MPI_Pool. Its timings attribute holds the time spent
+        in the spawn and the barrier and, after the first task, in the
+        handshake with the workers.
+    '''
+    global _warmup
+    future = Future()
+
+    def _spawn():
+        try:
+            future.set_result(MPI_Pool(n_jobs=n_jobs, hostfile=hostfile))
+        except Exception as e:
+            future.set_exception(e)
+
+    _warmup = future
+    threading.Thread(target=_spawn, name='dicod-warmup', daemon=True).start()
+    return future
+
 
 def get_reusable_pool(n_jobs=None, hostfile=None):
+    global _warmup
+    if _split_pool is not None:
+        return _split_pool.lease(n_jobs)
     _pool = getattr(_local, '_pool', None)
     t = time()
-    if _pool is None:
-        _local._pool = _pool = MPI_Pool(n_jobs=n_jobs, hostfile=hostfile)
-    elif _pool._state != RUN or n_jobs != _pool.n_jobs:
+    if _warmup is not None:
+        future, _warmup = _warmup, None
+        if _pool is not None:
+            _pool.terminate()
+        _local._pool = _pool = future.result()
+        if DEBUG:
+            print("DEBUG - Attached to the warm pool after {:.4}s"
+                  .format(time()-t))
+    if _pool is not None:
+        # Wait for the end of the task running asynchronously on the pool
+        with _pool.busy:
+            pass
+    if _pool is not None and (_pool._state != RUN or
+                              hostfile != _pool.hostfile):
         if DEBUG:
             print("DEBUG - Create a new pool as the previous one"
                   " was in state {}".format(_pool._state))
-        _pool.terminate()
-        _local._pool = None
-        return get_reusable_pool(n_jobs=n_jobs, hostfile=hostfile)
-    elif n_jobs == _pool.n_jobs:
-        return _pool
-    else:
-        _pool.resize(n_jobs)
+        # The workers of a broken pool stopped in the middle of a task and
+        # would not answer the stop message
+        if _pool._state != BROKEN:
+            _pool.terminate()
+        _local._pool = _pool = None
+    if _pool is None:
+        _local._pool = _pool = MPI_Pool(n_jobs=n_jobs, hostfile=hostfile)
         print('Created pool of worker in {:.4}s'.format(time()-t))
-        return _pool
-    print('Created pool of worker in {:.4}s'.format(time()-t))
-    print(_pool.n_jobs, '/', n_jobs)
-    return _pool
+    elif n_jobs > _pool.n_jobs:
+        _pool.resize(n_jobs)
+
+    # Only use n_jobs workers, the others are parked
+    return _pool.park(n_jobs)
 
 
 class MPI_Pool(object):
@@ -53,6 +120,11 @@ class MPI_Pool(object):
         self.hostfile = hostfile
         c_prog = path.dirname(path.abspath(__file__))
         self.c_prog = path.join(c_prog, 'start_worker')
+        self.groups = {}
+        self._active = None
+        self._free = threading.Condition()
+        self.busy = threading.Lock()
+        self.timings = {}
         self._init_pool()
         self._state = RUN
 
@@ -66,39 +138,154 @@ class MPI_Pool(object):
         if self.hostfile is not None and path.exists(self.hostfile):
             mpi_info.Set("add-hostfile", self.hostfile)
             # mpi_info.Set("map_bynode", '1')
+        t = time()
         self.comm = MPI.COMM_SELF.Spawn(
             self.c_prog, maxprocs=self.n_jobs,
             info=mpi_info)
+        self.timings['spawn'] = time() - t
+        t = time()
         self.comm.Barrier()
-        print("Pool initialized")
+        self.timings['barrier'] = time() - t
+        print("Pool initialized - spawn {spawn:.4}s, barrier {barrier:.4}s"
+              .format(**self.timings))
 
     def resize(self, n_jobs):
-        '''TODO: Robustify
+        '''Grow the pool to n_jobs workers
+
+        The new workers are spawned and connect to a port opened by the
+        current ones. Both groups are merged with Intercomm.Merge and the
+        intercommunicator with the root is rebuilt on the merged group.
         '''
+        if n_jobs <= self.n_jobs:
+            return
+        self.merge()
         t = time()
         mpi_info = MPI.Info.Create()
-        if self.hostfile is not None:
+        if self.hostfile is not None and path.exists(self.hostfile):
             mpi_info.Set("add-hostfile", self.hostfile)
         mpi_info.Set("map_bynode", '1')
         comm2 = MPI.COMM_SELF.Spawn(
             self.c_prog, maxprocs=n_jobs-self.n_jobs,
             info=mpi_info)
-        i0 = np.random.randint(1024)
-        msg = np.array([MNG_RESIZE_SERVER, i0, 0, 0]).astype('i')
+        comm2.Barrier()
+
+        # The current workers open a port and wait for the new ones
+        msg = np.array([MNG_RESIZE_SERVER, 0, 0, 0]).astype('i')
         self.mng_bcast(msg)
+        root_world = self.comm.Merge(high=False)
         portname = np.empty(MPI.MAX_PORT_NAME).astype('c')
         self.comm.Recv([portname, MPI.CHAR], 0, TAG_PORT_MSG)
-        print(portname)
         msg[0] = MNG_RESIZE_CLIENT
-        comm2.Barrier()
         self.mng_bcast(msg, comm2)
         for i in range(comm2.remote_size):
-            comm2.Send([portname, MPI.CHAR], 0, TAG_PORT_MSG)
-        print('Resized pool of worker in {:.4}s'.format(time()-t))
+            comm2.Send([portname, MPI.CHAR], i, TAG_PORT_MSG)
 
-        msg[0] = MNG_STOP
-        self.mng_bcast(msg, comm2)
+        # Connect the root to the merged group, its leader is the first of
+        # the current workers, with rank 1 in root_world
+        comm = MPI.COMM_SELF.Create_intercomm(0, root_world, 1,
+                                              TAG_RESIZE_MSG)
+        self.comm.Disconnect()
         comm2.Disconnect()
+        root_world.Free()
+        self.comm = comm
+        self.n_jobs = n_jobs
+        print('Resized pool of worker in {:.4}s'.format(time()-t))
+
+    def park(self, n_jobs):
+        '''Use only n_jobs workers of the pool, the others stay idle
+
+        Return
+        ------
+        pool: MPI_Pool or MPI_SubPool
+            The pool itself if n_jobs is its size, else a sub-group with the
+            first n_jobs workers.
+        '''
+        assert n_jobs <= self.n_jobs
+        if self._active is not None and self._active.n_jobs != n_jobs:
+            self.merge()
+        if n_jobs == self.n_jobs:
+            return self
+        if self._active is None:
+            self._active = self._split({'active': n_jobs})['active']
+            self._active.busy = self.busy
+        return self._active
+
+    def split(self, groups):
+        '''Split the workers in sub-groups accepting tasks independently
+
+        Once split, get_reusable_pool leases a free sub-group of n_jobs
+        workers, from any thread, until merge is called.
+
+        Parameters
+        ----------
+        groups: dict or list of int
+            Number of workers in each sub-group, indexed by its name. The
+            remaining workers stay idle.
+
+        Return
+        ------
+        groups: dict of MPI_SubPool
+        '''
+        global _split_pool
+        self.merge()
+        if not isinstance(groups, dict):
+            groups = dict(enumerate(groups))
+        self.groups = self._split(groups)
+        _split_pool = self
+        return dict(self.groups)
+
+    def _split(self, groups):
+        assert sum(groups.values()) <= self.n_jobs
+
+        # Send to each worker the index of its group, -1 for idle workers
+        n_groups = len(groups)
+        i_worker = 0
+        msg = np.array([MNG_SPLIT_POOL, -1, n_groups, 0]).astype('i')
+        for g, n_jobs in enumerate(groups.values()):
+            msg[1] = g
+            for i in range(i_worker, i_worker + n_jobs):
+                self.comm.Send([msg, MPI.INT], i, TAG_MNG_MSG)
+            i_worker += n_jobs
+        msg[1] = -1
+        for i in range(i_worker, self.n_jobs):
+            self.comm.Send([msg, MPI.INT], i, TAG_MNG_MSG)
+
+        # The workers of group g only take color 0 in the g-th split
+        comms = [self.comm.Split(0, 0) for _ in groups]
+        return {name: MPI_SubPool(self, comm, name)
+                for name, comm in zip(groups, comms)}
+
+    def merge(self):
+        '''Stop the sub-groups and give their workers back to the pool
+        '''
+        global _split_pool
+        if self._active is not None:
+            self.groups['active'] = self._active
+            self._active = None
+        for sub_pool in self.groups.values():
+            sub_pool.terminate()
+        self.groups = {}
+        if _split_pool is self:
+            _split_pool = None
+
+    def lease(self, n_jobs):
+        '''Wait for a free sub-group of n_jobs workers and reserve it
+        '''
+        candidates = [g for g in self.groups.values() if g.n_jobs == n_jobs]
+        assert len(candidates) > 0, (
+            "No sub-group with {} workers in {}".format(n_jobs, self.groups))
+        with self._free:
+            while True:
+                for sub_pool in candidates:
+                    if not sub_pool.leased:
+                        sub_pool.leased = True
+                        return sub_pool
+                self._free.wait()
+
+    def release(self):
+        '''Give back a pool obtained with get_reusable_pool
+        '''
+        pass
 
     def mng_bcast(self, msg, comm=None):
         if comm is None:
@@ -107,12 +294,55 @@ class MPI_Pool(object):
             comm.Send([msg, MPI.INT], i, TAG_MNG_MSG)
 
     def terminate(self):
+        self.merge()
         msg = np.array([MNG_STOP] * 4).astype('i')
         self.mng_bcast(msg)
         self.comm.Disconnect()
+        self._state = TERMINATE
         sleep(1)
 
 
+class MPI_SubPool(MPI_Pool):
+    """Sub-group of the workers of a MPI_Pool"""
+    def __init__(self, pool, comm, name):
+        self.pool = pool
+        self.comm = comm
+        self.name = name
+        self.n_jobs = comm.remote_size
+        self.hostfile = pool.hostfile
+        self.timings = pool.timings
+        self.groups = {}
+        self.busy = threading.Lock()
+        self.leased = False
+        self._active = None
+        self.comm.Barrier()
+        self._state = RUN
+
+    # The workers are managed by the parent pool, which first merges back
+    # this sub-group if it is the parked one returned by get_reusable_pool
+    def split(self, groups):
+        return self.pool.split(groups)
+
+    def merge(self):
+        self.pool.merge()
+
+    def resize(self, n_jobs):
+        self.pool.resize(n_jobs)
+
+    def release(self):
+        if self is self.pool._active:
+            return
+        with self.pool._free:
+            self.leased = False
+            self.pool._free.notify_all()
+
+    def terminate(self):
+        msg = np.array([MNG_STOP] * 4).astype('i')
+        self.mng_bcast(msg)
+        self.comm.Disconnect()
+        self._state = TERMINATE
+
+
 if __name__ == '__main__':
 
     import argparse
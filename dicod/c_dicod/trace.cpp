@@ -0,0 +1,62 @@
+//
+// Timeline of the activity of a worker, sent to the root at the end of a
+// solve to build a Chrome trace.
+//
+#include "trace.h"
+
+
+Tracer::Tracer(){
+	enabled = false;
+	events = NULL;
+	n = 0, dropped = 0;
+}
+
+Tracer::~Tracer(){
+	delete[] events;
+}
+
+// Start a new timeline, only allocated when tracing
+void Tracer::reset(bool _enabled){
+	enabled = _enabled;
+	n = 0, dropped = 0;
+	origin = chrono::high_resolution_clock::now();
+	if(enabled && events == NULL)
+		events = new double[3*TRACE_MAX];
+}
+
+void Tracer::_push(int type, time_point t0, time_point t1){
+	double start = chrono::duration_cast<chrono::duration<double>>(
+		t0 - origin).count();
+	double dur = chrono::duration_cast<chrono::duration<double>>(
+		t1 - t0).count();
+
+	// Extend the last span if it has the same type and ends just before
+	if(n > 0 && dur > 0){
+		double *last = &events[3*(n-1)];
+		if(last[0] == type && last[2] > 0 &&
+				start - last[1] - last[2] <= TRACE_MERGE){
+			last[2] = start + dur - last[1];
+			return;
+		}
+	}
+	if(n == TRACE_MAX){
+		dropped++;
+		return;
+	}
+	events[3*n] = type;
+	events[3*n+1] = start;
+	events[3*n+2] = dur;
+	n++;
+}
+
+// Send the number of events and of dropped events, then the events with
+// their start relative to t_start, the end of the initialization barrier
+void Tracer::send(Intercomm* parentComm, time_point t_start){
+	double shift = chrono::duration_cast<chrono::duration<double>>(
+		origin - t_start).count();
+	for(int i = 0; i < n; i++)
+		events[3*i+1] += shift;
+	double header[2] = {(double) n, (double) dropped};
+	parentComm->Gather(header, 2, DOUBLE, NULL, 0, DOUBLE, 0);
+	parentComm->Gatherv(events, 3*n, DOUBLE, NULL, NULL, NULL, DOUBLE, 0);
+}
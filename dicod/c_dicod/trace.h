@@ -0,0 +1,58 @@
+//
+// Timeline of the activity of a worker, sent to the root at the end of a
+// solve to build a Chrome trace.
+//
+#ifndef TRACE_H
+#define TRACE_H
+
+#include <mpi.h>
+#include <chrono>
+using namespace MPI;
+using namespace std;
+
+#define TRACE_MAX 65536			// Max number of events kept by a worker
+#define TRACE_MERGE 5e-5		// Max gap in seconds to merge two spans
+
+// Types of the events, in the order of TRACE_EVENTS in dicod.py
+#define TR_COMPUTE 0			// Spans: coordinate updates
+#define TR_QUEUE 1				// processing of the neighbor messages
+#define TR_PAUSED 2				// sleep of a paused worker
+#define TR_BARRIER 3			// wait at a barrier
+#define TR_INIT 4				// _init_algo
+#define TR_COST 5				// compute_cost
+#define TR_PROBE 6				// Instants: probe sent or answered
+#define TR_WAKE 7				// paused worker woken up by an update
+
+typedef chrono::high_resolution_clock::time_point time_point;
+
+// Each event is stored as its type, its start and its duration in seconds.
+// The instants have a duration of 0. The events past TRACE_MAX are dropped.
+class Tracer{
+	public:
+		Tracer();
+		~Tracer();
+		void reset(bool enabled);
+		bool on(){ return enabled;}
+		void span(int type, time_point t0, time_point t1){
+			if(enabled)
+				_push(type, t0, t1);
+		}
+		void instant(int type){
+			if(enabled){
+				time_point t = chrono::high_resolution_clock::now();
+				_push(type, t, t);
+			}
+		}
+		void send(Intercomm* parentComm, time_point t_start);
+
+	private:
+		bool enabled;
+		double *events;
+		int n;							// Number of events in the buffer
+		int dropped;					// Number of events dropped
+		time_point origin;				// Time of the reset
+
+		void _push(int type, time_point t0, time_point t1);
+};
+
+#endif
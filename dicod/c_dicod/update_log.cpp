@@ -0,0 +1,88 @@
+//
+// Compact log of the updates of a worker, streamed to the root by chunks
+// during the solve.
+//
+#include "update_log.h"
+
+#include <string.h>
+
+
+UpdateLog::UpdateLog(){
+	parentComm = NULL;
+	i0 = NULL, dz = NULL, t = NULL, skip = NULL;
+	n = 0;
+}
+
+UpdateLog::~UpdateLog(){
+	_wait_pending(0);
+	delete[] i0;
+	delete[] dz;
+	delete[] t;
+	delete[] skip;
+}
+
+// Start a new log, sent to the root of parentComm
+void UpdateLog::reset(Intercomm* _parentComm){
+	_wait_pending(0);
+	parentComm = _parentComm;
+	n = 0;
+	if(i0 == NULL){
+		i0 = new int64_t[LOG_CHUNK];
+		dz = new double[LOG_CHUNK];
+		t = new float[LOG_CHUNK];
+		skip = new int32_t[LOG_CHUNK];
+	}
+}
+
+void UpdateLog::push(int64_t _i0, float _t, double _dz, int32_t _skip){
+	i0[n] = _i0;
+	dz[n] = _dz;
+	t[n] = _t;
+	skip[n] = _skip;
+	if(++n == LOG_CHUNK)
+		_flush();
+}
+
+// Send the last updates and the end of the log, without waiting for the root
+void UpdateLog::finish(){
+	if(n > 0)
+		_flush();
+	_flush();
+}
+
+// Wait until the root received all the chunks
+void UpdateLog::wait(){
+	_wait_pending(0);
+}
+
+void UpdateLog::_flush(){
+	// Bound the memory used by the chunks not yet received by the root
+	_wait_pending(LOG_PENDING-1);
+
+	int size = sizeof(int64_t) + n*(sizeof(int64_t) + sizeof(double) +
+									sizeof(float) + sizeof(int32_t));
+	char* msg = new char[size], *pos = msg;
+	int64_t _n = n;
+	memcpy(pos, &_n, sizeof(int64_t));
+	pos += sizeof(int64_t);
+	memcpy(pos, i0, n*sizeof(int64_t));
+	pos += n*sizeof(int64_t);
+	memcpy(pos, dz, n*sizeof(double));
+	pos += n*sizeof(double);
+	memcpy(pos, t, n*sizeof(float));
+	pos += n*sizeof(float);
+	memcpy(pos, skip, n*sizeof(int32_t));
+
+	reqs.push_back(parentComm->Isend(msg, size, BYTE, 0, TAG_LOG));
+	sent.push_back(msg);
+	n = 0;
+}
+
+void UpdateLog::_wait_pending(size_t max_pending){
+	while(!reqs.empty() && (reqs.size() > max_pending || reqs.front().Test())){
+		reqs.front().Wait();
+		reqs.pop_front();
+		delete[] sent.front();
+		sent.pop_front();
+	}
+}
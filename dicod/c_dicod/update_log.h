@@ -0,0 +1,44 @@
+//
+// Compact log of the updates of a worker, streamed to the root by chunks
+// during the solve.
+//
+#ifndef UPDATE_LOG_H
+#define UPDATE_LOG_H
+
+#include <mpi.h>
+#include <list>
+#include <stdint.h>
+using namespace MPI;
+using namespace std;
+
+#define TAG_LOG 4305			// Tag of the chunks of updates, see dicod.py
+#define LOG_CHUNK 65536			// Number of updates in a chunk
+#define LOG_PENDING 8			// Max number of chunks not received by the root
+
+// Each chunk is sent as one message with the number of updates n, then the
+// arrays i0 (int64), dz (float64), t (float32) and skip (int32) of size n.
+// A chunk with n = 0 ends the log.
+class UpdateLog{
+	public:
+		UpdateLog();
+		~UpdateLog();
+		void reset(Intercomm* parentComm);
+		void push(int64_t i0, float t, double dz, int32_t skip);
+		void finish();
+		void wait();
+
+	private:
+		Intercomm* parentComm;
+		int64_t *i0;					// Preallocated chunk of updates
+		double *dz;
+		float *t;
+		int32_t *skip;
+		int n;							// Number of updates in the chunk
+		list<char*> sent;				// Chunks sent to the root
+		list<Request> reqs;				// and their pending requests
+
+		void _flush();
+		void _wait_pending(size_t max_pending);
+};
+
+#endif
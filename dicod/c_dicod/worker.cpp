@@ -27,14 +27,81 @@ Worker::~Worker(){
 
 void Worker::start(){
 	parentComm->Barrier();
-	control_loop();
+	control_loop(parentComm, COMM_WORLD);
 }
 
-void Worker::control_loop(){
+// Split the pool in n_groups sub-groups accepting tasks independently and
+// serve the tasks of this worker group until the root sends STOP to it.
+void Worker::split_loop(Intercomm* comm, Intracomm world, int group,
+						int n_groups){
+	int color;
+	Intercomm group_comm, inter;
+	Intracomm group_world;
+
+	// The root takes part to one split per group, with color 0
+	for(int g = 0; g < n_groups; g++){
+		color = (g == group)?0:UNDEFINED;
+		inter = comm->Split(color, comm->Get_rank());
+		if(g == group)
+			group_comm = inter;
+	}
+	color = (group < 0)?UNDEFINED:group;
+	group_world = world.Split(color, comm->Get_rank());
+	if(group < 0)
+		return;
+	group_comm.Barrier();
+	control_loop(&group_comm, group_world);
+	group_comm.Disconnect();
+	group_world.Free();
+}
+
+// Grow the pool: accept the connection of the new workers spawned by the
+// root, merge them with the current ones and rebuild the root intercomm.
+void Worker::resize_server(Intercomm* comm, Intracomm& world){
+	char* portname = new char[MAX_PORT_NAME];
+	Intracomm root_world = comm->Merge(true);
+	if(world.Get_rank() == 0){
+		Open_port(INFO_NULL, portname);
+		comm->Send(portname, MAX_PORT_NAME, CHAR, 0, TAG_PORT_MSG);
+		if(DEBUG)
+			cout << "Server portname: " << portname << endl;
+	}
+	Intercomm inter = world.Accept(portname, INFO_NULL, 0);
+	if(world.Get_rank() == 0)
+		Close_port(portname);
+	merge_pool(comm, world, inter, false, root_world);
+	root_world.Free();
+	delete[] portname;
+}
+
+// Connect a new worker to the pool it is added to
+void Worker::resize_client(Intercomm* comm, Intracomm& world){
+	char* portname = new char[MAX_PORT_NAME];
+	comm->Recv(portname, MAX_PORT_NAME, CHAR, 0, TAG_PORT_MSG);
+	Intercomm inter = world.Connect(portname, INFO_NULL, 0);
+	merge_pool(comm, world, inter, true, world);
+	delete[] portname;
+}
+
+// Merge the two groups of workers connected by inter, the current workers
+// first, and replace comm by an intercomm between the root and all the
+// workers. peer is the merge of the root and the current workers.
+void Worker::merge_pool(Intercomm* comm, Intracomm& world, Intercomm& inter,
+						bool high, Intracomm& peer){
+	Intracomm all = inter.Merge(high);
+	inter.Disconnect();
+	Intercomm root_comm = all.Create_intercomm(0, peer, 0, TAG_RESIZE_MSG);
+	comm->Disconnect();
+	*comm = root_comm;
+	world = all;
+	world_size = world.Get_size();
+	world_rank = world.Get_rank();
+	if(DEBUG && world_rank == 0)
+		cout << "DEBUG  - Resized pool to " << world_size << endl;
+}
+
+void Worker::control_loop(Intercomm* parentComm, Intracomm world){
 	int * msg = new int[4];
-	char* portname;
-	Intercomm comm;
-	Intracomm commi;
 	Status status;
 	DICOD *dcp;
 	DICOD2D *dcp2;
@@ -42,7 +109,7 @@ void Worker::control_loop(){
 	bool flag;
 	msg[0] = RUN;
 	while(msg[0] > 0){
-		flag = parentComm->Iprobe(ANY_SOURCE, ANY_TAG, status);
+		flag = parentComm->Iprobe(ANY_SOURCE, TAG_MNG_MSG, status);
 		if(!flag){
 			usleep(1000);
 			continue;
@@ -55,39 +122,14 @@ void Worker::control_loop(){
 				cout << "Stopping msg" << endl;
 		break;
 		case RESIZE_SERVER:
-			//if(world_rank == 0){
-			portname = new char[MAX_PORT_NAME];
-			Open_port(INFO_NULL, portname);
-			if(world_rank == 0){
-				parentComm->Send(portname, MAX_PORT_NAME, CHAR,
-								 0, TAG_PORT_MSG);
-				cout << "Server portname: " << portname << endl;
-			}
-			commi = COMM_WORLD.Clone();
-			comm = commi.Accept(
-				portname, INFO_NULL, 0);
-			cout << "Connection done!!!!"<< comm.Get_remote_size()  << endl;
-			comm.Disconnect();
-			//comm.Free();
+			resize_server(parentComm, world);
 		break;
 		case RESIZE_CLIENT:
-			//if(world_rank == 0){
-			portname = new char[MAX_PORT_NAME];
-			cout << "Will look up" << endl;
-			parentComm->Recv(portname, MAX_PORT_NAME, CHAR,
-							 0, TAG_PORT_MSG);
-			cout << "Client portname: " << portname << endl;
-			//}
-			commi = COMM_WORLD.Clone();
-			comm = commi.Connect(
-				portname, INFO_NULL, 0);
-			cout << "Connection done!!!!" << comm.Get_remote_size() << endl;
-			comm.Disconnect();
-			//comm.Free();
+			resize_client(parentComm, world);
 		break;
 		case SOLVE_DICOD:
 			dz = 100.;
-			dcp = new DICOD(parentComm);
+			dcp = new DICOD(parentComm, world);
 			while(!dcp->stop(dz))
 				dz = dcp->step();
 
@@ -97,7 +139,16 @@ void Worker::control_loop(){
 			delete dcp;
 		break;
 		case SOLVE_DICOD2D:
-			solve_DICOD(parentComm);
+			solve_DICOD(parentComm, world);
+		break;
+		case SOLVE_PATH:
+			solve_path(parentComm, world);
+		break;
+		case SOLVE_BATCH:
+			solve_batch(parentComm);
+		break;
+		case SPLIT_POOL:
+			split_loop(parentComm, world, msg[1], msg[2]);
 		break;
 		}
 	}
@@ -13,10 +13,14 @@
 #define RESIZE_CLIENT 2
 #define SOLVE_DICOD 3
 #define SOLVE_DICOD2D 4
+#define SOLVE_BATCH 5
+#define SPLIT_POOL 6
+#define SOLVE_PATH 7
 
 // CONTROL MSG TAG
 #define TAG_MNG_MSG 0
 #define TAG_PORT_MSG 1
+#define TAG_RESIZE_MSG 2
 
 #define RUN 1
 
@@ -29,7 +33,13 @@ class Worker
 private:
 	Intercomm* parentComm;
 	int world_size, world_rank;
-	void control_loop();
+	void control_loop(Intercomm* comm, Intracomm world);
+	void split_loop(Intercomm* comm, Intracomm world, int group,
+					int n_groups);
+	void resize_server(Intercomm* comm, Intracomm& world);
+	void resize_client(Intercomm* comm, Intracomm& world);
+	void merge_pool(Intercomm* comm, Intracomm& world, Intercomm& inter,
+					bool high, Intracomm& peer);
 public:
 	Worker(Intercomm*);
 	~Worker();
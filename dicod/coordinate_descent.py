@@ -2,6 +2,7 @@ import logging
 import numpy as np
 
 from ._lasso_solver import _LassoSolver
+from .utils import DD_blocks, packed_index
 
 log = logging.getLogger('dicod')
 
@@ -14,9 +15,29 @@ class CoordinateDescent(_LassoSolver):
     pb: _Problem
         variable and function holder for the Problem
         to solve
+    DD_threshold: float, optional (default: 0)
+        If > 0, only update beta with the blocks of DD larger than
+        DD_threshold times the largest cross-correlation of each atom.
+    beta_refresh: int, optional (default: 1000)
+        With DD_threshold > 0, apply the skipped updates to beta every
+        beta_refresh updates, before an update they could change by more
+        than half and before stopping, so the solution still meets tol.
+    cost_refresh: int, optional (default: 10000)
+        When logging, the cost is updated from beta after each update and
+        recomputed exactly at the first log point after cost_refresh
+        updates, to bound the drift.
     debug: int, optional (default: 0)
         Verbosity level, set to 0 for no output
     '''
+    def __init__(self, DD_threshold=0, beta_refresh=1000, cost_refresh=10000,
+                 **kwargs):
+        super(CoordinateDescent, self).__init__(**kwargs)
+        self.DD_threshold = DD_threshold
+        if beta_refresh < 1:
+            raise ValueError("beta_refresh should be >= 1, got {}"
+                             .format(beta_refresh))
+        self.beta_refresh = beta_refresh
+        self.cost_refresh = cost_refresh
 
     def _init_algo(self):
         '''Precompute some quantities that are used across iterations
@@ -27,7 +48,79 @@ class CoordinateDescent(_LassoSolver):
         self.alpha_k = np.sum(np.mean(self.pb.D*self.pb.D, axis=1),
                               axis=1).reshape((-1, 1))
         self.alpha_k += (self.alpha_k == 0)
-        self.DD = self.pb.DD
+        self._init_packed_DD()
+        self._init_DD_blocks()
+        self._obj = None
+
+    def _init_packed_DD(self):
+        '''With a packed DD, DD[:, k0] is read in place by the updates: the
+        pairs (k, k0) for k <= k0 are at the rows _DD_lower[k0] and the pairs
+        (k0, k) for k > k0 follow the pair (k0, k0), with reversed lags
+        '''
+        self._DD_lower = None
+        if self.pb.packed_DD:
+            self._DD_lower = [packed_index(np.arange(k0+1), k0, self.K)
+                              for k0 in range(self.K)]
+
+    def _init_DD_blocks(self):
+        '''Select the significant rows and lags of DD for each atom, and
+        copy them so an update of beta only reads a small contiguous block
+        '''
+        self.DD_blocks = None
+        self._beta_exact = True
+        if self.DD_threshold > 0:
+            self.DD_blocks = []
+            self._DD_skipped = np.zeros(self.K)
+            for k0, blocks in enumerate(DD_blocks(
+                    self.pb.DD, self.DD_threshold, packed=self.pb.packed_DD)):
+                ks, t_start, t_end = np.array(blocks).T
+                t_start, t_end = t_start.min(), t_end.max()
+                self.DD_blocks += [(ks, t_start, t_end,
+                                    self.pb.get_DD(k0)[ks, t_start:t_end])]
+                # Largest lag skipped by the sparse updates of beta
+                self._DD_skipped[k0] = abs(self._DD_outside(k0)).max()
+            # Updates not applied with the skipped lags yet, and bound of the
+            # error of beta from the updates centered at t
+            self._dz_skipped = np.zeros(self.pb.pt.shape)
+            self._beta_err = np.zeros(self.pb.pt.shape[1])
+
+    def _DD_outside(self, k0):
+        '''Return the lags of DD[:, k0] skipped by the sparse updates'''
+        ks, t_start, t_end, _ = self.DD_blocks[k0]
+        DD_k0 = np.array(self.pb.get_DD(k0))
+        DD_k0[ks, t_start:t_end] = 0
+        return DD_k0
+
+    def _refresh_beta(self):
+        '''Apply the lags of DD skipped since the last refresh, so beta is
+        exact again
+        '''
+        k0 = None
+        for k, t in zip(*self._dz_skipped.nonzero()):
+            if k != k0:
+                k0, DD_k0 = k, self._DD_outside(k)
+            off = max(0, self.s-t-1)
+            d = max(0, t-self.s+1)
+            ll = len(self._beta[k, d:t+self.s])
+            self._beta[:, d:t+self.s] -= (
+                DD_k0[:, off:off+ll] * self._dz_skipped[k, t])
+        self._dz_skipped[:] = 0
+        self._beta_exact = True
+        self._beta_err[:] = 0
+        self._obj = None
+
+    def _check_update(self, k, t, z):
+        '''Return the new value z of pt[k, t], computed again with the exact
+        beta when the lags of DD skipped since the last refresh could change
+        more than half of the update
+        '''
+        if self.DD_blocks is None or self._beta_exact:
+            return z
+        err = self._beta_err[max(0, t-self.s+1):t+self.s].sum()
+        if err <= self.alpha_k[k, 0] * abs(self.pb.pt[k, t] - z) / 2:
+            return z
+        self._refresh_beta()
+        return self.pb.prox(-self._beta[k, t]) / self.alpha_k[k, 0]
 
     def p_update(self):
         '''Chose the best update and perform it
@@ -39,12 +132,45 @@ class CoordinateDescent(_LassoSolver):
         # select best coordinate descent
         i0 = np.argmax(abs(Z-self.pb.pt))
         i0 = np.unravel_index(i0, self.pb.pt.shape)
-        dz = self.pb.pt[i0] - Z[i0]
-        self.pb.pt[i0] = Z[i0]
+        beta_exact = self._beta_exact
+        z = self._check_update(i0[0], i0[1], Z[i0])
+        dz = self.pb.pt[i0] - z
+        if self._obj is not None:
+            self._update_cost(i0[0], i0[1], self.pb.pt[i0], z)
+        self.pb.pt[i0] = z
 
         self._update_beta(dz, i0[0], i0[1])
+        if self.DD_blocks is not None:
+            if abs(dz) < self.tol and not beta_exact:
+                # dz was computed with an approximate beta, check it
+                # again with the exact one before stopping
+                self._refresh_beta()
+                dz = 2 * self.tol
+            elif self.it % self.beta_refresh == 0:
+                self._refresh_beta()
         return abs(dz)
 
+    def _cost(self):
+        '''Running cost, recomputed exactly after cost_refresh updates
+        '''
+        if self._obj is None or self.it - self._obj_it >= self.cost_refresh:
+            self._obj = self.pb.cost()
+            self._obj_it = self.it
+        return self._obj
+
+    def _update_cost(self, k, t, z_old, z_new):
+        '''Update the running cost when pt[k, t] goes from z_old to z_new
+
+        The gradient of the quadratic term at pt[k, t] is
+        beta[k, t] + alpha_k[k] * z_old, so its change is exact for an
+        exact beta.
+        '''
+        alpha_k = self.alpha_k[k, 0]
+        dz = z_new - z_old
+        grad = self._beta[k, t] + alpha_k * z_old
+        self._obj += (grad + alpha_k * dz / 2) * dz + self.pb.lmbd * (
+            abs(z_new) - abs(z_old))
+
     def _update_beta(self, dz, k, t):
         '''Update the univariates optim solution
         '''
@@ -52,5 +178,20 @@ class CoordinateDescent(_LassoSolver):
         off = max(0, self.s-t-1)
         d = max(0, t-self.s+1)
         ll = len(self._beta[k, d:t+self.s])
-        self._beta[:, d:t+self.s] -= self.DD[:, k, off:off+ll]*dz
+        if self.DD_blocks is None and self._DD_lower is None:
+            self._beta[:, d:t+self.s] -= self.pb.get_DD(k)[:, off:off+ll]*dz
+        elif self.DD_blocks is None:
+            DD, lower = self.pb.DD, self._DD_lower[k]
+            n = DD.shape[-1]
+            self._beta[:k+1, d:t+self.s] -= DD[lower, off:off+ll]*dz
+            self._beta[k+1:, d:t+self.s] -= (
+                DD[lower[-1]+1:lower[-1]+self.K-k, n-off-ll:n-off][:, ::-1]*dz)
+        elif dz != 0:
+            ks, t_start, t_end, DD_k = self.DD_blocks[k]
+            t0, t1 = max(t_start, off), min(t_end, off+ll)
+            self._beta[ks, d+t0-off:d+t1-off] -= (
+                DD_k[:, t0-t_start:t1-t_start]*dz)
+            self._beta_exact = False
+            self._dz_skipped[k, t] += dz
+            self._beta_err[t] += self._DD_skipped[k] * abs(dz)
         self._beta[k, t] = pz
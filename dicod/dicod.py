@@ -1,12 +1,19 @@
 #!/usr/bin/env python
+import json
 import logging
+import itertools
+import threading
 import numpy as np
-from time import time
-from mpi4py import MPI
+from copy import copy
+from time import time, sleep
+from concurrent.futures import Future
 
 
 from ._lasso_solver import _LassoSolver
-from .c_dicod.mpi_pool import get_reusable_pool
+from .c_dicod.mpi_pool import MPI, BROKEN, get_reusable_pool
+from .utils import DD_blocks, replay_updates
+from .multivariate_convolutional_coding_problem import pack_problems, \
+    unpack_problems
 
 
 log = logging.getLogger('dicod')
@@ -14,6 +21,106 @@ log = logging.getLogger('dicod')
 ALGO_GS = 0
 ALGO_RANDOM = 1
 
+# Tags of the batch mode messages, see c_dicod/dicod.h
+TAG_TASK = 4300
+TAG_TASK_REQ = 4301
+TAG_TASK_RESULT = 4302
+
+# Control messages of the root during a solve, see c_dicod/dicod.h
+TAG_CTRL = 4303
+TAG_SNAPSHOT = 4304
+CTRL_INTERRUPT = 0
+CTRL_SNAPSHOT = 1
+
+# Chunks of updates streamed by the workers when logging, see
+# c_dicod/update_log.h
+TAG_LOG = 4305
+LOG_DTYPE = np.dtype([('i0', np.int64), ('t', np.float32),
+                      ('dz', np.float64), ('skip', np.int32)])
+
+# Performance counters of each worker, in the order of c_dicod/dicod.h
+STATS_DTYPE = np.dtype([
+    ('updates', np.int64), ('zero_steps', np.int64),
+    ('up_sent_left', np.int64), ('up_sent_right', np.int64),
+    ('up_recv_left', np.int64), ('up_recv_right', np.int64),
+    ('bytes_sent', np.int64), ('beta_neigh', np.int64), ('probes', np.int64),
+    ('t_queue', np.float64), ('t_paused', np.float64),
+    ('t_init_algo', np.float64), ('t_cost', np.float64),
+    ('t_reduce', np.float64), ('max_rss', np.int64)])
+
+# Events of the timeline of the workers, in the order of c_dicod/trace.h.
+# The spans have the phase 'X' and the instants the phase 'i'.
+TRACE_EVENTS = [('compute', 'X'), ('queue', 'X'), ('paused', 'X'),
+                ('barrier', 'X'), ('init', 'X'), ('cost', 'X'),
+                ('probe', 'i'), ('wake', 'i')]
+
+# Identifiers of the runs, to drop the control messages of a finished one
+_run_ids = itertools.count()
+
+
+class _UpdateLog(object):
+    '''Receive the chunks of updates streamed by the workers during a solve
+
+    Parameters
+    ----------
+    comm: MPI.Intercomm
+        Communicator with the workers
+    n_jobs: int
+        Number of workers sending a log, 0 if the logging is disabled
+    '''
+    def __init__(self, comm, n_jobs):
+        self.comm = comm
+        self.n_open = n_jobs
+        self.chunks = []
+        self._status = MPI.Status()
+
+    def recv(self, block=False):
+        '''Receive the available chunks, or all the remaining ones if block
+        '''
+        status = self._status
+        while self.n_open > 0:
+            if block:
+                self.comm.Probe(MPI.ANY_SOURCE, TAG_LOG, status)
+            elif not self.comm.Iprobe(MPI.ANY_SOURCE, TAG_LOG, status):
+                return
+            msg = np.empty(status.Get_count(MPI.BYTE), 'u1')
+            self.comm.Recv([msg, MPI.BYTE], status.Get_source(), TAG_LOG)
+            n = int(msg[:8].view(np.int64)[0])
+            if n == 0:
+                self.n_open -= 1
+                continue
+            chunk = np.empty(n, LOG_DTYPE)
+            off = 8
+            for name in ['i0', 'dz', 't', 'skip']:
+                dtype = LOG_DTYPE[name]
+                chunk[name] = np.frombuffer(msg, dtype, n, off)
+                off += n * dtype.itemsize
+            self.chunks += [chunk]
+
+    def wait(self, req):
+        '''Receive the chunks until the request req completes
+        '''
+        while not req.Test():
+            self.recv()
+            sleep(.001)
+
+    def updates(self):
+        '''All the updates received, ordered by time
+        '''
+        self.recv(block=True)
+        if len(self.chunks) == 0:
+            return np.empty(0, LOG_DTYPE)
+        updates = np.concatenate(self.chunks)
+        return updates[np.argsort(updates['t'], kind='mergesort')]
+
+
+class _FitFuture(Future):
+    '''Future of DICOD.fit_async, which can control the running solve'''
+    def __init__(self, solver):
+        super(_FitFuture, self).__init__()
+        self.interrupt = solver.interrupt
+        self.snapshot = solver.snapshot
+
 
 class DICOD(_LassoSolver):
     """MPI implementation of the distributed convolutional pursuit
@@ -33,6 +140,17 @@ class DICOD(_LassoSolver):
         cost curve
     debug: int, optional (default: 0)
         verbosity level
+    DD_threshold: float, optional (default: 0)
+        If > 0, only update beta with the blocks of DD larger than
+        DD_threshold times the largest cross-correlation of each atom.
+        The skipped updates are applied before a worker pauses, and
+        before an update they could change by more than half.
+    beta_refresh: int, optional (default: 1000)
+        With DD_threshold > 0, apply the skipped updates every
+        beta_refresh iterations.
+    trace: bool, optional (default: False)
+        Record the timeline of the activity of each worker during fit,
+        see trace_events.
 
     kwargs
     ------
@@ -40,11 +158,28 @@ class DICOD(_LassoSolver):
     max_iter: int, default: 1000
     timeout: int default: 40
 
+    Attributes
+    ----------
+    stats: numpy.recarray
+        After fit, the performance counters of each worker with the fields
+        of STATS_DTYPE: updates and steps without update, UP messages sent
+        and received per neighbor, bytes sent, coefficients of beta updated
+        by the neighbors, probe rounds, the time spent in process_queue,
+        paused, in _init_algo, compute_cost and reduce_pt and the peak
+        resident memory of the worker in bytes.
+        pandas.DataFrame(stats) gives a table with one row per worker.
+    trace_events: list of dict
+        With trace, after fit, the spans and instants of each worker and of
+        the root in the Chrome trace event format, with timestamps in
+        microseconds from t_start. save_trace writes them in
+        a file for chrome://tracing or Perfetto.
+
     """
 
     def __init__(self, n_jobs=1, use_seg=1, hostfile=None,
                  logging=False, debug=0, positive=False,
-                 algorithm=ALGO_GS, patience=1000, **kwargs):
+                 algorithm=ALGO_GS, patience=1000, DD_threshold=0,
+                 beta_refresh=1000, trace=False, **kwargs):
         super(DICOD, self).__init__(debug=debug, **kwargs)
         self.debug = debug
         self.n_jobs = n_jobs
@@ -54,6 +189,14 @@ class DICOD(_LassoSolver):
         self.positive = 1 if positive else 0
         self.algorithm = algorithm
         self.patience = 1000
+        self.DD_threshold = DD_threshold
+        if beta_refresh < 1:
+            raise ValueError("beta_refresh should be >= 1, got {}"
+                             .format(beta_refresh))
+        self.beta_refresh = beta_refresh
+        self.trace = 1 if trace else 0
+        self._running = False
+        self._ctrl_lock = threading.Lock()
         if self.name == '_GD' + str(self.id):
             self.name = 'MPI_DCP' + str(self.n_jobs) + '_' + str(self.id)
 
@@ -64,51 +207,230 @@ class DICOD(_LassoSolver):
         self.end()
         return self.pb.DD
 
-    def _init_pool(self):
+    def fit_async(self, pb):
+        '''Start solving pb and return without waiting for the workers
+
+        The task is sent to the pool in the calling thread. The result is
+        then gathered, and the cost curve replayed if logging, in a
+        background thread, so the next problem can be prepared meanwhile.
+        With a split pool, the next call leases another sub-group and sends
+        its signal while the current problem is solved.
+
+        Return
+        ------
+        future: concurrent.futures.Future
+            Future of a dict with the code pt, the cost, the number of
+            iterations, the runtime and the cost_curve of the solver. Its
+            interrupt and snapshot methods control the running solve.
+        '''
+        solver = copy(self)
+        solver.reset()
+        solver.pb = pb
+        solver._ctrl_lock = threading.Lock()
+        solver._running = False
+        solver._pool = None
+        future = _FitFuture(solver)
+        try:
+            solver._init_pool()
+        except BaseException:
+            solver._abort_task()
+            raise
+
+        def _end():
+            try:
+                solver.end()
+                future.set_result(dict(
+                    pt=pb.pt, cost=solver.cost, iteration=solver.iteration,
+                    runtime=solver.runtime, cost_curve=solver.cost_curve))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=_end, daemon=True).start()
+        return future
+
+    def map(self, problems):
+        '''Solve a batch of independent problems sharing the same dictionary
+
+        The dictionary is sent once to the pool. Then each worker pulls the
+        next problem of the queue as soon as it is free and solves it alone,
+        which is faster than fit for many short signals.
+
+        Parameters
+        ----------
+        problems: list of _Problem
+            Problems with the same dictionary D. The codes computed are
+            stored in their pt attribute.
+
+        Return
+        ------
+        cost: list of float
+            Final cost of each problem
+        '''
+        self.reset()
+        self.pb = pb = problems[0]
+        for p in problems[1:]:
+            assert p.D is pb.D or np.array_equal(p.D, pb.D), (
+                "All the problems of a batch should share the same dictionary")
+        self._init_pool(msg_type=5, send_task=False)
+        K, S = self.K, self.S
+        self._send_dictionary(pb, T=0, max_iter=self.max_iter, logging=0)
+
+        # Dynamic scheduling: answer the requests of the free workers with
+        # the next problem, or with -1 once the queue is empty
+        n_pbs = len(problems)
+        cost = np.empty(n_pbs)
+        self.iterations = np.empty(n_pbs, 'i')
+        self.times = np.empty(n_pbs)
+        header = np.empty(2, 'i')
+        stats = np.empty(2, 'd')
+        status = MPI.Status()
+        next_pb, n_active = 0, self.n_jobs
+        while n_active > 0:
+            self.comm.Recv([header, MPI.INT], MPI.ANY_SOURCE, TAG_TASK_REQ,
+                           status=status)
+            src = status.Get_source()
+            i_pb, n_iter = header
+            if i_pb >= 0:
+                pb_i = problems[i_pb]
+                pt = np.empty(K * (pb_i.x.shape[1] - S + 1), 'd')
+                self.comm.Recv([pt, MPI.DOUBLE], src, TAG_TASK_RESULT)
+                self.comm.Recv([stats, MPI.DOUBLE], src, TAG_TASK_RESULT)
+                pb_i.pt = pt.reshape((K, -1))
+                cost[i_pb], self.times[i_pb] = stats
+                self.iterations[i_pb] = n_iter
+
+            if next_pb < n_pbs:
+                pb_i = problems[next_pb]
+                task = np.r_[pb_i.lmbd, np.array(pb_i.x, 'd').flatten()]
+                task_header = np.array([next_pb, pb_i.x.shape[1]], 'i')
+                self.comm.Send([task_header, MPI.INT], src, TAG_TASK)
+                self.comm.Send([task, MPI.DOUBLE], src, TAG_TASK)
+                next_pb += 1
+            else:
+                task_header = np.array([-1, 0], 'i')
+                self.comm.Send([task_header, MPI.INT], src, TAG_TASK)
+                n_active -= 1
+
+        self.comm.Barrier()
+        self._release_pool()
+        self.cost = np.sum(cost)
+        self.iteration = np.sum(self.iterations)
+        self.runtime = time() - self.t_start
+        log.info('End batch of {} problems for {} : iteration {}, time {:.4}s'
+                 .format(n_pbs, self, self.iteration, self.runtime))
+        return list(cost)
+
+    def fit_packed(self, problems):
+        '''Solve a batch of problems sharing the same dictionary and lmbd as
+        one problem
+
+        The signals are concatenated, see pack_problems, and solved with one
+        fit, which avoids the initialization of the workers for each of
+        them. The codes computed are stored in their pt attribute.
+
+        Return
+        ------
+        cost: list of float
+            Final cost of each problem
+        '''
+        packed = pack_problems(problems)
+        self.fit(packed)
+        return unpack_problems(packed, problems)
+
+    def fit_path(self, pb, lmbds):
+        '''Solve pb for a decreasing sequence of regularization parameters
+
+        The workers keep the signal and the code between two values of
+        lmbd, so each solve is warm started from the previous solution and
+        only the non zero coefficients of the code are sent back. At the
+        end, pb.lmbd and pb.pt are the last lmbd and its code.
+
+        Parameters
+        ----------
+        pb: _Problem
+            Problem to solve
+        lmbds: list of float
+            Values of the regularization parameter, solved in this order
+
+        Return
+        ------
+        path: list of dict
+            For each lmbd, the code pt, its cost, the number of iterations
+            and the runtime of the solve
+        '''
+        self.reset()
+        self.pb = pb
+        pb.lmbd = lmbds[0]
+        self._init_pool(msg_type=7, send_task=False)
+        # The updates are not logged along the path
+        self.send_task(logging=False)
+        # The control messages are not handled between two solves
+        with self._ctrl_lock:
+            self._running = False
+
+        path = []
+        for i, lmbd in enumerate(lmbds):
+            if i > 0:
+                self.comm.Bcast([np.array([lmbd], 'd'), MPI.DOUBLE],
+                                root=MPI.ROOT)
+            pt, iterations, times = self._recv_code()
+            self.comm.Barrier()
+            pb.lmbd = lmbd
+            path += [dict(lmbd=lmbd, pt=pt, cost=pb.cost(pt),
+                          iteration=iterations.sum(), runtime=times.max())]
+            log.debug('Path - lmbd {:.4}: cost {:.4}, iteration {}, '
+                      'time {:.4}s'.format(lmbd, path[-1]['cost'],
+                                           path[-1]['iteration'],
+                                           path[-1]['runtime']))
+
+        self.comm.Bcast([np.array([-1.]), MPI.DOUBLE], root=MPI.ROOT)
+        self._release_pool()
+        pb.pt = path[-1]['pt']
+        self.cost = path[-1]['cost']
+        self.iteration = sum([res['iteration'] for res in path])
+        self.runtime = time() - self.t_start
+        log.info('End path of {} lmbd for {} : iteration {}, time {:.4}s'
+                 .format(len(lmbds), self, self.iteration, self.runtime))
+        return path
+
+    def _init_pool(self, msg_type=3, send_task=True):
         '''Launch n_jobs process to compute the convolutional
         coding solution with MPI process
         '''
         # Rename to call local variables
         self.K, self.d, self.S = self.pb.D.shape
 
+        # Compute the constants of the problem before reserving the pool,
+        # so an error does not leave the workers in the middle of a task
+        assert self.pb.DD is not None
+
         # Create a pool of worker
         t_start_init_pool = time()
         self._pool = get_reusable_pool(self.n_jobs, self.hostfile)
+        self._pool.busy.acquire()
         self.comm = self._pool.comm
-        msg = np.array([3] * 4).astype('i')  # Construct start message
+        msg = np.array([msg_type] * 4).astype('i')  # Construct start message
         self._pool.mng_bcast(msg)
         self.t_init_pool = time() - t_start_init_pool
         log.debug('Created pool of worker in {:.4}s'.format(self.t_init_pool))
 
         # Send the job to process
         self.t_start = time()
-        self.send_task()
+        if send_task:
+            self.send_task()
 
-    def send_task(self):
+    def send_task(self, logging=None):
+        if logging is None:
+            logging = self.logging
         self.K, self.d, self.S = self.pb.D.shape
         pb = self.pb
-        K, d, S = self.K, self.d, self.S
+        S = self.S
         T = pb.x.shape[1]
         L = T - S + 1
 
         # Share constants
-        assert self.pb.DD is not None
-        alpha_k = np.sum(np.mean(pb.D * pb.D, axis=1), axis=1)
-        alpha_k += (alpha_k == 0)
-
-        self._broadcast_array(alpha_k)
-        self._broadcast_array(pb.DD)
-        self._broadcast_array(pb.D)
-
-        # Send the constants of the algorithm
         max_iter = max(1, self.max_iter // self.n_jobs)
-        N = np.array([float(d), float(K), float(S), float(T),
-                      self.pb.lmbd, self.tol, float(self.timeout),
-                      float(max_iter), float(self.debug), float(self.logging),
-                      float(self.use_seg), float(self.positive),
-                      float(self.algorithm), float(self.patience)],
-                     'd')
-        self._broadcast_array(N)
+        self._send_dictionary(pb, T, max_iter, logging)
 
         # Share the work between the processes
         sig = np.array(pb.x, dtype='d')
@@ -124,18 +446,144 @@ class DICOD(_LassoSolver):
 
         # Wait end of initialisation
         self.comm.Barrier()
-        self.t_init = time() - self.t_start
+        self._t_sync = time()
+        self.t_init = self._t_sync - self.t_start
+        self._pool.timings.setdefault('handshake', self.t_init)
         log.debug('End initialisation - {:.4}s'.format(self.t_init))
+        self._update_log = _UpdateLog(
+            self.comm, self.n_jobs if logging else 0)
+        with self._ctrl_lock:
+            self._running = True
+
+    def _abort_task(self):
+        '''Free the pool after a failure in _init_pool'''
+        if self._pool is None:
+            return
+        if self._running:
+            self.end()
+        else:
+            # The workers may wait for the rest of the task, so the next
+            # get_reusable_pool spawns a new pool
+            self._pool._state = BROKEN
+            self._release_pool()
+
+    def interrupt(self):
+        '''Stop the running fit, which returns the current code
+
+        Return
+        ------
+        interrupted: bool
+            False if the fit had already ended
+        '''
+        with self._ctrl_lock:
+            if not self._running:
+                return False
+            self._send_ctrl(CTRL_INTERRUPT)
+        return True
+
+    def snapshot(self):
+        '''Current code of the running fit, without pausing the workers
+
+        Return
+        ------
+        snapshot: dict or None
+            The code pt, its cost and the iterations and runtime of each
+            worker. None if the fit has ended.
+        '''
+        with self._ctrl_lock:
+            if not self._running:
+                return None
+            self._send_ctrl(CTRL_SNAPSHOT)
+            pt, iterations, times = self._recv_code()
+        return dict(pt=pt, cost=self.pb.cost(pt), iterations=iterations,
+                    times=times)
+
+    def _recv_code(self):
+        '''Receive the non zero coefficients of the code from each worker,
+        with their iterations and times
+        '''
+        K, L = self.K, self.L
+        pt = np.zeros(K * L)
+        iterations = np.empty(self.n_jobs, 'i')
+        times = np.empty(self.n_jobs)
+        status = MPI.Status()
+        for i in range(self.n_jobs):
+            self.comm.Probe(i, TAG_SNAPSHOT, status)
+            msg = np.empty(status.Get_count(MPI.DOUBLE))
+            self.comm.Recv([msg, MPI.DOUBLE], i, TAG_SNAPSHOT)
+            iterations[i], times[i], nnz = msg[:3]
+            nnz = int(nnz)
+            pt[msg[3:3 + nnz].astype(int)] = msg[3 + nnz:]
+        return pt.reshape((K, L)), iterations, times
+
+    def _send_ctrl(self, ctrl):
+        msg = np.array([ctrl, self._run_id], 'i')
+        for i in range(self.n_jobs):
+            self.comm.Send([msg, MPI.INT], i, TAG_CTRL)
+
+    def _send_dictionary(self, pb, T, max_iter, logging):
+        '''Share the dictionary and the constants of the algorithm
+        '''
+        K, d, S = pb.D.shape
+        assert pb.DD is not None
+        masked = getattr(pb, 'masked', [])
+        alpha_k = np.sum(np.mean(pb.D * pb.D, axis=1), axis=1)
+        alpha_k += (alpha_k == 0)
+        self._run_id = next(_run_ids)
+
+        self._broadcast_array(alpha_k)
+        self._broadcast_array(pb.DD)
+        self._broadcast_array(pb.D)
+
+        # Send the constants of the algorithm
+        N = np.array([float(d), float(K), float(S), float(T),
+                      pb.lmbd, self.tol, float(self.timeout),
+                      float(max_iter), float(self.debug), float(logging),
+                      float(self.use_seg), float(self.positive),
+                      float(self.algorithm), float(self.patience),
+                      float(getattr(pb, 'packed_DD', False)),
+                      float(self.DD_threshold), float(self.beta_refresh),
+                      float(self._run_id), float(len(masked)),
+                      float(self.trace)],
+                     'd')
+        self._broadcast_array(N)
+
+        # Send the significant blocks of DD as the offsets of the blocks
+        # of each atom followed by the triplets (k, t_start, t_end)
+        if self.DD_threshold > 0:
+            blocks = DD_blocks(pb.DD, self.DD_threshold,
+                               packed=getattr(pb, 'packed_DD', False))
+            blk_off = np.cumsum([0] + [len(b) for b in blocks])
+            self._broadcast_array(np.r_[blk_off, np.ravel(sum(blocks, []))])
+
+        # Send the intervals of the code kept at 0
+        if len(masked) > 0:
+            self._broadcast_array(masked)
 
     def end(self):
-        # reduce_pt
-        self.comm.Barrier()
+        # Wait for the end of the computation, then stop sending control
+        # messages before releasing the workers. The log of the updates is
+        # received meanwhile.
+        self._t_end = time()
+        self._update_log.wait(self.comm.Ibarrier())
+        with self._ctrl_lock:
+            self._running = False
+        self._update_log.wait(self.comm.Ibarrier())
         log.debug("End computation, gather result")
 
         self._gather()
+        self._release_pool()
+
+        # Replay the updates once the pool is free for the next task
+        if self.logging:
+            self._log()
 
         log.debug("DICOD - Clean end")
 
+    def _release_pool(self):
+        self._pool.busy.release()
+        self._pool.release()
+
     def _gather(self):
         K, L, L_proc = self.K, self.L, self.L_proc
         pt = np.empty((K, L), 'd')
@@ -159,6 +607,15 @@ class DICOD(_LassoSolver):
                          root=MPI.ROOT)
         self.comm.Gather(None, [init_times, MPI.DOUBLE],
                          root=MPI.ROOT)
+        n_stats = len(STATS_DTYPE)
+        stats = np.empty((self.n_jobs, n_stats), 'd')
+        self.comm.Gatherv(None, [stats, [n_stats] * self.n_jobs,
+                                 np.arange(self.n_jobs) * n_stats,
+                                 MPI.DOUBLE], root=MPI.ROOT)
+        self.stats = np.rec.fromarrays(
+            [stats[:, i] for i in range(n_stats)], dtype=STATS_DTYPE)
+        if self.trace:
+            self._recv_trace()
         self.cost = np.sum(cost)
         self.iteration = np.sum(iterations)
         self.time = times.max()
@@ -171,38 +628,70 @@ class DICOD(_LassoSolver):
                  .format(self, self.iteration, self.time))
 
         if self.logging:
-            self._log(iterations)
+            self.log_update = self._update_log.updates()
 
         self.comm.Barrier()
         self.runtime = time()-self.t_start
         log.debug('Total time: {:.4}s'.format(self.runtime))
 
-    def _log(self, iterations):
-        self.comm.Barrier()
-        pb, L = self.pb, self.L
-        updates, updates_t, updates_skip = [], [], []
-        for id_worker, n_iter in enumerate(iterations):
-            _log = np.empty(4 * n_iter)
-            self.comm.Recv([_log, MPI.DOUBLE], id_worker, tag=300 + id_worker)
-            updates += [(int(_log[4 * i]), _log[4 * i + 2])
-                        for i in range(n_iter)]
-            updates_t += [_log[4 * i + 1] for i in range(n_iter)]
-            updates_skip += [_log[4 * i + 3] for i in range(n_iter)]
-
-        i0 = np.argsort(updates_t)
-        self.next_log = 1
-        pb.reset()
+    def _recv_trace(self):
+        '''Receive the timeline of each worker and merge them with the one
+        of the root in trace_events
+
+        The times of a worker are relative to the end of the barrier of
+        send_task, which is taken as the same instant on the root.
+        '''
+        header = np.empty((self.n_jobs, 2), 'd')
+        self.comm.Gather(None, [header, MPI.DOUBLE], root=MPI.ROOT)
+        counts = 3 * header[:, 0].astype(int)
+        events = np.empty(counts.sum(), 'd')
+        self.comm.Gatherv(None, [events, counts, np.cumsum(counts) - counts,
+                                 MPI.DOUBLE], root=MPI.ROOT)
+        if header[:, 1].any():
+            log.warning('Trace - dropped {} events of the workers'
+                        .format(int(header[:, 1].sum())))
+
+        # Root in process 0 and the workers in process 1, one thread per
+        # rank. The timestamps are in microseconds from t_start.
+        sync = self._t_sync - self.t_start
+        trace = [dict(name='process_name', ph='M', pid=0, tid=0,
+                      args=dict(name='root')),
+                 dict(name='process_name', ph='M', pid=1, tid=0,
+                      args=dict(name='workers')),
+                 dict(name='init', ph='X', pid=0, tid=0, ts=0,
+                      dur=sync * 1e6),
+                 dict(name='wait', ph='X', pid=0, tid=0,
+                      ts=(self._t_end - self.t_start) * 1e6,
+                      dur=(time() - self._t_end) * 1e6)]
+        off = 0
+        for rank, count in enumerate(counts):
+            trace += [dict(name='thread_name', ph='M', pid=1, tid=rank,
+                           args=dict(name='worker {}'.format(rank)))]
+            for ev, t, dur in events[off:off + count].reshape(-1, 3):
+                name, ph = TRACE_EVENTS[int(ev)]
+                event = dict(name=name, ph=ph, pid=1, tid=rank,
+                             ts=(sync + t) * 1e6)
+                if ph == 'X':
+                    event['dur'] = dur * 1e6
+                else:
+                    event['s'] = 't'
+                trace += [event]
+            off += count
+        self.trace_events = trace
+
+    def save_trace(self, fname):
+        '''Write the trace_events of the last fit in fname, in the JSON
+        format read by chrome://tracing and Perfetto
+        '''
+        with open(fname, 'w') as f:
+            json.dump(dict(traceEvents=self.trace_events,
+                           displayTimeUnit='ms'), f)
+
+    def _log(self):
         log.debug('Start logging cost')
-        t = self.t_init
-        it = 0
-        for i in i0:
-            if it + 1 >= self.next_log:
-                self.record(it, t, pb.cost(pb.pt))
-            j, du = updates[i]
-            t = updates_t[i] + self.t_init
-            pb.pt[j // L, j % L] += du
-            it += 1 + updates_skip[i]
-        self.log_update = (updates_t, updates)
+        for it, t, cost in replay_updates(self.pb, self.log_update,
+                                          self.log_rate, self.t_init):
+            self.record(it, t, cost)
         log.debug('End logging cost')
 
     def gather_AB(self):
@@ -2,9 +2,9 @@
 import logging
 import numpy as np
 from time import time
-from mpi4py import MPI
 from ._lasso_solver import _LassoSolver
-from .c_dicod.mpi_pool import get_reusable_pool
+from .c_dicod.mpi_pool import MPI, get_reusable_pool
+from .dicod import DICOD, _UpdateLog
 
 
 log = logging.getLogger('dicod')
@@ -34,6 +34,9 @@ class DICOD2D(_LassoSolver):
         cost curve
     debug: int, optional (default: 0)
         verbosity level
+    trace: bool, optional (default: False)
+        Record the timeline of the activity of each worker during fit,
+        see DICOD.
 
     kwargs
     ------
@@ -45,8 +48,8 @@ class DICOD2D(_LassoSolver):
 
     def __init__(self, n_jobs=1, w_world=1, use_seg=1, hostfile=None,
                  logging=False, debug=0, positive=False,
-                 algorithm=ALGO_GS, patience=1000, **kwargs):
-        super(DICOD2D, self).__init__(None, debug=debug, **kwargs)
+                 algorithm=ALGO_GS, patience=1000, trace=False, **kwargs):
+        super(DICOD2D, self).__init__(debug=debug, **kwargs)
         self.debug = debug
         self.n_jobs = n_jobs
         self.hostfile = hostfile
@@ -55,6 +58,7 @@ class DICOD2D(_LassoSolver):
         self.positive = 1 if positive else 0
         self.algorithm = algorithm
         self.patience = 1000
+        self.trace = 1 if trace else 0
         if self.name == '_GD'+str(self.id):
             self.name = 'MPI_DCP' + str(self.n_jobs) + '_' + str(self.id)
 
@@ -62,11 +66,16 @@ class DICOD2D(_LassoSolver):
         self.h_world = self.n_jobs // self.w_world
 
     def fit(self, pb, DD=None):
+        self.reset()
         self.pb = pb
         DD = self._init_pool(DD=DD)
         self.end()
         return self.pb.DD
 
+    _log = DICOD._log
+    _recv_trace = DICOD._recv_trace
+    save_trace = DICOD.save_trace
+
     def _init_pool(self, DD=None):
         '''Launch n_jobs process to compute the convolutional
         coding solution with MPI process
@@ -85,6 +94,7 @@ class DICOD2D(_LassoSolver):
         self.comm = MPI.COMM_SELF.Spawn(c_prog, maxprocs=self.n_jobs,
                                         info=mpi_info)'''
         self._pool = get_reusable_pool(self.n_jobs, self.hostfile)
+        self._pool.busy.acquire()
         self.comm = self._pool.comm
         self._pool.mng_bcast(np.array([4]*4).astype('i'))
         log.debug('Created pool of worker in {:.4}s'.format(time()-t))
@@ -121,7 +131,9 @@ class DICOD2D(_LassoSolver):
                       self.max_iter/self.n_jobs, float(self.debug),
                       float(self.logging), float(self.use_seg),
                       float(self.positive), float(self.algorithm),
-                      float(self.patience)],
+                      float(self.patience),
+                      float(getattr(pb, 'packed_DD', False)),
+                      float(self.trace)],
                      'd')
         self._broadcast_array(N)
 
@@ -152,12 +164,22 @@ class DICOD2D(_LassoSolver):
 
         # Wait end of initialisation
         self.comm.Barrier()
-        self.t_init = time() - self.t_start
+        self._t_sync = time()
+        self.t_init = self._t_sync - self.t_start
+        self._pool.timings.setdefault('handshake', self.t_init)
         log.debug('End initialisation - {:.4}s'.format(self.t_init))
+        self._update_log = _UpdateLog(
+            self.comm, self.n_jobs if self.logging else 0)
 
     def end(self):
         # reduce_pt
         self._gather()
+        self._pool.busy.release()
+        self._pool.release()
+
+        # Replay the updates once the pool is free for the next task
+        if self.logging:
+            self._log()
         if type(self.t) == int:
             self.t = time()-self.t_start
         return
@@ -170,7 +192,8 @@ class DICOD2D(_LassoSolver):
         h_cod, h_proc = self.h_cod, self.h_proc
         w_cod, w_proc = self.w_cod, self.w_proc
         pt = np.empty((K, h_cod, w_cod), 'd')
-        self.comm.Barrier()
+        self._t_end = time()
+        self._update_log.wait(self.comm.Ibarrier())
         log.debug("End computation, gather result")
         self.t = time()-self.t_start
 
@@ -210,13 +233,14 @@ class DICOD2D(_LassoSolver):
                          root=MPI.ROOT)
         self.comm.Gather(None, [init_times, MPI.DOUBLE],
                          root=MPI.ROOT)
+        if self.trace:
+            self._recv_trace()
         self.t_init += max(init_times)
         self.cost = np.sum(cost)
         self.iteration = np.sum(iterations)
         self.runtime = times.max()
         log.debug("Iterations: {}".format(iterations))
         log.debug("Times{}".format(times))
-        t_end = time()
         self.pb.pt = pt
         self.A = A.reshape((K, K, 2*self.h_dic-1, 2*self.w_dic-1))
         self.B = B.reshape((K, d, self.h_dic, self.w_dic))
@@ -228,43 +252,12 @@ class DICOD2D(_LassoSolver):
         self.runtime += self.t_init
 
         if self.logging:
-            self._log(iterations, t_end)
+            self.log_update = self._update_log.updates()
 
         self.comm.Barrier()
         log.info("Conv sparse coding end in {:.4}s for {} iterations"
                  "".format(self.runtime, self.iteration))
 
-    def _log(self, iterations, t_end):
-        pb, L = self.pb, self.L
-        updates = []
-        for i, it in enumerate(iterations):
-            _log = np.empty(3*it)
-            self.comm.Recv([_log, MPI.DOUBLE], i, tag=TAG_ROOT+i)
-            updates += [(_log[3*j+1], int(_log[3*j]), _log[3*j+2], i)
-                        for j in range(it)]
-        updates = np.array(updates, dtype=[('t', np.float64),
-                                           ('i', np.int64),
-                                           ('z', np.float64),
-                                           ('rank', np.int64)])
-
-        ordered_t = np.argsort(updates)
-        next_log = 1
-        self.log_update = updates[ordered_t]
-        return
-        pb.reset()
-        log.debug('Start logging cost')
-        t = self.t_init
-        for it, i in enumerate(ordered_t):
-            if it+1 >= next_log:
-                log.log_obj(name='cost'+str(self.id), obj=np.copy(pb.pt),
-                            iteration=it+1, fun=pb.cost, time=t)
-                next_log = self.log_rate(it+1)
-            t, i0, dz = updates[i]
-            pb.pt[i0 // L, (i0 % L) // self.w_cod, i0 % self.w_cod] += dz
-        log.log_obj(name='cost'+str(self.id), obj=np.copy(pb.pt),
-                    iteration=it, fun=pb.cost, time=self.runtime+self.t_init)
-        log.debug('End logging cost')
-
     def gather_AB(self):
         K, S, d = self.K, self.S, self.d
         A = np.empty(K*K*S, 'd')
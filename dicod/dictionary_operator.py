@@ -0,0 +1,108 @@
+'''Constants of the 1D problems which only depend on the dictionary, shared
+by the problems using the same dictionary
+
+The operators are cached by the content of the dictionary, so the problems
+built with copies of the same D reference the same arrays instead of
+computing their own. The least recently used operators are dropped from
+the cache when it grows over MAX_CACHE_BYTES.
+'''
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .utils import compute_DD, DD_lipschitz
+from .fft_backend import get_fft_backend
+
+
+MAX_CACHE_BYTES = 2 ** 30
+
+# Operators by content of the dictionary, from the least recently used
+_cache = OrderedDict()
+
+
+class DictionaryOperator(object):
+    '''Constants of a dictionary D, computed on first use
+
+    The arrays are read-only as they are shared by several problems.
+
+    Parameters
+    ----------
+    D: array-like (n_dict (K), n_dim(d), length(S))
+        dictionary of the problems
+    '''
+    def __init__(self, D):
+        self.D = np.array(D)
+        self.D.flags.writeable = False
+        self._spectra = {}
+        self._DD = {}
+
+    def spectra(self, fft_shape):
+        '''Return D_fft [K, d, F] and DtD [F, K, K] for the size fft_shape,
+        see MultivariateConvolutionalCodingProblem
+        '''
+        if fft_shape not in self._spectra:
+            p = self.D.shape[1]
+            D_fft = get_fft_backend().rfft(self.D, n=fft_shape)
+            DtD = np.ascontiguousarray(
+                np.einsum('kpf,jpf->fkj', D_fft.conj(), D_fft)) / p
+            self._spectra[fft_shape] = _read_only(D_fft, DtD)
+            _shrink_cache()
+        return self._spectra[fft_shape]
+
+    def get_DD(self, packed=False, dtype=np.float64):
+        '''Return DD, see compute_DD'''
+        return self._get_DD_L(packed, dtype)[0]
+
+    def get_L(self, packed=False, dtype=np.float64):
+        '''Return the Lipschitz constant of DD, see DD_lipschitz'''
+        return self._get_DD_L(packed, dtype)[1]
+
+    def _get_DD_L(self, packed, dtype):
+        key = (packed, np.dtype(dtype).str)
+        if key not in self._DD:
+            DD = compute_DD(self.D, packed=packed, dtype=dtype)
+            self._DD[key] = (_read_only(DD)[0],
+                             DD_lipschitz(DD, packed=packed))
+            _shrink_cache()
+        return self._DD[key]
+
+    @property
+    def nbytes(self):
+        '''Size in bytes of the cached arrays'''
+        return (self.D.nbytes +
+                sum(a.nbytes for s in self._spectra.values() for a in s) +
+                sum(DD.nbytes for DD, _ in self._DD.values()))
+
+
+def get_dictionary_operator(D):
+    '''Return the cached DictionaryOperator of the dictionary D'''
+    D = np.ascontiguousarray(D)
+    key = (hashlib.sha1(D.view(np.uint8)).hexdigest(), D.shape, D.dtype.str)
+    op = _cache.pop(key, None)
+    if op is None:
+        op = DictionaryOperator(D)
+    _cache[key] = op
+    _shrink_cache()
+    return op
+
+
+def clear_dictionary_cache():
+    '''Drop all the cached operators. The problems keep their operator.'''
+    _cache.clear()
+
+
+def _shrink_cache():
+    '''Drop the least recently used operators, but the last one, until the
+    cache uses less than MAX_CACHE_BYTES
+    '''
+    nbytes = sum(op.nbytes for op in _cache.values())
+    while len(_cache) > 1 and nbytes > MAX_CACHE_BYTES:
+        _, op = _cache.popitem(last=False)
+        nbytes -= op.nbytes
+
+
+def _read_only(*arrays):
+    for a in arrays:
+        a.flags.writeable = False
+    return arrays
@@ -1,12 +1,11 @@
 import logging
 import numpy as np
 from numpy import linalg as LA
-from numpy.fft import rfft as fft, irfft as ifft
 
 
 from .utils import l1, l2
 from ._lasso_solver import _LassoSolver
-from .multivariate_convolutional_coding_problem import next_fast_len
+from .fft_backend import get_fft_backend, next_fast_len
 
 
 log = logging.getLogger('dicod')
@@ -47,11 +46,12 @@ class FCSC(_LassoSolver):
         shape = X.shape[-1] + D.shape[-1] - 1
 
         # Frequential domain representation
+        fft = get_fft_backend()
         self.fft_shape = fft_shape = next_fast_len(shape)
-        Xh = fft(X, n=fft_shape)
+        Xh = fft.rfft(X, n=fft_shape)
         w = Xh.shape[-1]
         self.z_fft_shape = (K, ) + Xh.shape[-1:]
-        self.D_fft = D_fft = fft(D, n=fft_shape)
+        self.D_fft = D_fft = fft.rfft(D, n=fft_shape)
 
         # Precompute constants to accelerate frequency domain computations
         self.DtD_fft = (D_fft[:, None].conj() * D_fft[None]).mean(axis=2)
@@ -67,7 +67,7 @@ class FCSC(_LassoSolver):
                                self.DtD_fft.swapaxes(0, 1).T),
                               self.Dtx_fft.T).T
         assert self.z_fft.shape == (K, w), (self.z_fft.shape, K, w)
-        self.z = ifft(self.z_fft)[self.z_slice]
+        self.z = fft.irfft(self.z_fft, n=fft_shape)[self.z_slice]
 
         self.t = np.copy(self.z)
         self.t_fft = np.copy(self.z_fft)
@@ -82,8 +82,8 @@ class FCSC(_LassoSolver):
 
         self._t_subproblem()
         self.lambda_t += self.z - self.t
-        self.lambda_fft = fft(self.lambda_t, n=self.fft_shape).reshape(
-            (self.K, -1))
+        self.lambda_fft = get_fft_backend().rfft(
+            self.lambda_t, n=self.fft_shape).reshape((self.K, -1))
 
         self.mu_t = min(self.tau * self.mu_t, MU_MAX)
         self.pb.pt = self.z
@@ -94,8 +94,9 @@ class FCSC(_LassoSolver):
                                                       axes=(2, 0, 1))
         b = (self.Dtx_fft + self.mu_t * (self.t_fft - self.lambda_fft)).T
         self.z_fft = LA.solve(A, b).T
-        self.z = ifft(self.z_fft.reshape(self.z_fft_shape)
-                      )[self.z_slice]
+        self.z = get_fft_backend().irfft(
+            self.z_fft.reshape(self.z_fft_shape), n=self.fft_shape
+        )[self.z_slice]
 
     def _t_subproblem(self):
         if self.mu_t > 0:
@@ -104,7 +105,8 @@ class FCSC(_LassoSolver):
         else:
             self.t[:] = 0
 
-        self.t_fft = fft(self.t, n=self.fft_shape).reshape((self.K, -1))
+        self.t_fft = get_fft_backend().rfft(
+            self.t, n=self.fft_shape).reshape((self.K, -1))
 
     @staticmethod
     def _prox(z, mu):
@@ -115,13 +117,14 @@ class FCSC(_LassoSolver):
         '''
         L = self.L
         lmbd = self.pb.lmbd
-        grad = self.pb.grad(self.yn)
         if self.fixe:
+            grad = self.pb.grad(self.yn)
             return self.pb.prox(self.yn - self.alpha * grad,
                                 lmbd * self.alpha)
 
-        fy = self.pb.x - self.pb.reconstruct(self.yn)
-        fy = np.sum(fy * fy) / 2
+        # Smooth part of the cost at yn, with the same FFT as the gradient
+        grad, fy = self.pb.grad_and_cost(self.yn)
+        fy -= lmbd * l1(self.yn)
 
         def prox(L):
             return self.pb.prox(self.yn - grad / L, lmbd / L)
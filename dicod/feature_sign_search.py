@@ -53,7 +53,6 @@ class FSS(_LassoSolver):
         _, self.d, self.s = self.pb.D.shape
         self.L = len(self.pb.x) - self.s + 1
 
-        self.DD = self.pb.DD
         self.B = np.array([np.mean([np.convolve(dk, xk, 'valid')
                                    for dk, xk in zip(d, self.pb.x)], axis=0)
                            for d in self.pb.D[:, :, ::-1]])
@@ -146,10 +145,11 @@ class FSS(_LassoSolver):
         self.b_fs = np.zeros(num_activ)
         self.pt_fs = np.zeros(num_activ)
         self.pt_sign = np.zeros(num_activ)
+        DD = {k: self.pb.get_DD(k) for k, _ in self.active_indices}
         for i, (ind_i1, ind_t1) in enumerate(self.active_indices):
             for j, (ind_i2, ind_t2) in enumerate(self.active_indices):
                 if 0 <= (ind_t2-ind_t1+(self.s-1)) < 2*self.s-1:
-                    Dv = self.DD[ind_i1][ind_i2][ind_t1-ind_t2+(self.s-1)]
+                    Dv = DD[ind_i2][ind_i1][ind_t1-ind_t2+(self.s-1)]
                 else:
                     Dv = 0
                 self.A_fs[i, j] = Dv
@@ -68,13 +68,14 @@ class FISTA(_LassoSolver):
         '''
         L = self.L
         lmbd = self.pb.lmbd
-        grad = self.pb.grad(self.yn)
         if self.fixe:
+            grad = self.pb.grad(self.yn)
             return self.pb.prox(self.yn - self.alpha * grad,
                                 lmbd * self.alpha)
 
-        fy = self.pb.x - self.pb.reconstruct(self.yn)
-        fy = np.sum(fy * fy) / 2
+        # Smooth part of the cost at yn, with the same FFT as the gradient
+        grad, fy = self.pb.grad_and_cost(self.yn)
+        fy -= lmbd * l1(self.yn)
 
         def prox(L):
             return self.pb.prox(self.yn - grad / L, lmbd / L)
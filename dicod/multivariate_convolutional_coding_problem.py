@@ -1,8 +1,9 @@
 import numpy as np
-from numpy.fft import rfft as fft, irfft as ifft
 
 from ._problem import _Problem
-from scipy.signal import fftconvolve
+from .utils import DD_row
+from .fft_backend import get_fft_backend, next_fast_len  # noqa: F401
+from .dictionary_operator import get_dictionary_operator
 
 
 class MultivariateConvolutionalCodingProblem(_Problem):
@@ -21,8 +22,35 @@ class MultivariateConvolutionalCodingProblem(_Problem):
     nonneg: bool, optional (default: False)
         Use the proximal operator to shrink in a non-negative
         way.
+    packed_DD: bool, optional (default: False)
+        Only store the pairs k <= k' of DD, using the symmetry
+        DD[k, k'](t) = DD[k', k](-t). Use get_DD to access DD[:, k].
+    DD_dtype: numpy dtype, optional (default: float64)
+        Precision used to store DD.
+    block_size: int or None, optional (default: None)
+        If set, grad, cost, reconstruct and grad_D process the signal by
+        overlap-save blocks of block_size positions of the code, and the
+        spectra are only stored for the FFT size of a block. Their memory
+        is then O(K^2 block_size) instead of O(K^2 T), for very long
+        signals. D^Tx is stored in the time domain, as DtX.
     '''
-    def __init__(self, D, x, lmbd=0.1, z0=None, nonneg=False, **kwargs):
+    # Constants computed on their first access by each method, see
+    # __getattr__. update_D and update_x delete the ones they change.
+    _CONSTANTS = {
+        '_compute_operator': ['operator'],
+        '_compute_spectra_D': ['fft_shape', 'D_fft', '_DtD_f', 'DtD_fft',
+                               '_Gh'],
+        '_compute_spectra_x': ['X_fft', '_DtX_f', 'DtX_fft', '_parseval',
+                               'DtX'],
+        '_compute_DD': ['DD'],
+        '_compute_L': ['L'],
+    }
+    _LAZY = {name: method for method, names in _CONSTANTS.items()
+             for name in names}
+
+    def __init__(self, D, x, lmbd=0.1, z0=None, nonneg=False,
+                 packed_DD=False, DD_dtype=np.float64, block_size=None,
+                 **kwargs):
         self.D = np.array(D)
         self.x = np.array(x)
         if self.D.ndim == 2:
@@ -38,43 +66,100 @@ class MultivariateConvolutionalCodingProblem(_Problem):
         self.lmbd = lmbd
         self.nonneg = False
         self.d = self.x.shape[0]
+        self.packed_DD = packed_DD
+        self.DD_dtype = DD_dtype
+        self.block_size = block_size
 
-        self._compute_constant()
+        # Store extra dimensions
+        self.T = self.x.size
+        self.x_norm2 = np.sum(self.x * self.x)
+
+        self._invalidate(*self._CONSTANTS)
+
+    def __getattr__(self, name):
+        # Only called when name is not set, so a constant is computed once
+        method = MultivariateConvolutionalCodingProblem._LAZY.get(name)
+        if method is None:
+            raise AttributeError(name)
+        getattr(self, method)()
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            # Constant of the other mode, see block_size
+            raise AttributeError(name)
+
+    def _invalidate(self, *methods):
+        '''Delete the constants computed by methods'''
+        for method in methods:
+            for name in self._CONSTANTS[method]:
+                self.__dict__.pop(name, None)
 
     def get_lmbd_max(self):
-        return np.max([
-            np.sum([np.correlate(D_kp, X_ip, mode='valid')
-                    for D_kp, X_ip in zip(D_k, self.x)], axis=0)
-            for D_k in self.D])
-
-    def _compute_constant(self):
-        """Precompute fft of X and D to fasten the gradient computations"""
-        p, X_shape = self.x.shape[0], self.x.shape[-1]
-        fft_shape = X_shape + self.D.shape[-1] - 1
+        '''Largest correlation of the signal with an atom, summed over the
+        channels, from the inverse FFT of DtX_fft
+        '''
+        if self.block_size is not None:
+            return self.d * np.max(self.DtX)
+        L = self.x.shape[-1] - self.D.shape[-1] + 1
+        DtX = get_fft_backend().irfft(self.DtX_fft, n=self.fft_shape)[:, :L]
+        return self.d * np.max(DtX)
+
+    def _compute_spectra_D(self):
+        """Precompute fft of D to fasten the gradient computations"""
+        X_shape = self.x.shape[-1]
+        S = self.D.shape[-1]
+        if self.block_size is None:
+            fft_shape = X_shape + S - 1
+        else:
+            # A block of the code with an overlap of S - 1 on each side
+            fft_shape = self.block_size + 2 * (S - 1)
 
-        # Frequential domain representation
+        # Frequential domain representation, shared by the problems with
+        # the same dictionary
         self.fft_shape = fft_shape = next_fast_len(int(fft_shape))
-        self.X_fft = X_fft = fft(self.x, n=fft_shape)
-        self.D_fft = D_fft = fft(self.D, n=fft_shape)
+        self.D_fft, self._DtD_f = self.operator.spectra(fft_shape)
 
-        # Reshape so that all the variables have the same dimensions
-        # [K, p, T]
-        self.X_fft = X_fft = self.X_fft[None]
+        # Precompute constants to accelerate frequency domain computations.
+        # They are stored with the frequencies on the first axis, so the
+        # gradient is a batch of K x K products, and DtD_fft [K, K, F] and
+        # DtX_fft [K, F] are views on them.
+        self.DtD_fft = self._DtD_f.transpose(1, 2, 0)
 
-        # Precompute constants to accelerate frequency domain computations
-        self.DtD_fft = (D_fft[:, None].conj() * D_fft[None]
-                        ).mean(axis=2, keepdims=False)
-        self.DtX_fft = (D_fft.conj() * X_fft).mean(axis=1, keepdims=False)
+        # Output of the products, reused by each gradient computation
+        self._Gh = np.empty(self._DtD_f.shape[:2] + (1,), self._DtD_f.dtype)
 
-        # Store extra dimensions
-        self.T = p * np.prod(X_shape)
+    def _compute_spectra_x(self):
+        """Precompute fft of X and DtX to fasten the gradient computations"""
+        p, X_shape = self.x.shape[0], self.x.shape[-1]
+        fft_shape, D_fft = self.fft_shape, self.D_fft
+        if self.block_size is None:
+            # Reshape so that all the variables have the same dimensions
+            # [K, p, T]
+            self.X_fft = X_fft = get_fft_backend().rfft(
+                self.x, n=fft_shape)[None]
+            self._DtX_f = np.ascontiguousarray(
+                np.einsum('kpf,pf->fk', D_fft.conj(), X_fft[0])) / p
+            self.DtX_fft = self._DtX_f.T
+
+            # Weights of the coefficients of the rfft in Parseval's
+            # identity, to compute the cost from the spectra
+            self._parseval = np.full(self.DtX_fft.shape[-1], 2. / fft_shape)
+            self._parseval[0] /= 2
+            if fft_shape % 2 == 0:
+                self._parseval[-1] /= 2
+        else:
+            L = X_shape - self.D.shape[-1] + 1
+            self.DtX = self._by_blocks(self.x, L, lambda x_fft: np.einsum(
+                'kpf,fp->fk', D_fft.conj(), x_fft) / p)
 
-        # Compute DD
-        self.DD = np.mean([[[fftconvolve(dk, dk1)
-                             for dk, dk1 in zip(d, d1)]
-                            for d1 in self.D]
-                           for d in self.D[:, :, ::-1]], axis=2)
+    def _compute_operator(self):
+        self.operator = get_dictionary_operator(self.D)
 
+    def _compute_DD(self):
+        self.DD = self.operator.get_DD(packed=self.packed_DD,
+                                       dtype=self.DD_dtype)
+
+    def _compute_L(self):
         # Lipchitz constant
         # b_hat = np.random.rand(*self.pt.shape)
         # mu_hat = np.nan
@@ -88,24 +173,65 @@ class MultivariateConvolutionalCodingProblem(_Problem):
         #     if abs(mu_hat - mu_old) / mu_old < 1e-15:
         #         break
         # self.L = mu_hat
-        self.L = np.linalg.norm(self.DD, axis=(0, 1), ord=2).sum()
+        self.L = self.operator.get_L(packed=self.packed_DD,
+                                     dtype=self.DD_dtype)
         # print(mu_hat, self.L)
         # np.linalg.norm(self.DtD_fft, axis=(0, 1), ord=2).sum()
 
+    def get_DD(self, k0):
+        '''Return DD[:, k0], the cross-correlation with the atom k0
+        '''
+        return DD_row(self.DD, k0, packed=self.packed_DD)
+
     def update_D(self, dD, D=None):
         if D is None:
             D = self.D
             if dD is not None:
                 D = D + dD
         self.D = D
-        self._compute_constant()
+        self._invalidate(*self._CONSTANTS)
         return self.D
 
+    def update_x(self, x):
+        '''Change the signal to encode. The code is reset if the length of
+        the signal changes.
+        '''
+        x = np.array(x)
+        if x.ndim == 1:
+            x = x[None, :]
+        if x.shape[-1] != self.x.shape[-1]:
+            self.x0 = np.zeros((self.M, x.shape[-1] - self.D.shape[-1] + 1))
+            self.sizes = self.x0.shape
+            self.reset()
+            self._invalidate('_compute_spectra_D')
+        self.x = x
+        self.d = x.shape[0]
+        self.T = x.size
+        self.x_norm2 = np.sum(x * x)
+        self._invalidate('_compute_spectra_x')
+        return self.x
+
     def Er(self, pt):
         '''Compute the reconstruction error
         '''
-        res = self.x - self.reconstruct(pt)
-        return (res * res).sum() / (2 * self.d)
+        if self.block_size is not None:
+            return self._Er_blocked(pt, self.grad(pt))
+        z_fft = self._fft(pt)
+        return self._Er_fft(z_fft, self._grad_fft(z_fft))
+
+    def _Er_fft(self, z_fft, Gh):
+        '''Reconstruction error from the spectra of the code and of the
+        gradient, with ||x - Dz||^2 = ||x||^2 - 2<z, D^Tx> + <z, D^TDz>
+        '''
+        dot = np.real(z_fft.conj() * (Gh - self._DtX_f)).sum(axis=1)
+        return self.x_norm2 / (2 * self.d) + np.dot(self._parseval, dot) / 2
+
+    def _Er_blocked(self, pt, grad):
+        '''Reconstruction error from the code and the gradient, with the
+        same identity in the time domain
+        '''
+        dot = np.sum(pt * (grad - self.DtX))
+        return self.x_norm2 / (2 * self.d) + dot / 2
 
     def cost(self, pt=None):
         '''Compute the cost at the given point
@@ -120,6 +246,7 @@ class MultivariateConvolutionalCodingProblem(_Problem):
         if pt is None:
             pt = self.pt
         residual = self.reconstruct(pt) - self.x
+        fftconvolve = get_fft_backend().fftconvolve
         _grad = np.mean([[fftconvolve(rk, dk, mode='valid')
                          for dk, rk in zip(Dm, residual)]
                         for Dm in self.D[:, :, ::-1]], axis=1)
@@ -130,12 +257,81 @@ class MultivariateConvolutionalCodingProblem(_Problem):
         '''
         if pt is None:
             pt = self.pt
-        z = pt
-        z_slice = tuple([slice(0, d) for d in z.shape])
-        z_fft = fft(z, n=self.fft_shape)
-        Gh = np.sum(self.DtD_fft * z_fft[None], axis=1)
-        Gh -= self.DtX_fft
-        out = ifft(Gh).real[z_slice]
+        if self.block_size is not None:
+            return (self._by_blocks(pt, pt.shape[1], self._DtDz_fft) -
+                    self.DtX)
+        return self._ifft(self._grad_fft(self._fft(pt)), pt.shape[1])
+
+    def grad_and_cost(self, pt=None):
+        '''Compute the gradient and the cost at the given point, with one
+        FFT of the point
+        '''
+        if pt is None:
+            pt = self.pt
+        if self.block_size is not None:
+            grad = self.grad(pt)
+            return grad, self._Er_blocked(pt, grad) + self.lmbd * np.sum(
+                abs(pt))
+        z_fft = self._fft(pt)
+        Gh = self._grad_fft(z_fft)
+        grad = self._ifft(Gh, pt.shape[1])
+        cost = self._Er_fft(z_fft, Gh) + self.lmbd * np.sum(abs(pt))
+        return grad, cost
+
+    def _fft(self, pt):
+        '''Spectrum [F, K] of the code pt [K, L]
+        '''
+        return np.ascontiguousarray(
+            get_fft_backend().rfft(pt, n=self.fft_shape).T)
+
+    def _ifft(self, Gh, L):
+        '''Gradient [K, L] from its spectrum Gh [F, K]
+        '''
+        return get_fft_backend().irfft(Gh.T, n=self.fft_shape)[:, :L]
+
+    def _grad_fft(self, z_fft):
+        '''Spectrum [F, K] of the gradient for the spectrum z_fft of the
+        code, computed in a buffer overwritten by the next call
+        '''
+        Gh = self._DtDz_fft(z_fft)
+        Gh -= self._DtX_f
+        return Gh
+
+    def _DtDz_fft(self, z_fft):
+        '''Spectrum [F, K] of D^TDz, in the buffer of _grad_fft'''
+        np.matmul(self._DtD_f, z_fft[:, :, None], out=self._Gh)
+        return self._Gh[:, :, 0]
+
+    def _by_blocks(self, a, length, spectrum):
+        '''Compute a convolution of a [p, *] on [0, length) by overlap-save
+        blocks
+
+        The block [t0, t0 + block_size) of the result is computed from the
+        window [t0 - S + 1, t0 + block_size + S - 1) of a, with zeros out of
+        a, so the lags in [-S + 1, S - 1] do not wrap around.
+
+        Parameters
+        ----------
+        spectrum: callable
+            Return the spectrum [F, m] of the result from the spectrum
+            [F, p] of a window
+
+        Return
+        ------
+        out: array (m, length)
+        '''
+        S, B = self.D.shape[-1], self.block_size
+        out = None
+        for t0 in range(0, length, B):
+            start = t0 - S + 1
+            window = a[:, max(start, 0):t0 + B + S - 1]
+            if start < 0:
+                window = np.pad(window, [(0, 0), (-start, 0)])
+            n_t = min(B, length - t0)
+            block = self._ifft(spectrum(self._fft(window)), S - 1 + n_t)
+            if out is None:
+                out = np.empty((block.shape[0], length))
+            out[:, t0:t0 + n_t] = block[:, S - 1:]
         return out
 
     def prox(self, pt=None, lmbd=None):
@@ -153,112 +349,84 @@ class MultivariateConvolutionalCodingProblem(_Problem):
 
     def grad_D(self, pt):
         residual = self.reconstruct(pt) - self.x
+        if self.block_size is not None:
+            self._grad_D = self._grad_D_blocked(pt, residual)
+            return self._grad_D
+        fftconvolve = get_fft_backend().fftconvolve
         self._grad_D = [[fftconvolve(z, rk, mode='valid')
                          for rk in residual]
                         for z in pt[:, ::-1]]
         self._grad_D = np.array(self._grad_D)
         return self._grad_D
 
+    def _grad_D_blocked(self, pt, residual):
+        '''Correlations of the code with the residual, summed over the
+        blocks [t0, t0 + block_size) of the code
+        '''
+        S, B = self.D.shape[-1], self.block_size
+        fft = get_fft_backend()
+        grad_D = np.zeros(self.D.shape)
+        for t0 in range(0, pt.shape[1], B):
+            z_fft = self._fft(pt[:, t0:t0 + B])
+            r_fft = self._fft(residual[:, t0:t0 + B + S - 1])
+            G = np.einsum('fk,fp->kpf', z_fft.conj(), r_fft)
+            grad_D += fft.irfft(G, n=self.fft_shape)[..., :S]
+        return grad_D
+
     def reconstruct(self, pt):
         '''Reconstruct the signal from the given code
         '''
+        if self.block_size is not None:
+            T = pt.shape[-1] + self.D.shape[-1] - 1
+            return self._by_blocks(pt, T, lambda z_fft: np.einsum(
+                'kpf,fk->fp', self.D_fft, z_fft))
+        fftconvolve = get_fft_backend().fftconvolve
         return np.sum([[fftconvolve(dk, zm) for dk in Dm]
                        for Dm, zm in zip(self.D, pt)], axis=0)
 
 
-def next_fast_len(target):
-    """
-    Find the next fast size of input data to `fft`, for zero-padding, etc.
+def pack_problems(problems):
+    '''Concatenate problems sharing the same dictionary and lmbd in one
 
-    SciPy's FFTPACK has efficient functions for radix {2, 3, 4, 5}, so this
-    returns the next composite of the prime factors 2, 3, and 5 which is
-    greater than or equal to `target`. (These are also known as 5-smooth
-    numbers, regular numbers, or Hamming numbers.)
+    The code positions whose atom overlaps two signals are listed in the
+    masked attribute of the packed problem, as intervals [start, end).
+    DICOD keeps them at 0, so the packed signals do not interact and its
+    solution is the concatenation of the independent ones.
+
+    Return
+    ------
+    pb: MultivariateConvolutionalCodingProblem
+        Packed problem, with the offsets of each signal in pb.offsets
+    '''
+    pb0 = problems[0]
+    S = pb0.D.shape[-1]
+    for pb in problems[1:]:
+        assert np.array_equal(pb.D, pb0.D) and pb.lmbd == pb0.lmbd, (
+            "The packed problems should share the same dictionary and lmbd")
+    offsets = np.cumsum([0] + [pb.x.shape[-1] for pb in problems])
+    x = np.concatenate([pb.x for pb in problems], axis=-1)
+    packed = MultivariateConvolutionalCodingProblem(
+        pb0.D, x, lmbd=pb0.lmbd, packed_DD=pb0.packed_DD,
+        DD_dtype=pb0.DD_dtype, block_size=pb0.block_size)
+    packed.offsets = offsets
+    packed.masked = np.array([[off - S + 1, off] for off in offsets[1:-1]],
+                             dtype=int).reshape(-1, 2)
+    return packed
+
+
+def unpack_problems(packed, problems):
+    '''Store the code of the packed problem in each problem
+
+    Return
+    ------
+    cost: list of float
+        Cost of each problem
+    '''
+    S = packed.D.shape[-1]
+    cost = []
+    for pb, off, off_next in zip(problems, packed.offsets,
+                                 packed.offsets[1:]):
+        pb.pt = packed.pt[:, off:off_next - S + 1].copy()
+        cost += [pb.cost()]
+    return cost
 
-    Parameters
-    ----------
-    target : int
-        Length to start searching from.  Must be a positive integer.
-
-    Returns
-    -------
-    out : int
-        The first 5-smooth number greater than or equal to `target`.
-
-    Examples
-    --------
-    On a particular machine, an FFT of prime length takes 133 ms:
-
-    >>> from scipy import fftpack
-    >>> min_len = 10007  # prime length is worst case for speed
-    >>> a = np.random.randn(min_len)
-    >>> b = fftpack.fft(a)
-
-    Zero-padding to the next 5-smooth length reduces computation time to
-    211 us, a speedup of 630 times:
-
-    >>> fftpack.helper.next_fast_len(min_len)
-    10125
-    >>> b = fftpack.fft(a, 10125)
-
-    Rounding up to the next power of 2 is not optimal, taking 367 us to
-    compute, 1.7 times as long as the 5-smooth size:
-
-    >>> b = fftpack.fft(a, 16384)
-
-    """
-    hams = (8, 9, 10, 12, 15, 16, 18, 20, 24, 25, 27, 30, 32, 36, 40, 45, 48,
-            50, 54, 60, 64, 72, 75, 80, 81, 90, 96, 100, 108, 120, 125, 128,
-            135, 144, 150, 160, 162, 180, 192, 200, 216, 225, 240, 243, 250,
-            256, 270, 288, 300, 320, 324, 360, 375, 384, 400, 405, 432, 450,
-            480, 486, 500, 512, 540, 576, 600, 625, 640, 648, 675, 720, 729,
-            750, 768, 800, 810, 864, 900, 960, 972, 1000, 1024, 1080, 1125,
-            1152, 1200, 1215, 1250, 1280, 1296, 1350, 1440, 1458, 1500, 1536,
-            1600, 1620, 1728, 1800, 1875, 1920, 1944, 2000, 2025, 2048, 2160,
-            2187, 2250, 2304, 2400, 2430, 2500, 2560, 2592, 2700, 2880, 2916,
-            3000, 3072, 3125, 3200, 3240, 3375, 3456, 3600, 3645, 3750, 3840,
-            3888, 4000, 4050, 4096, 4320, 4374, 4500, 4608, 4800, 4860, 5000,
-            5120, 5184, 5400, 5625, 5760, 5832, 6000, 6075, 6144, 6250, 6400,
-            6480, 6561, 6750, 6912, 7200, 7290, 7500, 7680, 7776, 8000, 8100,
-            8192, 8640, 8748, 9000, 9216, 9375, 9600, 9720, 10000)
-
-    if target <= 6:
-        return target
-
-    # Quickly check if it's already a power of 2
-    if not (target & (target - 1)):
-        return target
-
-    # Get result quickly for small sizes, since FFT itself is similarly fast.
-    if target <= hams[-1]:
-        from scipy.fftpack.helper import bisect_left
-        return hams[bisect_left(hams, target)]
-
-    match = float('inf')  # Anything found will be smaller
-    p5 = 1
-    while p5 < target:
-        p35 = p5
-        while p35 < target:
-            # Ceiling integer division, avoiding conversion to float
-            # (quotient = ceil(target / p35))
-            quotient = -(-target // p35)
-
-            # Quickly find next power of 2 >= quotient
-            p2 = 2**((quotient - 1).bit_length())
-
-            N = p2 * p35
-            if N == target:
-                return N
-            elif N < match:
-                match = N
-            p35 *= 3
-            if p35 == target:
-                return p35
-        if p35 < match:
-            match = p35
-        p5 *= 5
-        if p5 == target:
-            return p5
-    if p5 < match:
-        match = p5
-    return match
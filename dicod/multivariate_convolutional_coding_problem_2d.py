@@ -1,7 +1,8 @@
 import numpy as np
-from scipy.signal import fftconvolve
 
 from ._problem import _Problem
+from .utils import compute_DD, DD_row, DD_lipschitz
+from .fft_backend import get_fft_backend
 from joblib import Parallel, delayed
 
 
@@ -21,8 +22,14 @@ class MultivariateConvolutionalCodingProblem2D(_Problem):
     nonneg: bool, optional (default: False)
         Use the proximal operator to shrink in a non-negative
         way.
+    packed_DD: bool, optional (default: False)
+        Only store the pairs k <= k' of DD, using the symmetry
+        DD[k, k'](t) = DD[k', k](-t). Use get_DD to access DD[:, k].
+    DD_dtype: numpy dtype, optional (default: float64)
+        Precision used to store DD.
     '''
-    def __init__(self, D, x, lmbd=0.1, z0=None, nonneg=False, **kwargs):
+    def __init__(self, D, x, lmbd=0.1, z0=None, nonneg=False,
+                 packed_DD=False, DD_dtype=np.float64, **kwargs):
         self.D = np.array(D)
         self.x = np.array(x)
         if self.D.ndim == 3:
@@ -44,13 +51,17 @@ class MultivariateConvolutionalCodingProblem2D(_Problem):
         self.nonneg = False
         self.d = self.x.shape[0]
         self._pool = Parallel(n_jobs=-1)
+        self.packed_DD = packed_DD
+        self.DD_dtype = DD_dtype
 
-        self.DD = np.mean([[[fftconvolve(dk0, dk1, mode='full')
-                             for dk0, dk1 in zip(d0, d1)]
-                            for d1 in self.D]
-                           for d0 in self.D[:, :, ::-1, ::-1]], axis=2)
+        self.DD = compute_DD(self.D, packed=self.packed_DD,
+                             dtype=self.DD_dtype)
+        self.L = DD_lipschitz(self.DD, packed=self.packed_DD)
 
-        self.L = np.linalg.norm(self.DD, axis=(0, 1), ord=2).sum()
+    def get_DD(self, k0):
+        '''Return DD[:, k0], the cross-correlation with the atom k0
+        '''
+        return DD_row(self.DD, k0, packed=self.packed_DD)
 
     def update_D(self, dD, D=None):
         if D is None:
@@ -59,11 +70,9 @@ class MultivariateConvolutionalCodingProblem2D(_Problem):
                 D = D + dD
         self.D = D
 
-        self.DD = np.mean([[[fftconvolve(dk0, dk1, mode='full')
-                             for dk0, dk1 in zip(d0, d1)]
-                            for d1 in self.D]
-                           for d0 in self.D[:, :, ::-1, ::-1]], axis=2)
-        self.L = np.linalg.norm(self.DD, axis=(0, 1), ord=2).sum()
+        self.DD = compute_DD(self.D, packed=self.packed_DD,
+                             dtype=self.DD_dtype)
+        self.L = DD_lipschitz(self.DD, packed=self.packed_DD)
 
     def Er(self, pt):
         '''Commpute the reconstruction error
@@ -87,7 +96,8 @@ class MultivariateConvolutionalCodingProblem2D(_Problem):
         D = self._get_args(D, self.D)
         residual = self.reconstruct(pt) - x
         conv = delayed(MultivariateConvolutionalCodingProblem2D.multi_conv)
-        _grad = self._pool(conv(residual, Dm, mode='valid')
+        fft = get_fft_backend()
+        _grad = self._pool(conv(residual, Dm, mode='valid', fft=fft)
                            for Dm in D[:, :, ::-1, ::-1])
         return np.mean(_grad, axis=1)
 
@@ -112,13 +122,14 @@ class MultivariateConvolutionalCodingProblem2D(_Problem):
 
         residual = self.reconstruct(pt=pt, D=D) - x
         conv = delayed(MultivariateConvolutionalCodingProblem2D.multi_conv)
-        self._grad_D = self._pool(conv(residual, z, mode='valid')
+        fft = get_fft_backend()
+        self._grad_D = self._pool(conv(residual, z, mode='valid', fft=fft)
                                   for z in pt[:, ::-1, ::-1])
         self._grad_D = np.array(self._grad_D)
         return self._grad_D
 
     @classmethod
-    def multi_conv(cls, z, D, mode):
+    def multi_conv(cls, z, D, mode, fft=None):
         if len(z.nonzero()[0]) == 0 or len(D.nonzero()[0]) == 0:
             if D.ndim == 3:
                 K, h_dic, w_dic = D.shape
@@ -131,6 +142,9 @@ class MultivariateConvolutionalCodingProblem2D(_Problem):
             else:
                 return np.zeros((K, h_sig+h_dic-1, w_sig+w_dic-1))
 
+        # The backend is passed by the parent, as the pool runs in other
+        # processes
+        fftconvolve = (fft or get_fft_backend()).fftconvolve
         if D.ndim == 3 and z.ndim == 3:
             return [fftconvolve(zk, dk, mode=mode) for zk, dk in zip(z, D)]
         elif D.ndim == 3:
@@ -143,7 +157,9 @@ class MultivariateConvolutionalCodingProblem2D(_Problem):
         pt = self._get_args(pt, self.pt)
         D = self._get_args(D, self.D)
         conv = delayed(MultivariateConvolutionalCodingProblem2D.multi_conv)
-        rec = self._pool([conv(zm, Dm, mode='full') for Dm, zm in zip(D, pt)])
+        fft = get_fft_backend()
+        rec = self._pool([conv(zm, Dm, mode='full', fft=fft)
+                          for Dm, zm in zip(D, pt)])
         return np.sum(rec, axis=0)
 
     def _get_args(self, arg, default):
@@ -170,7 +186,8 @@ class MultivariateConvolutionalCodingProblem2D(_Problem):
         zz[:K, h_dic-1:-h_dic+1, w_dic-1:-w_dic+1] = pt
         zz[K:, :h_sig, :w_sig] = x
         conv = delayed(MultivariateConvolutionalCodingProblem2D.multi_conv)
-        A = self._pool([conv(zz, ptk, mode='valid')
+        fft = get_fft_backend()
+        A = self._pool([conv(zz, ptk, mode='valid', fft=fft)
                         for ptk in pt[:, ::-1, ::-1]])
         A = np.array(A)
         self.A = A[:, :K]
@@ -0,0 +1,223 @@
+'''Long lived pool of DICOD workers shared by several python processes
+
+The server spawns the MPI workers once and solves the tasks submitted by
+the clients one at a time, in the order they are received. Start it with
+
+    python -m dicod.pool_server --njobs 8
+
+and submit tasks from any process on the same host with PoolClient.
+'''
+import os
+import queue
+import logging
+import tempfile
+import threading
+import traceback
+from time import time
+from multiprocessing.connection import Listener, Client
+
+from .dicod import DICOD
+from .dicod2d import DICOD2D
+from .c_dicod.mpi_pool import get_reusable_pool
+
+
+log = logging.getLogger('dicod')
+
+DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), 'dicod_pool.sock')
+
+SOLVERS = {'DICOD': DICOD, 'DICOD2D': DICOD2D}
+
+
+class PoolServer(object):
+    """Serve the tasks of the clients with a persistent MPI_Pool
+
+    Parameters
+    ----------
+    address: str, optional (default: DEFAULT_ADDRESS)
+        Path of the unix socket listening for the clients
+    n_jobs: int, optional (default: 1)
+        Number of workers spawned at start. The pool grows if a task
+        requests more workers.
+    hostfile: str, optional (default: None)
+        Hostfile used to spawn the workers
+    authkey: bytes, optional (default: None)
+        If set, the clients need the same key to connect
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, n_jobs=1, hostfile=None,
+                 authkey=None):
+        self.address = address
+        self.n_jobs = n_jobs
+        self.hostfile = hostfile
+        self.authkey = authkey
+        self.stats = {}
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+
+    def serve_forever(self):
+        '''Solve the tasks until a client asks for a shutdown
+
+        The tasks are run in this thread as the pool is bound to the thread
+        which created it.
+        '''
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        self._listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self._accept, daemon=True).start()
+        self._pool = get_reusable_pool(self.n_jobs, self.hostfile)
+        log.info('Pool server ready on {}'.format(self.address))
+
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            self._run(*task)
+
+        self._listener.close()
+        self._pool.terminate()
+        log.info('Pool server stopped')
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_client, args=(conn,),
+                             daemon=True).start()
+
+    def _serve_client(self, conn):
+        name = None
+        reply = queue.Queue()
+        try:
+            while True:
+                cmd, args = conn.recv()
+                if cmd == 'hello':
+                    name = args
+                    with self._lock:
+                        self.stats.setdefault(name, _new_stats())
+                    conn.send(('ok', None))
+                elif cmd == 'run':
+                    self._tasks.put((name, args, time(), reply))
+                    conn.send(reply.get())
+                elif cmd == 'stats':
+                    with self._lock:
+                        stats = {k: dict(v) for k, v in self.stats.items()}
+                    conn.send(('ok', stats))
+                elif cmd == 'shutdown':
+                    self._tasks.put(None)
+                    conn.send(('ok', None))
+                else:
+                    conn.send(('error', 'Unknown command {}'.format(cmd)))
+        except (EOFError, OSError):
+            conn.close()
+
+    def _run(self, name, args, t_submit, reply):
+        t_start = time()
+        solver_name, params, method, problems = args
+        try:
+            params = dict(params, hostfile=self.hostfile)
+            solver = SOLVERS[solver_name](**params)
+            if method == 'fit':
+                solver.fit(problems)
+                pt = problems.pt
+            elif method == 'map':
+                solver.map(problems)
+                pt = [pb.pt for pb in problems]
+            else:
+                raise ValueError('Unknown method {}'.format(method))
+            res = ('ok', dict(pt=pt, cost=solver.cost,
+                              iteration=solver.iteration,
+                              runtime=solver.runtime))
+            n_errors = 0
+        except Exception:
+            res = ('error', traceback.format_exc())
+            n_errors = 1
+
+        with self._lock:
+            # The tasks sent before hello are counted under the name None
+            stats = self.stats.setdefault(name, _new_stats())
+            stats['n_tasks'] += 1
+            stats['n_errors'] += n_errors
+            stats['t_wait'] += t_start - t_submit
+            stats['t_run'] += time() - t_start
+        reply.put(res)
+
+
+def _new_stats():
+    return dict(n_tasks=0, n_errors=0, t_wait=0., t_run=0.)
+
+
+class PoolClient(object):
+    """Submit DICOD tasks to a running PoolServer
+
+    Parameters
+    ----------
+    address: str, optional (default: DEFAULT_ADDRESS)
+        Path of the unix socket of the server
+    authkey: bytes, optional (default: None)
+        Key of the server
+    name: str, optional (default: None)
+        Name of the client in the server statistics. If None, use the pid.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, name=None):
+        self.conn = Client(address, authkey=authkey)
+        self.name = name if name else 'client{}'.format(os.getpid())
+        self._request('hello', self.name)
+
+    def fit(self, pb, solver='DICOD', **params):
+        '''Solve pb on the pool, the code is stored in pb.pt
+
+        Return
+        ------
+        res: dict
+            pt, cost, iteration and runtime of the solver
+        '''
+        res = self._request('run', (solver, params, 'fit', pb))
+        pb.pt = res['pt']
+        return res
+
+    def map(self, problems, solver='DICOD', **params):
+        '''Solve a batch of problems sharing the same dictionary, see
+        DICOD.map'''
+        res = self._request('run', (solver, params, 'map', problems))
+        for pb, pt in zip(problems, res['pt']):
+            pb.pt = pt
+        return res
+
+    def stats(self):
+        '''Number of tasks and time spent waiting and running, per client
+        '''
+        return self._request('stats', None)
+
+    def shutdown(self):
+        '''Stop the server once the queued tasks are done
+        '''
+        self._request('shutdown', None)
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _request(self, cmd, args):
+        self.conn.send((cmd, args))
+        status, res = self.conn.recv()
+        if status == 'error':
+            raise RuntimeError('Pool server error:\n' + res)
+        return res
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser('Persistent pool of DICOD workers')
+    parser.add_argument('--njobs', type=int, default=1,
+                        help='# of spawned processes')
+    parser.add_argument('--hostfile', type=str, default=None,
+                        help='hostfile used to spawn the processes')
+    parser.add_argument('--address', type=str, default=DEFAULT_ADDRESS,
+                        help='unix socket listening for the clients')
+    args = parser.parse_args()
+
+    log.setLevel(logging.INFO)
+    PoolServer(address=args.address, n_jobs=args.njobs,
+               hostfile=args.hostfile).serve_forever()
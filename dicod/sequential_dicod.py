@@ -2,6 +2,7 @@ import logging
 import numpy as np
 
 from ._lasso_solver import _LassoSolver
+from .coordinate_descent import CoordinateDescent
 
 log = logging.getLogger('dicod')
 
@@ -9,7 +10,8 @@ log = logging.getLogger('dicod')
 class LGCD(_LassoSolver):
     '''Convolutional Sparse coding by coordinate descent
     '''
-    def __init__(self, n_seg=None, debug=0, **kwargs):
+    def __init__(self, n_seg=None, DD_threshold=0, beta_refresh=1000,
+                 cost_refresh=10000, debug=0, **kwargs):
         '''Coordinate descent algorithm
 
         Parameters
@@ -18,6 +20,17 @@ class LGCD(_LassoSolver):
             Chunk size for the sequential DICOD
             The default behavior is to take 4 time the size
             of the dicitonary
+        DD_threshold: float, optional (default: 0)
+            If > 0, only update beta with the blocks of DD larger than
+            DD_threshold times the largest cross-correlation of each atom.
+        beta_refresh: int, optional (default: 1000)
+            With DD_threshold > 0, apply the skipped updates to beta every
+            beta_refresh updates, before an update they could change by
+            more than half and before stopping.
+        cost_refresh: int, optional (default: 10000)
+            When logging, the cost is updated from beta after each update
+            and recomputed exactly at the first log point after
+            cost_refresh updates, to bound the drift.
         debug: int, optional (default: 0)
             Verbosity level, set to 0 for no output
         '''
@@ -27,6 +40,12 @@ class LGCD(_LassoSolver):
             self.name = 'LGCD_' + str(self.id)
 
         self.n_seg = n_seg
+        self.DD_threshold = DD_threshold
+        if beta_refresh < 1:
+            raise ValueError("beta_refresh should be >= 1, got {}"
+                             .format(beta_refresh))
+        self.beta_refresh = beta_refresh
+        self.cost_refresh = cost_refresh
 
     def _init_algo(self):
         '''Precompute some quantities that are used across iterations
@@ -45,17 +64,22 @@ class LGCD(_LassoSolver):
         self.alpha_k = np.sum(np.mean(self.pb.D*self.pb.D, axis=1),
                               axis=1).reshape((-1, 1))
         self.alpha_k += (self.alpha_k == 0)
-        self.DD = self.pb.DD
 
         # compute the initial value for _beta
         self._beta = self.pb.grad()
 
+        # Select the significant rows and lags of DD for each atom
+        self._init_packed_DD()
+        self._init_DD_blocks()
+        self._beta_checked = False
+
         # Init runing variables
         self.current_chunk = 0
         self.chunk_size = self.L // self.n_chunk
         log.debug('Chunck size: {}'.format(self.chunk_size))
 
         self.dz = []
+        self._obj = None
 
     def p_update(self):
         '''Chose the best update in one chunk and perform it
@@ -75,22 +99,41 @@ class LGCD(_LassoSolver):
         # select best coordinate descent
         i0 = np.argmax(abs(Z-pt))
         i0 = np.unravel_index(i0, pt.shape)
-        dz = pt[i0] - Z[i0]
         i1 = (i0[0], i0[1]+m0)
-        self.pb.pt[i1] = Z[i0]
+        z = self._check_update(i1[0], i1[1], Z[i0])
+        dz = pt[i0] - z
+        if self._obj is not None:
+            self._update_cost(i1[0], i1[1], pt[i0], z)
+        self.pb.pt[i1] = z
 
         self._update_beta(dz, i1[0], i1[1])
         self.dz += [abs(dz)]
         if len(self.dz) > self.n_chunk:
             del self.dz[0]
+        if self.DD_blocks is not None:
+            self._check_beta(abs(dz))
         return np.max(self.dz)
 
-    def _update_beta(self, dz, k, t):
-        '''Update the univariates optim solution
+    def _check_beta(self, dz):
+        '''Refresh the approximate beta computed with the sparse DD
         '''
-        pz = self._beta[k, t]
-        off = max(0, self.s-t-1)
-        d = max(0, t-self.s+1)
-        ll = len(self._beta[k, d:t+self.s])
-        self._beta[:, d:t+self.s] -= self.DD[:, k, off:off+ll]*dz
-        self._beta[k, t] = pz
+        if dz >= self.tol:
+            self._beta_checked = False
+        if np.max(self.dz) < self.tol and not self._beta_checked:
+            # the last updates used an approximate beta, run a new
+            # sweep from the exact one before stopping
+            self._refresh_beta()
+            self._beta_checked = True
+            self.dz = [2 * self.tol]
+        elif self.it % self.beta_refresh == 0:
+            self._refresh_beta()
+
+    # Same running cost and sparse updates of beta as CoordinateDescent
+    _cost = CoordinateDescent._cost
+    _update_cost = CoordinateDescent._update_cost
+    _init_packed_DD = CoordinateDescent._init_packed_DD
+    _init_DD_blocks = CoordinateDescent._init_DD_blocks
+    _DD_outside = CoordinateDescent._DD_outside
+    _refresh_beta = CoordinateDescent._refresh_beta
+    _check_update = CoordinateDescent._check_update
+    _update_beta = CoordinateDescent._update_beta
@@ -0,0 +1,32 @@
+import numpy as np
+from scipy.signal import fftconvolve
+
+from dicod.multivariate_convolutional_coding_problem import\
+    MultivariateConvolutionalCodingProblem
+
+
+def make_problems(T, K=3, d=2, S=5, density=.05, lmbd=0.01, noise=0,
+                  seed=42):
+    '''Problems with a random sparse code on the same random dictionary
+
+    Parameters
+    ----------
+    T: int or list of int
+        Length of the codes. A list of problems is returned for a list.
+    density: float
+        Probability of a coefficient of the code to be non zero
+    noise: float
+        Standard deviation of the gaussian noise added to the signals
+    '''
+    rng = np.random.RandomState(seed)
+    D = rng.normal(size=(K, d, S))
+    D /= np.sqrt((D*D).sum(axis=-1))[:, :, None]
+    pbs = []
+    for T_pb in np.atleast_1d(T):
+        z = (rng.rand(K, T_pb) > 1 - density) * rng.randn(K, T_pb)
+        x = np.array([[fftconvolve(zk, dk, 'full') for dk in Dk]
+                      for Dk, zk in zip(D, z)]).sum(axis=0)
+        if noise > 0:
+            x += noise * rng.randn(*x.shape)
+        pbs += [MultivariateConvolutionalCodingProblem(D, x, lmbd=lmbd)]
+    return pbs if np.ndim(T) else pbs[0]
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+
+from dicod.multivariate_convolutional_coding_problem import\
+    MultivariateConvolutionalCodingProblem
+from dicod.coordinate_descent import CoordinateDescent
+from dicod.sequential_dicod import LGCD
+from dicod.utils import compute_DD, pack_DD, unpack_DD, DD_entry
+
+
+def _make_problem(**kwargs):
+    K = 3
+    rng = np.random.RandomState(42)
+    D = rng.randn(K, 2, 5)
+    D /= np.sqrt((D*D).sum(axis=-1))[:, :, None]
+    z = np.zeros((K, 100))
+    z[0, [0, 12, 23, 30, 42, 50, 65, 85, 95]] = 1
+    z[1, 67] = 2
+    x = np.array([[np.convolve(zk, dk, 'full') for dk in Dk]
+                  for Dk, zk in zip(D, z)]).sum(axis=0)
+    return MultivariateConvolutionalCodingProblem(D, x, lmbd=0.002, **kwargs)
+
+
+@pytest.mark.parametrize("atom_shape", [(5,), (3, 4)])
+def test_packed_DD(atom_shape):
+    rng = np.random.RandomState(0)
+    D = rng.randn(4, 2, *atom_shape)
+    DD = compute_DD(D)
+    DD_packed = compute_DD(D, packed=True)
+
+    assert np.allclose(pack_DD(DD), DD_packed)
+    assert np.allclose(unpack_DD(DD_packed), DD)
+    tau = (1,) * len(atom_shape)
+    for k0, k1 in [(0, 3), (3, 0), (2, 2)]:
+        assert np.isclose(DD_entry(DD_packed, k0, k1, tau, packed=True),
+                          DD[k0, k1][tau])
+
+
+@pytest.mark.parametrize("solver_class", [CoordinateDescent, LGCD])
+def test_cd_packed_DD(solver_class):
+    pb = _make_problem()
+    pb_packed = _make_problem(packed_DD=True)
+    assert np.isclose(pb.L, pb_packed.L)
+
+    for p in [pb, pb_packed]:
+        solver = solver_class(max_iter=300, tol=1e-10)
+        solver.fit(p)
+    assert np.allclose(pb.pt, pb_packed.pt)
+
+    # The updates read the packed DD in place, without unpacking its rows
+    pb_packed.reset()
+    pb_packed.get_DD = None
+    solver.fit(pb_packed)
+    assert np.allclose(pb.pt, pb_packed.pt)
+
+
+@pytest.mark.parametrize("solver_class", [CoordinateDescent, LGCD])
+def test_cd_DD_threshold(solver_class):
+    pb = _make_problem()
+    pb_sparse = _make_problem()
+
+    solver = solver_class(max_iter=5000, tol=1e-6)
+    solver.fit(pb)
+    solver_sparse = solver_class(max_iter=5000, tol=1e-6, DD_threshold=0.3,
+                                 beta_refresh=50)
+    solver_sparse.fit(pb_sparse)
+    assert np.isclose(pb.cost(), pb_sparse.cost(), rtol=1e-4)
+
+
+@pytest.mark.parametrize("solver_class", [CoordinateDescent, LGCD])
+@pytest.mark.parametrize("DD_threshold", [0, 0.3])
+def test_cd_running_cost(solver_class, DD_threshold):
+    pb = _make_problem()
+    solver = solver_class(max_iter=2000, tol=1e-10, logging=True,
+                          log_rate='lin1', DD_threshold=DD_threshold,
+                          cost_refresh=10**9)
+
+    # Compare the running cost with the exact one at each log point
+    class _Check(object):
+        def on_log(self, solver, it, t, cost):
+            costs.append((cost, solver.pb.cost()))
+
+    costs = []
+    solver.callbacks = [_Check()]
+    solver.fit(pb)
+    costs = np.array(costs)
+    assert len(costs) > 5
+    assert np.allclose(costs[:, 0], costs[:, 1], rtol=1e-6)
+
+
+@pytest.mark.parametrize("solver_class", [CoordinateDescent, LGCD])
+def test_cd_beta_refresh(solver_class):
+    pb = _make_problem()
+    solver = solver_class(max_iter=5000, tol=1e-10, DD_threshold=0.3,
+                          beta_refresh=10)
+
+    # The refresh only applies the skipped lags of DD to beta, the gradient
+    # is not computed again after the initialization
+    grad = pb.grad
+    n_grad = []
+
+    def _grad(*args, **kwargs):
+        n_grad.append(1)
+        return grad(*args, **kwargs)
+
+    pb.grad = _grad
+    solver.fit(pb)
+    assert len(n_grad) == 1
+
+    with pytest.raises(ValueError):
+        solver_class(DD_threshold=0.3, beta_refresh=0)
+
+    solver._refresh_beta()
+    assert np.allclose(solver._beta, grad() - solver.alpha_k * pb.pt)
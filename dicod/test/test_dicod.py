@@ -1,14 +1,21 @@
+import json
 import numpy as np
 import pytest
 
 
 from dicod.multivariate_convolutional_coding_problem import\
     MultivariateConvolutionalCodingProblem
-from dicod.dicod import DICOD, ALGO_GS, ALGO_RANDOM
+from dicod.dicod import DICOD, ALGO_GS, ALGO_RANDOM, LOG_DTYPE
 from dicod.multivariate_convolutional_coding_problem_2d import \
     MultivariateConvolutionalCodingProblem2D
 from dicod.dicod2d import DICOD2D
+from dicod.c_dicod.mpi_pool import get_reusable_pool, warmup
+from dicod.utils import DD_blocks
+from dicod.test.problems import make_problems
 from scipy.signal import fftconvolve
+from threading import Thread
+from subprocess import check_call
+import sys
 
 
 from faulthandler import dump_traceback_later
@@ -123,6 +130,285 @@ def test_dicod_interf(exit_on_deadlock, algo, n_jobs, n_seg):
     # _test_AB(dicod, pb)
 
 
+@pytest.mark.parametrize("n_jobs", range(1, MAX_WORKERS + 1))
+def test_dicod_map(exit_on_deadlock, n_jobs):
+    pbs = make_problems([100, 150, 200, 120, 80])
+
+    dicod = DICOD(n_jobs=n_jobs, max_iter=1e6, tol=1e-8, debug=5,
+                  hostfile='hostfile')
+    cost = dicod.map(pbs)
+
+    for pb, cost_pb in zip(pbs, cost):
+        assert abs(pb.cost(pb.pt) - cost_pb) / cost_pb < 1e-6
+        dicod.fit(pb)
+        assert abs(dicod.cost - cost_pb) / cost_pb < 1e-6
+
+
+@pytest.mark.parametrize("n_jobs", range(1, MAX_WORKERS + 1))
+def test_dicod_fit_packed(exit_on_deadlock, n_jobs):
+    pbs = make_problems([100, 150, 200, 120, 80], S=8)
+
+    dicod = DICOD(n_jobs=n_jobs, max_iter=1e7, tol=1e-10, hostfile='hostfile')
+    cost = dicod.fit_packed(pbs)
+    assert np.isclose(np.sum(cost), dicod.cost)
+
+    # The packed signals do not interact, the codes are the independent ones
+    for pb, cost_pb in zip(pbs, cost):
+        dicod.fit(pb)
+        assert abs(dicod.cost - cost_pb) / cost_pb < 1e-6
+
+
+@pytest.mark.parametrize("n_jobs", [1, MAX_WORKERS])
+def test_dicod_DD_threshold(exit_on_deadlock, n_jobs):
+    K, S = 5, 16
+    pb = make_problems(600, K=K, d=4, S=S, density=.02)
+
+    # The blocks of DD skip some of the cross-correlations
+    blocks = DD_blocks(pb.DD, 0.3)
+    assert sum(t_end - t_start for b in blocks for _, t_start, t_end in b
+               ) < K * K * (2 * S - 1)
+
+    dicod = DICOD(n_jobs=n_jobs, max_iter=1e6, tol=1e-8, hostfile='hostfile')
+    dicod.fit(pb)
+    cost = dicod.cost
+
+    dicod = DICOD(n_jobs=n_jobs, max_iter=1e6, tol=1e-8, DD_threshold=0.3,
+                  beta_refresh=20, hostfile='hostfile')
+    dicod.fit(pb)
+    assert abs(pb.cost(pb.pt) - dicod.cost) / dicod.cost < 1e-6
+    assert abs(dicod.cost - cost) / cost < 1e-5
+
+
+def test_dicod_beta_refresh():
+    # A null refresh period would stop the workers in the middle of a solve
+    with pytest.raises(ValueError):
+        DICOD(n_jobs=2, DD_threshold=0.3, beta_refresh=0)
+
+
+def test_dicod_stats(exit_on_deadlock):
+    pb = make_problems(600, S=8)
+
+    dicod = DICOD(n_jobs=MAX_WORKERS, max_iter=1e6, tol=1e-8,
+                  hostfile='hostfile')
+    dicod.fit(pb)
+    stats = dicod.stats
+    assert len(stats) == MAX_WORKERS
+    assert stats.updates.sum() == dicod.iteration
+
+    # Each UP message sent is received by the neighbor
+    assert np.all(stats.up_sent_right[:-1] == stats.up_recv_left[1:])
+    assert np.all(stats.up_sent_left[1:] == stats.up_recv_right[:-1])
+    assert stats.up_sent_left[0] == stats.up_sent_right[-1] == 0
+    assert np.all(stats.t_reduce >= stats.t_cost)
+    assert np.all(stats.max_rss > 0)
+
+
+def test_dicod_trace(exit_on_deadlock, tmpdir):
+    pb = make_problems(600, S=8)
+
+    dicod = DICOD(n_jobs=MAX_WORKERS, max_iter=1e6, tol=1e-8, trace=True,
+                  hostfile='hostfile')
+    dicod.fit(pb)
+    spans = [ev for ev in dicod.trace_events
+             if ev['ph'] == 'X' and ev['pid'] == 1]
+    assert set(ev['tid'] for ev in spans) == set(range(MAX_WORKERS))
+    assert {'compute', 'barrier', 'init', 'cost'} <= set(
+        ev['name'] for ev in spans)
+    assert all(ev['dur'] >= 0 for ev in spans)
+
+    fname = str(tmpdir.join('trace.json'))
+    dicod.save_trace(fname)
+    with open(fname) as f:
+        assert json.load(f)['traceEvents'] == dicod.trace_events
+
+
+def test_dicod_log_stream(exit_on_deadlock):
+    pb = make_problems(1000, K=5, S=10, density=.1, noise=.1)
+
+    # Each worker sends more updates than a chunk of the log
+    dicod = DICOD(n_jobs=2, max_iter=2e5, tol=1e-8, logging=True,
+                  algorithm=ALGO_RANDOM, hostfile='hostfile')
+    dicod.fit(pb)
+    assert dicod.log_update.dtype == LOG_DTYPE
+    assert len(dicod.log_update) == dicod.iteration
+    assert np.all(np.diff(dicod.log_update['t']) >= 0)
+    assert np.allclose(pb.pt, dicod.pt_dbg)
+
+
+def test_dicod_2d_log_stream(exit_on_deadlock):
+    K = 3
+    rng = np.random.RandomState(42)
+    D = rng.normal(size=(K, 2, 4, 4))
+    D /= np.sqrt((D*D).sum(axis=(-2, -1)))[:, :, None, None]
+    z = (rng.rand(K, 30, 30) > .95) * rng.randn(K, 30, 30)
+    x = np.array([[fftconvolve(zk, dk, 'full') for dk in Dk]
+                  for Dk, zk in zip(D, z)]).sum(axis=0)
+    pb = MultivariateConvolutionalCodingProblem2D(D, x, lmbd=0.01)
+
+    # The cost curve is replayed from the updates of the workers
+    dicod = DICOD2D(n_jobs=2, w_world=2, max_iter=1e6, tol=1e-8,
+                    logging=True, hostfile='hostfile')
+    dicod.fit(pb)
+    assert len(dicod.log_update) == dicod.iteration
+    pobj = dicod.cost_curve.pobj
+    assert len(pobj) > 1 and np.all(np.diff(pobj) <= 1e-10)
+    assert pobj[-1] >= dicod.cost - 1e-10
+    assert np.allclose(pb.pt, dicod.pt_dbg)
+
+
+@pytest.mark.parametrize("n_jobs", [1, MAX_WORKERS])
+def test_dicod_fit_path(exit_on_deadlock, n_jobs):
+    pb = make_problems(300, S=8, lmbd=0.1)
+
+    lmbds = [1., .1, .01]
+    dicod = DICOD(n_jobs=n_jobs, max_iter=1e7, tol=1e-10, hostfile='hostfile')
+    path = dicod.fit_path(pb, lmbds)
+    assert [res['lmbd'] for res in path] == lmbds
+    assert pb.lmbd == lmbds[-1] and np.allclose(pb.pt, path[-1]['pt'])
+
+    # The warm started solves reach the solutions of the cold ones
+    for res in path:
+        pb.lmbd = res['lmbd']
+        dicod.fit(pb)
+        assert abs(dicod.cost - res['cost']) / dicod.cost < 1e-6
+
+
+def test_dicod_split_pool(exit_on_deadlock):
+    pbs = make_problems([100, 150, 200, 120])
+
+    pool = get_reusable_pool(n_jobs=2, hostfile='hostfile')
+    pool.split({'a': 1, 'b': 1})
+    cost = {}
+
+    def solve(i):
+        dicod = DICOD(n_jobs=1, max_iter=1e6, tol=1e-8, hostfile='hostfile')
+        dicod.fit(pbs[i])
+        cost[i] = dicod.cost
+
+    threads = [Thread(target=solve, args=(i,)) for i in range(len(pbs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    pool.merge()
+
+    dicod = DICOD(n_jobs=2, max_iter=1e6, tol=1e-8, hostfile='hostfile')
+    for i, pb in enumerate(pbs):
+        dicod.fit(pb)
+        assert abs(dicod.cost - cost[i]) / cost[i] < 1e-6
+
+
+def test_dicod_split_parked_pool(exit_on_deadlock):
+    pbs = make_problems([100, 150, 200])
+
+    # After a larger solve, the pool returned for 2 workers is a parked one
+    dicod = DICOD(n_jobs=MAX_WORKERS, max_iter=1e6, tol=1e-8,
+                  hostfile='hostfile')
+    dicod.fit(pbs[0])
+    cost = [dicod.cost]
+
+    pool = get_reusable_pool(n_jobs=2, hostfile='hostfile')
+    pool.split({'a': 1, 'b': 1})
+    dicod = DICOD(n_jobs=1, max_iter=1e6, tol=1e-8, hostfile='hostfile')
+    for pb in pbs:
+        dicod.fit(pb)
+        cost += [dicod.cost]
+    pool.merge()
+
+    assert abs(cost[1] - cost[0]) / cost[0] < 1e-6
+    dicod = DICOD(n_jobs=MAX_WORKERS, max_iter=1e6, tol=1e-8,
+                  hostfile='hostfile')
+    for pb, cost_pb in zip(pbs, cost[1:]):
+        dicod.fit(pb)
+        assert abs(dicod.cost - cost_pb) / cost_pb < 1e-6
+
+
+def test_dicod_resize_pool(exit_on_deadlock):
+    pb = make_problems(300)
+
+    cost = []
+    for n_jobs in [2, 4, 1, 3]:
+        dicod = DICOD(n_jobs=n_jobs, max_iter=1e6, tol=1e-8,
+                      hostfile='hostfile')
+        dicod.fit(pb)
+        assert dicod._pool.n_jobs == n_jobs
+        cost += [dicod.cost]
+
+    # The pool grew once and the smaller fits only parked the extra workers
+    assert get_reusable_pool(n_jobs=4, hostfile='hostfile').n_jobs == 4
+    assert np.allclose(cost, cost[0], rtol=1e-6)
+
+
+def test_dicod_warmup(exit_on_deadlock):
+    pb = make_problems(200)
+
+    future = warmup(n_jobs=2, hostfile='hostfile')
+    dicod = DICOD(n_jobs=2, max_iter=1e6, tol=1e-8, hostfile='hostfile')
+    dicod.fit(pb)
+    assert dicod._pool is future.result()
+    assert set(dicod._pool.timings) == {'spawn', 'barrier', 'handshake'}
+
+
+def test_dicod_fit_async(exit_on_deadlock):
+    pbs = make_problems([100, 150, 200, 120])
+
+    dicod = DICOD(n_jobs=2, max_iter=1e6, tol=1e-8, logging=True,
+                  hostfile='hostfile')
+    cost = []
+    for pb in pbs:
+        dicod.fit(pb)
+        cost += [dicod.cost]
+
+    pool = get_reusable_pool(n_jobs=4, hostfile='hostfile')
+    for split in [False, True]:
+        if split:
+            pool.split({'a': 2, 'b': 2})
+        futures = [dicod.fit_async(pb) for pb in pbs]
+        for pb, cost_pb, future in zip(pbs, cost, futures):
+            res = future.result()
+            assert abs(res['cost'] - cost_pb) / cost_pb < 1e-6
+            assert abs(pb.cost(res['pt']) - cost_pb) / cost_pb < 1e-6
+            assert len(res['cost_curve'].pobj) > 0
+    pool.merge()
+
+    # A problem which cannot be sent does not leave the pool locked
+    class _BrokenProblem(MultivariateConvolutionalCodingProblem):
+        @property
+        def DD(self):
+            raise ValueError("No DD")
+
+    with pytest.raises(ValueError):
+        dicod.fit_async(_BrokenProblem(pbs[0].D, pbs[0].x, lmbd=0.01))
+    dicod.fit(pbs[0])
+    assert abs(dicod.cost - cost[0]) / cost[0] < 1e-6
+
+
+def test_dicod_interrupt(exit_on_deadlock):
+    pb = make_problems(20000, K=10, S=30, density=.01, lmbd=0.001)
+
+    dicod = DICOD(n_jobs=2, max_iter=1e9, tol=1e-12, timeout=60,
+                  hostfile='hostfile')
+    future = dicod.fit_async(pb)
+    snapshot = future.snapshot()
+    assert snapshot['pt'].shape == pb.pt.shape
+    assert np.isclose(pb.cost(snapshot['pt']), snapshot['cost'])
+    assert future.interrupt()
+
+    res = future.result()
+    assert res['runtime'] < 30
+    assert res['iteration'] >= snapshot['iterations'].sum()
+    assert abs(pb.cost(res['pt']) - res['cost']) / res['cost'] < 1e-6
+    assert not future.interrupt()
+    assert future.snapshot() is None
+
+
+def test_lazy_mpi_import():
+    # Importing the solvers should not initialize MPI
+    check_call([sys.executable, '-c',
+                "import sys, dicod.dicod, dicod.dicod2d\n"
+                "assert 'mpi4py.MPI' not in sys.modules"])
+
+
 @slow
 @pytest.mark.parametrize("algo,n_jobs,n_seg", param_array, ids=ids)
 def test_dicod_2d_ligne(exit_on_deadlock, algo, n_jobs, n_seg):
@@ -31,3 +31,37 @@ def test_fista_simple():
     assert (np.all(pt.reshape(1, -1).nonzero()[1] ==
                    z.reshape(1, -1).nonzero()[1])), (
         "Cost pt: ", fista.cost, "Cost z: ", pb.cost(z))
+
+
+class _Recorder(object):
+    def __init__(self):
+        self.iters, self.logs, self.stopped = [], [], False
+
+    def on_iter(self, solver):
+        self.iters += [solver.it]
+        return solver.it >= 50
+
+    def on_log(self, solver, it, time, cost):
+        self.logs += [cost]
+
+    def on_stop(self, solver):
+        self.stopped = True
+
+
+def test_fista_callbacks():
+    rng = np.random.RandomState(42)
+    D = rng.randn(3, 2, 5)
+    x = rng.randn(2, 100)
+    pb = MultivariateConvolutionalCodingProblem(D, x, lmbd=0.1)
+
+    rec = _Recorder()
+    fista = FISTA(max_iter=1e5, tol=0, logging=True, callbacks=[rec],
+                  callback_every=10)
+    fista.fit(pb)
+
+    assert fista.it == 50
+    assert rec.iters == [10, 20, 30, 40, 50]
+    assert rec.logs == fista.cost_curve.pobj
+    assert rec.stopped
+    assert set(fista.timings) == {'init', 'p_update', 'logging', 'stop'}
+    assert fista.timings['p_update'] <= fista.time
@@ -0,0 +1,52 @@
+import os
+import sys
+from time import sleep
+from subprocess import Popen, TimeoutExpired
+from multiprocessing.connection import Client
+
+from dicod.pool_server import PoolClient
+from dicod.coordinate_descent import CoordinateDescent
+from dicod.test.problems import make_problems
+
+
+def test_pool_server(tmpdir):
+    address = str(tmpdir.join('dicod_pool.sock'))
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    server = Popen([sys.executable, '-m', 'dicod.pool_server', '--njobs',
+                    '2', '--address', address], cwd=root)
+    for _ in range(100):
+        if os.path.exists(address):
+            break
+        sleep(.1)
+
+    pbs = make_problems([100, 150, 200])
+
+    try:
+        client = PoolClient(address, name='test')
+        res = client.fit(pbs[0], n_jobs=2, max_iter=1e6, tol=1e-8)
+        assert abs(pbs[0].cost() - res['cost']) / res['cost'] < 1e-6
+        client.map(pbs, n_jobs=1, max_iter=1e6, tol=1e-8)
+
+        cd = CoordinateDescent(max_iter=1e6, tol=1e-8)
+        for pb in pbs:
+            cost = pb.cost()
+            pb.reset()
+            cd.fit(pb)
+            assert abs(pb.cost() - cost) / cost < 1e-6
+        assert client.stats()['test']['n_tasks'] == 2
+
+        # A task sent before hello still gets a reply
+        conn = Client(address)
+        conn.send(('run', ('unknown', {}, 'fit', None)))
+        assert conn.poll(30)
+        assert conn.recv()[0] == 'error'
+        conn.close()
+        assert client.stats()[None]['n_errors'] == 1
+        client.shutdown()
+    finally:
+        try:
+            server.wait(timeout=30)
+        except TimeoutExpired:
+            server.kill()
+            server.wait()
@@ -0,0 +1,196 @@
+import os
+import numpy as np
+import pytest
+
+from dicod.dicod import LOG_DTYPE
+from dicod.utils import replay_updates, get_log_rate, memory_estimate
+from dicod.fft_backend import fft_backend, get_fft_backend, next_fast_len
+from dicod.multivariate_convolutional_coding_problem import\
+    MultivariateConvolutionalCodingProblem
+from dicod.multivariate_convolutional_coding_problem_2d import \
+    MultivariateConvolutionalCodingProblem2D
+
+
+@pytest.mark.parametrize("dim", [1, 2])
+@pytest.mark.parametrize("log_rate", ['log1.6', 'lin7'])
+def test_replay_updates(dim, log_rate):
+    rng = np.random.RandomState(42)
+    if dim == 1:
+        pb = MultivariateConvolutionalCodingProblem(
+            rng.randn(3, 2, 7), rng.randn(2, 80), lmbd=.1)
+    else:
+        pb = MultivariateConvolutionalCodingProblem2D(
+            rng.randn(3, 2, 4, 5), rng.randn(2, 20, 25), lmbd=.1)
+    updates = np.empty(1000, LOG_DTYPE)
+    updates['i0'] = rng.randint(pb.pt.size, size=1000)
+    updates['t'] = np.sort(rng.rand(1000))
+    updates['dz'] = rng.randn(1000)
+    updates['skip'] = rng.randint(3, size=1000)
+
+    # Replay the updates one at a time
+    log_rate = get_log_rate(log_rate)
+    pb.reset()
+    expected, t, it, next_log = [], 0, 0, 1
+    for i0, t_up, dz, skip in updates:
+        if it + 1 >= next_log:
+            expected += [(it, t, pb.cost(pb.pt))]
+            next_log = log_rate(it + 1)
+        t = t_up
+        pb.pt.flat[i0] += dz
+        it += 1 + skip
+    pt = np.copy(pb.pt)
+
+    # Small chunks to check the incremental cost on the residual
+    log = replay_updates(pb, updates, log_rate, chunk=100)
+    assert np.allclose(log, expected)
+    assert np.allclose(pb.pt, pt)
+
+
+@pytest.mark.parametrize("solver", ['DICOD', 'LGCD', 'FCSC'])
+def test_memory_estimate(solver):
+    K, d, S, T = 3, 2, 7, 200
+    rng = np.random.RandomState(42)
+    pb = MultivariateConvolutionalCodingProblem(
+        rng.randn(K, d, S), rng.randn(d, T), lmbd=.1)
+    memory = memory_estimate(K, d, S, T, n_jobs=2, solver=solver)
+
+    # The arrays of the problem are counted exactly
+    for name in ['X_fft', 'D_fft', 'DtD_fft', 'DtX_fft', 'DD']:
+        assert memory[name] == getattr(pb, name).nbytes
+    assert memory['total'] > pb.nbytes
+
+
+@pytest.mark.parametrize("T, S", [(100, 5), (40, 6)])
+def test_cost_grad_fft(T, S):
+    rng = np.random.RandomState(42)
+    pb = MultivariateConvolutionalCodingProblem(
+        rng.randn(3, 2, S), rng.randn(2, T), lmbd=.1)
+    z = rng.randn(*pb.pt.shape)
+
+    # Compare with the reconstruction in the time domain
+    res = pb.x - pb.reconstruct(z)
+    Er = (res * res).sum() / (2 * pb.d)
+    lmbd_max = np.max([np.sum([np.correlate(D_kp, x_p, mode='valid')
+                               for D_kp, x_p in zip(D_k, pb.x)], axis=0)
+                       for D_k in pb.D])
+    grad, cost = pb.grad_and_cost(z)
+    assert np.isclose(pb.Er(z), Er)
+    assert np.isclose(cost, Er + pb.lmbd * abs(z).sum())
+    assert np.allclose(grad, pb.grad_slow(z))
+    assert np.allclose(pb.grad(z), grad)
+    assert np.isclose(pb.get_lmbd_max(), lmbd_max)
+
+
+@pytest.mark.parametrize("backend", ['numpy', 'scipy', 'pyfftw'])
+def test_fft_backend(backend):
+    if backend == 'pyfftw':
+        pytest.importorskip('pyfftw')
+    rng = np.random.RandomState(42)
+    D, x = rng.randn(3, 2, 5), rng.randn(2, 45)
+    pb = MultivariateConvolutionalCodingProblem(D, x, lmbd=.1)
+    z = rng.randn(*pb.pt.shape)
+    grad, cost = pb.grad_and_cost(z)
+    rec = pb.reconstruct(z)
+
+    with fft_backend(backend, workers=2):
+        pb_backend = MultivariateConvolutionalCodingProblem(D, x, lmbd=.1)
+        assert pb_backend.fft_shape == pb.fft_shape
+        assert np.allclose(pb_backend.DtD_fft, pb.DtD_fft)
+        grad_backend, cost_backend = pb_backend.grad_and_cost(z)
+        assert np.allclose(grad_backend, grad)
+        assert np.isclose(cost_backend, cost)
+        assert np.allclose(pb_backend.reconstruct(z), rec)
+
+    with pytest.raises(ValueError):
+        with fft_backend('fftpack'):
+            pass
+
+
+def test_fft_backend_all_cpus():
+    pytest.importorskip('pyfftw')
+    assert get_fft_backend('pyfftw', workers=-1).workers == os.cpu_count()
+
+
+def test_next_fast_len():
+    for target in [1, 7, 11, 97, 10007, 10**6 + 3]:
+        n = next_fast_len(target)
+        assert n >= target
+        for p in [2, 3, 5]:
+            while n % p == 0:
+                n //= p
+        assert n == 1 or target <= 6
+
+
+@pytest.mark.parametrize("block_size", [7, 32, 200])
+def test_blocked_problem(block_size):
+    rng = np.random.RandomState(42)
+    D, x = rng.randn(3, 2, 6), rng.randn(2, 101)
+    pb = MultivariateConvolutionalCodingProblem(D, x, lmbd=.1)
+    pb_blocked = MultivariateConvolutionalCodingProblem(
+        D, x, lmbd=.1, block_size=block_size)
+    z = rng.randn(*pb.pt.shape)
+
+    grad, cost = pb_blocked.grad_and_cost(z)
+    assert np.allclose(grad, pb.grad(z))
+    assert np.isclose(cost, pb.cost(z))
+    assert np.isclose(pb_blocked.cost(z), cost)
+    assert np.allclose(pb_blocked.reconstruct(z), pb.reconstruct(z))
+    assert np.allclose(pb_blocked.grad_D(z), pb.grad_D(z))
+    assert np.isclose(pb_blocked.get_lmbd_max(), pb.get_lmbd_max())
+
+    # Only the spectra of a block are stored
+    memory = memory_estimate(3, 2, 6, 101, solver='FISTA',
+                             block_size=block_size)
+    for name in ['D_fft', 'DtD_fft', 'DtX', 'DD']:
+        assert memory[name] == getattr(pb_blocked, name).nbytes
+
+
+def test_lazy_constants():
+    rng = np.random.RandomState(42)
+    D, x = rng.randn(3, 2, 5), rng.randn(2, 60)
+    pb = MultivariateConvolutionalCodingProblem(D, x, lmbd=.1)
+    for name in ['DD', 'L', 'D_fft', 'DtD_fft', 'X_fft']:
+        assert name not in vars(pb)
+
+    # Each constant is only computed with the ones it needs
+    z = rng.randn(*pb.pt.shape)
+    pb.grad(z)
+    assert 'DtD_fft' in vars(pb) and 'DD' not in vars(pb)
+
+    # The changed constants are computed again after an update
+    x2, D2 = rng.randn(2, 80), rng.randn(3, 2, 5)
+    pb.update_x(x2)
+    pb.update_D(None, D=D2)
+    expected = MultivariateConvolutionalCodingProblem(D2, x2, lmbd=.1)
+    z = rng.randn(*expected.pt.shape)
+    assert pb.pt.shape == z.shape
+    assert np.allclose(pb.grad(z), expected.grad(z))
+    assert np.isclose(pb.cost(z), expected.cost(z))
+    assert np.allclose(pb.DD, expected.DD)
+    assert pb.L == expected.L
+
+
+def test_dictionary_operator(monkeypatch):
+    from dicod import dictionary_operator
+    rng = np.random.RandomState(42)
+    D = rng.randn(3, 2, 5)
+    pb1 = MultivariateConvolutionalCodingProblem(D, rng.randn(2, 60))
+    pb2 = MultivariateConvolutionalCodingProblem(D.copy(), rng.randn(2, 60))
+
+    # The constants of the dictionary are shared and read-only
+    assert pb1.DD is pb2.DD and pb1.L == pb2.L
+    assert pb1.DtD_fft.base is pb2.DtD_fft.base
+    assert not pb1.DD.flags.writeable
+
+    # A problem with another dictionary does not change the others
+    DD = pb1.DD.copy()
+    pb2.update_D(None, D=rng.randn(3, 2, 5))
+    assert pb2.DD is not pb1.DD
+    assert np.array_equal(pb1.DD, DD)
+
+    # The least recently used operators are dropped from the cache
+    monkeypatch.setattr(dictionary_operator, 'MAX_CACHE_BYTES', 0)
+    pb3 = MultivariateConvolutionalCodingProblem(rng.randn(3, 2, 5),
+                                                 rng.randn(2, 60))
+    pb3.DD
+    assert list(dictionary_operator._cache.values()) == [pb3.operator]
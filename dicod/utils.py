@@ -1,6 +1,9 @@
+import itertools
 import numpy as np
 from collections import namedtuple
 
+from .fft_backend import get_fft_backend, next_fast_len
+
 
 CostCurve = namedtuple('CostCurve', ['iterations', 'times', 'pobj'])
 TimingLogs = namedtuple('TimingLogs', ['time', 'runtime', 't_init'])
@@ -39,3 +42,320 @@ def l1(x):
 
 def l2(x):
     return x.ravel().dot(x.ravel())
+
+
+def compute_DD(D, packed=False, dtype=np.float64):
+    """Compute the cross-correlation DD between the atoms of a dictionary.
+
+    Parameters
+    ----------
+    D : array-like (K, d, *atom_shape)
+        dictionary, with 1D or 2D atoms.
+    packed : bool (default: False)
+        If set to True, use the symmetry DD[k, k'](t) = DD[k', k](-t) and
+        only compute the pairs k <= k'. The result is an array of shape
+        (K(K+1)/2, *lags) where the pair (k, k') is stored at
+        packed_index(k, k', K).
+    dtype : numpy dtype (default: float64)
+        Precision used to store DD.
+    """
+    K = D.shape[0]
+    D_rev = D[(Ellipsis,) + (slice(None, None, -1),) * (D.ndim - 2)]
+    if packed:
+        pairs = zip(*np.triu_indices(K))
+    else:
+        pairs = itertools.product(range(K), range(K))
+    fftconvolve = get_fft_backend().fftconvolve
+    DD = np.array([np.mean([fftconvolve(dk0, dk1)
+                            for dk0, dk1 in zip(D_rev[k0], D[k1])], axis=0)
+                   for k0, k1 in pairs], dtype=dtype)
+    if not packed:
+        DD = DD.reshape((K, K) + DD.shape[1:])
+    return DD
+
+
+def packed_index(k0, k1, K):
+    """Index of the pair (k0, k1), with k0 <= k1, in a packed DD."""
+    return k0 * (2 * K - k0 + 1) // 2 + k1 - k0
+
+
+def _packed_K(DD):
+    return int(round((np.sqrt(8 * DD.shape[0] + 1) - 1) / 2))
+
+
+def _flip_lags(DD):
+    return DD[(slice(None),) + (slice(None, None, -1),) * (DD.ndim - 1)]
+
+
+def pack_DD(DD, dtype=None):
+    """Only keep the pairs k <= k' of a full DD of shape (K, K, *lags)."""
+    k0, k1 = np.triu_indices(DD.shape[0])
+    return DD[k0, k1].astype(dtype or DD.dtype)
+
+
+def unpack_DD(DD):
+    """Rebuild the full DD of shape (K, K, *lags) from a packed DD."""
+    return np.array([DD_row(DD, k0, packed=True)
+                     for k0 in range(_packed_K(DD))]).swapaxes(0, 1)
+
+
+def DD_row(DD, k0, packed=False):
+    """Return DD[:, k0], the cross-correlation of all atoms with atom k0."""
+    if not packed:
+        return DD[:, k0]
+    K = _packed_K(DD)
+    k = np.arange(K)
+    lower = DD[packed_index(k[:k0 + 1], k0, K)]
+    upper = DD[packed_index(k0, k[k0 + 1:], K)]
+    return np.concatenate([lower, _flip_lags(upper)])
+
+
+def DD_entry(DD, k0, k1, tau, packed=False):
+    """Return DD[k0, k1][tau] with tau a (tuple of) lag index."""
+    if not packed:
+        return DD[k0, k1][tau]
+    if k0 <= k1:
+        return DD[packed_index(k0, k1, _packed_K(DD))][tau]
+    tau = np.array(DD.shape[1:]) - 1 - tau
+    return DD[packed_index(k1, k0, _packed_K(DD))][tuple(tau)]
+
+
+def DD_lipschitz(DD, packed=False):
+    """Sum over the lags of the spectral norm of the K x K matrices DD(t)."""
+    if not packed:
+        return np.linalg.norm(DD, axis=(0, 1), ord=2).sum()
+
+    # Rebuild one lag at a time to avoid unpacking the full DD
+    K = _packed_K(DD)
+    DD = DD.reshape((DD.shape[0], -1))
+    n_lags = DD.shape[1]
+    k0, k1 = np.triu_indices(K)
+    DD_t = np.empty((K, K))
+    L = 0
+    for t in range(n_lags):
+        DD_t[k0, k1] = DD[:, t]
+        DD_t[k1, k0] = DD[:, n_lags - 1 - t]
+        L += np.linalg.norm(DD_t, ord=2)
+    return L
+
+
+def DD_blocks(DD, threshold, packed=False):
+    """Significant blocks of the cross-correlation DD of a 1D dictionary.
+
+    For each atom k0, return the list of the blocks (k, t_start, t_end) such
+    that all the lags of DD[k, k0] with an absolute value larger than
+    threshold * max|DD[:, k0]| are in [t_start, t_end). The atoms k without
+    such lags are dropped. The auto-correlation DD[k0, k0] is always kept
+    whole as the coordinates of atom k0 are strongly coupled.
+    """
+    K = _packed_K(DD) if packed else DD.shape[0]
+    n_lags = DD.shape[-1]
+    blocks = []
+    for k0 in range(K):
+        DD_k0 = abs(DD_row(DD, k0, packed=packed))
+        thr = threshold * DD_k0.max()
+        blocks_k0 = []
+        for k, DD_kk0 in enumerate(DD_k0):
+            lags = np.where(DD_kk0 > thr)[0]
+            if k == k0:
+                lags = np.r_[0, n_lags - 1]
+            if len(lags) > 0:
+                blocks_k0 += [(k, lags.min(), lags.max() + 1)]
+        blocks += [blocks_k0]
+    return blocks
+
+
+def replay_updates(pb, updates, log_rate, t_init=0, chunk=2**20):
+    """Replay the updates logged by DICOD and compute the cost curve.
+
+    Starting from pb.x0, the updates are applied in bulk between two log
+    points. For a few updates, the cost is updated only on the part of the
+    residual and of the code they touch. For many, which is cheaper, the
+    residual is recomputed with one reconstruction. At the end, pb.pt is
+    the last point. Works with 1D and 2D problems.
+
+    Parameters
+    ----------
+    pb : _Problem
+        Problem solved, with a dictionary D of shape (K, d, *atom_shape).
+    updates : array with fields i0, t, dz and skip
+        Updates ordered by time, i0 is the flat index in pb.pt, see
+        dicod.LOG_DTYPE.
+    log_rate : callable
+        Return the next iteration to log from the current one.
+    t_init : float (default: 0)
+        Time added to the time of the updates.
+    chunk : int (default: 2**20)
+        Max number of residual entries modified at once, to bound the memory.
+
+    Return
+    ------
+    log : list of (iteration, time, cost)
+        Point logged before the update at iteration + 1, as the replay in
+        _LassoSolver.record.
+    """
+    pb.reset()
+    pt = pb.pt.reshape(-1)
+    K, d = pb.D.shape[:2]
+    atom_shape = pb.D.shape[2:]
+    sig_shape = pb.x.shape[1:]
+    code_shape = pb.pt.shape[1:]
+    residual = (pb.x - pb.reconstruct(pb.pt)).reshape(d, -1)
+    D = pb.D.reshape(K, d, -1)
+
+    # Flat offsets in the signal of the atom starting at the origin
+    offsets = np.ravel_multi_index(np.indices(atom_shape).reshape(
+        len(atom_shape), -1), sig_shape)
+
+    err = (residual * residual).sum()
+    reg = np.sum(abs(pt))
+    n_up = max(1, chunk // D[0].size)
+
+    def _apply(i0, dz):
+        nonlocal residual, err, reg
+        if len(i0) * offsets.size > K * residual.shape[1]:
+            pt[:] += np.bincount(i0, weights=dz, minlength=pt.size)
+            residual = (pb.x - pb.reconstruct(pb.pt)).reshape(d, -1)
+            err = (residual * residual).sum()
+            reg = np.sum(abs(pt))
+            return
+        for start in range(0, len(i0), n_up):
+            j, dz_j = i0[start:start + n_up], dz[start:start + n_up]
+            u = np.unique(j)
+            reg -= abs(pt[u]).sum()
+            np.add.at(pt, j, dz_j)
+            reg += abs(pt[u]).sum()
+
+            # Atom and flat index in the signal of the updated coordinates
+            k, pos = np.divmod(j, np.prod(code_shape))
+            pos = np.ravel_multi_index(np.unravel_index(pos, code_shape),
+                                       sig_shape)
+            idx = pos[:, None] + offsets[None]
+            touched = np.unique(idx)
+            err -= (residual[:, touched] ** 2).sum()
+            np.add.at(residual, (np.arange(d)[None, :, None], idx[:, None]),
+                      -dz_j[:, None, None] * D[k])
+            err += (residual[:, touched] ** 2).sum()
+
+    def _cost():
+        return err / (2 * pb.d) + pb.lmbd * reg
+
+    # Iteration and time of the solver before each update
+    n_iter = 1 + updates['skip'].astype(np.int64)
+    it = np.r_[0, np.cumsum(n_iter)[:-1]]
+    times = np.r_[t_init, updates['t'][:-1] + t_init]
+
+    log = []
+    start, applied, next_log = 0, 0, 1
+    while True:
+        # First update reaching the next log point, the iterations are
+        # increasing so it is found by bisection
+        i = start + np.searchsorted(it[start:] + 1, next_log)
+        if i >= len(updates):
+            break
+        _apply(updates['i0'][applied:i], updates['dz'][applied:i])
+        applied = i
+        log += [(it[i], times[i], _cost())]
+        next_log = log_rate(it[i] + 1)
+        start = i + 1
+    _apply(updates['i0'][applied:], updates['dz'][applied:])
+    return log
+
+
+def arrays_nbytes(obj):
+    '''Size in bytes of the numpy arrays held in the attributes of obj
+
+    The views on the memory of another attribute are not counted.
+    '''
+    nbytes, seen = {}, set()
+    for name, arr in vars(obj).items():
+        if not isinstance(arr, np.ndarray):
+            continue
+        base = arr
+        while isinstance(base.base, np.ndarray):
+            base = base.base
+        if id(base) not in seen:
+            seen.add(id(base))
+            nbytes[name] = arr.nbytes
+    return nbytes
+
+
+def memory_estimate(K, d, S, T, n_jobs=1, solver='DICOD', packed_DD=False,
+                    DD_dtype=np.float64, block_size=None):
+    '''Estimate the memory needed to solve a 1D problem, in bytes
+
+    Only the arrays scaling with the problem are counted, so this is a lower
+    bound of the memory used.
+
+    Parameters
+    ----------
+    K, d, S, T: int
+        Number of atoms, of channels, length of the atoms and of the signal
+    n_jobs: int, optional (default: 1)
+        Number of MPI workers for 'DICOD'
+    solver: str, optional (default: 'DICOD')
+        One of {'DICOD', 'CoordinateDescent', 'LGCD', 'FISTA', 'FCSC', 'FSS'}
+    packed_DD: bool, optional (default: False)
+        Only store the pairs k <= k' of DD
+    DD_dtype: numpy dtype, optional (default: float64)
+        Precision used to store DD in the problem
+    block_size: int or None, optional (default: None)
+        Block size of the problem, see MultivariateConvolutionalCodingProblem
+
+    Return
+    ------
+    memory: dict
+        Size of the arrays of the problem, of the solver and, for 'DICOD',
+        of each worker ('worker') and of all of them ('workers'), with their
+        sum in 'total'.
+    '''
+    L = T - S + 1
+    F = next_fast_len(T + S - 1) // 2 + 1
+    if block_size is not None:
+        F_block = next_fast_len(block_size + 2 * (S - 1)) // 2 + 1
+    n_DD = (K * (K + 1) // 2 if packed_DD else K * K) * (2 * S - 1)
+    f8, c16 = 8, 16
+
+    # Arrays of MultivariateConvolutionalCodingProblem
+    memory = dict(x=d * T * f8, D=K * d * S * f8, pt=2 * K * L * f8,
+                  X_fft=d * F * c16, D_fft=K * d * F * c16,
+                  DtD_fft=K * K * F * c16, DtX_fft=K * F * c16,
+                  grad_fft=K * F * c16,
+                  DD=n_DD * np.dtype(DD_dtype).itemsize)
+    if block_size is not None:
+        # The spectra are only stored for a block and D^Tx is in the time
+        # domain
+        del memory['X_fft'], memory['DtX_fft']
+        memory.update(D_fft=K * d * F_block * c16,
+                      DtD_fft=K * K * F_block * c16,
+                      grad_fft=K * F_block * c16, DtX=K * L * f8)
+
+    if solver in ['CoordinateDescent', 'LGCD']:
+        memory['beta'] = K * L * f8
+    elif solver == 'FISTA':
+        # Momentum point and the gradient and candidate of the line search
+        memory['yn'] = K * L * f8
+        memory['line_search'] = 2 * K * L * f8
+    elif solver == 'FSS':
+        memory['grad'] = K * L * f8
+    elif solver == 'FCSC':
+        # The K x K system of each frequency is built and factorized at
+        # each iteration
+        memory['DtD_fft_solver'] = K * K * F * c16
+        memory['systems'] = 2 * K * K * F * c16
+        memory['z_t_lambda'] = 3 * K * L * f8
+        memory['z_t_lambda_fft'] = 4 * K * F * c16
+    elif solver == 'DICOD':
+        # The workers receive DD and D as float64 and their part of the
+        # signal with the overlap of S - 1
+        L_proc = L // n_jobs + 1
+        worker = (n_DD * f8 + K * d * S * f8 + d * (L_proc + S - 1) * f8 +
+                  2 * K * L_proc * f8)
+        memory['worker'] = worker
+        memory['workers'] = n_jobs * worker
+        memory['gather'] = K * L * f8
+    else:
+        raise ValueError("Unknown solver '{}'".format(solver))
+
+    memory['total'] = sum(v for k, v in memory.items() if k != 'worker')
+    return memory
@@ -53,7 +53,7 @@ def dict_learn(max_iter=5e6, timeout=7200, n_jobs=2, hostfile=None,
         print('End\n')
         lmbd = .3
 
-        dcp = DICOD(pbs[0], n_jobs=n_jobs, hostfile=hostfile,
+        dcp = DICOD(n_jobs=n_jobs, hostfile=hostfile,
                     positive=True, use_seg=5, **common_args)
 
         grad_D = [np.zeros(D.shape) for _ in range(N)]
@@ -78,15 +78,16 @@ def dict_learn(max_iter=5e6, timeout=7200, n_jobs=2, hostfile=None,
                     (current_batch + 1) * mini_batch_size]]
             current_batch += 1
             current_batch %= n_batch
-            DD = None
             new = False
-            for pb, i0 in pb_batch:
-                pb.D = D
-
-                # Sparse coding
+            for pb, _ in pb_batch:
+                pb.update_D(None, D)
                 pb.reset()
-                DD = dcp.fit(pb, DD=DD)
 
+            # Sparse coding of the mini batch, the dictionary is sent once
+            # to the workers which pull the problems as soon as they are free
+            dcp.map([pb for pb, _ in pb_batch])
+
+            for pb, i0 in pb_batch:
                 # Update cost and D gradient
                 new |= cost[i0] == 0
                 cost[i0] = pb.cost()
@@ -126,31 +127,23 @@ def dict_learn(max_iter=5e6, timeout=7200, n_jobs=2, hostfile=None,
             if cost_i >= cost_i1 and not new:
                 # IPython.embed()
                 lmbd *= .7
-        from sys import stdout as out
-        print('=' * 79)
-        print('Fit the pb to the latest dictionary')
-        print('=' * 79)
-        for i, pb in enumerate(pbs):
-            pb.D = D
-            pb.reset()
-            dcp.fit(pb)
-            out.write('\rCompute rpz: {:7.2%}'.format(i / N))
-            out.flush()
-        print('\rCompute rpz: {:7}'.format('Done'))
+        _fit_latest(dcp, pbs, D)
     except KeyboardInterrupt:
-        from sys import stdout as out
-        print('=' * 79)
-        print('Fit the pb to the latest dictionary')
-        print('=' * 79)
-        for i, pb in enumerate(pbs):
-            pb.D = D
-            pb.reset()
-            dcp.fit(pb)
-            out.write('\rCompute rpz: {:7.2%}'.format(i / N))
-            out.flush()
-        print('\rCompute rpz: {:7}'.format('Done'))
+        _fit_latest(dcp, pbs, D)
 
     finally:
         print("Frob norm D", np.sum((D - D0) ** 2) / np.sum(D0 * D0))
         IPython.embed()
         log.end()
+
+
+def _fit_latest(dcp, pbs, D):
+    '''Compute the codes of all the problems with the latest dictionary'''
+    print('=' * 79)
+    print('Fit the pb to the latest dictionary')
+    print('=' * 79)
+    for pb in pbs:
+        pb.update_D(None, D)
+        pb.reset()
+    dcp.map(pbs)
+    print('Compute rpz: {:7}'.format('Done'))
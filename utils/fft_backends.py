@@ -0,0 +1,76 @@
+import numpy as np
+from time import time
+
+from dicod.fft_backend import FFT_BACKENDS, fft_backend
+from dicod.multivariate_convolutional_coding_problem import \
+    MultivariateConvolutionalCodingProblem
+
+
+# Typical shapes (K, d, S, T) of the problems of the experiments
+SHAPES = [(10, 7, 200, 20000), (25, 7, 200, 20000), (10, 1, 100, 100000),
+          (50, 7, 200, 40000)]
+
+
+def _timeit(f, n_rep):
+    f()
+    times = []
+    for _ in range(n_rep):
+        t = time()
+        f()
+        times += [time() - t]
+    return np.median(times)
+
+
+def bench_fft_backends(shapes=SHAPES, workers=1, n_rep=10, display=True):
+    '''Measure the gradient and the reconstruction of the 1D problems with
+    each FFT backend
+
+    Parameters
+    ----------
+    shapes: list of tuple, optional (default: SHAPES)
+        Shapes (K, d, S, T) of the benchmarked problems
+    workers: int, optional (default: 1)
+        Number of threads of the backends, -1 to use all the CPUs
+    n_rep: int, optional (default: 10)
+        Number of calls of each function, after a first warm up call
+    display: bool, optional (default: True)
+        Print the median times of each backend
+
+    Return
+    ------
+    times: dict
+        Median times of grad and reconstruct for each (backend, shape), in
+        seconds
+    '''
+    rng = np.random.RandomState(42)
+    times = {}
+    for K, d, S, T in shapes:
+        D, x = rng.randn(K, d, S), rng.randn(d, T)
+        for backend in FFT_BACKENDS:
+            try:
+                with fft_backend(backend, workers=workers):
+                    pb = MultivariateConvolutionalCodingProblem(D, x)
+                    z = rng.randn(*pb.pt.shape)
+                    z *= rng.rand(*z.shape) < .01
+                    t_grad = _timeit(lambda: pb.grad(z), n_rep)
+                    t_rec = _timeit(lambda: pb.reconstruct(z), n_rep)
+            except ImportError:
+                continue
+            times[backend, (K, d, S, T)] = t_grad, t_rec
+            if display:
+                print('{:7} K={:3} d={:2} S={:4} T={:7}  grad {:.4f}s  '
+                      'reconstruct {:.4f}s'.format(backend, K, d, S, T,
+                                                   t_grad, t_rec))
+    return times
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser('Speed of the FFT backends')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='# of threads of the backends, -1 for all CPUs')
+    parser.add_argument('--nrep', type=int, default=10,
+                        help='# of calls of each function')
+    args = parser.parse_args()
+    bench_fft_backends(workers=args.workers, n_rep=args.nrep)
@@ -0,0 +1,54 @@
+import sys
+import numpy as np
+from subprocess import check_output
+
+
+STATEMENTS = {
+    'dicod': 'import dicod.dicod',
+    'dicod+MPI': 'import dicod.dicod; dicod.dicod.MPI.Wtime()',
+    'fista': 'import dicod.fista',
+}
+
+SCRIPT = '''from time import time
+t = time()
+{}
+print(time() - t)
+'''
+
+
+def import_time(n_rep=10, display=True):
+    '''Measure the cold start of the package in fresh python processes.
+
+    The MPI runtime is only initialized on the first use of dicod.MPI, so
+    'dicod+MPI' gives the import time when MPI was initialized at import.
+
+    Parameters
+    ----------
+    n_rep: int, optional (default: 10)
+        Number of processes launched for each statement
+    display: bool, optional (default: True)
+        Print the median import time of each statement
+
+    Return
+    ------
+    times: dict
+        Import times of each statement, in seconds
+    '''
+    times = {}
+    for name, statement in STATEMENTS.items():
+        times[name] = [float(check_output([
+            sys.executable, '-c', SCRIPT.format(statement)]))
+            for _ in range(n_rep)]
+        if display:
+            print('{:10} {:.4f}s'.format(name, np.median(times[name])))
+    return times
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser('Import time of the dicod package')
+    parser.add_argument('--nrep', type=int, default=10,
+                        help='# of processes launched for each statement')
+    args = parser.parse_args()
+    import_time(n_rep=args.nrep)
@@ -0,0 +1,76 @@
+import numpy as np
+from time import time
+
+from dicod.coordinate_descent import CoordinateDescent
+from dicod.sequential_dicod import LGCD
+from dicod.multivariate_convolutional_coding_problem import \
+    MultivariateConvolutionalCodingProblem
+
+
+def _make_problem(K, d, S, T, lmbd, rng):
+    '''Signal generated by a sparse code on a random dictionary, which has
+    small cross-correlations for large d * S
+    '''
+    D = rng.randn(K, d, S)
+    D /= np.sqrt((D * D).sum(axis=(1, 2), keepdims=True))
+    z = rng.randn(K, T - S + 1) * (rng.rand(K, T - S + 1) < .002)
+    x = np.array([sum(np.convolve(zk, dk) for zk, dk in zip(z, D[:, p]))
+                  for p in range(d)])
+    x += .01 * rng.randn(*x.shape)
+    return MultivariateConvolutionalCodingProblem(D, x, lmbd=lmbd)
+
+
+def bench_sparse_DD(K=50, d=7, S=200, T=10000, lmbd=.1,
+                    thresholds=[0, .1, .3], beta_refresh=1000, tol=1e-3,
+                    max_iter=20000, display=True):
+    '''Compare the solvers using the full DD with the ones using only its
+    significant entries, see DD_threshold
+
+    The sparse updates of beta are cheaper but each one is approximate, so
+    the solvers need more updates to converge. The gain is large for LGCD,
+    whose updates are dominated by the update of beta, and small for
+    CoordinateDescent, whose updates are dominated by the selection of the
+    coordinate in the whole signal.
+
+    Return
+    ------
+    times: dict
+        Runtime, number of updates and final cost for each
+        (solver, DD_threshold)
+    '''
+    rng = np.random.RandomState(42)
+    pb = _make_problem(K, d, S, T, lmbd, rng)
+    times = {}
+    for solver_class in [LGCD, CoordinateDescent]:
+        for DD_threshold in thresholds:
+            pb.reset()
+            solver = solver_class(DD_threshold=DD_threshold,
+                                  beta_refresh=beta_refresh, tol=tol,
+                                  max_iter=max_iter)
+            t = time()
+            solver.fit(pb)
+            t = time() - t
+            times[solver_class.__name__, DD_threshold] = (
+                t, solver.it, pb.cost())
+            if display:
+                print('{:17} DD_threshold={:.2f}  {:.3f}s  {:6} updates  '
+                      '({:.3f}ms/update)  cost {:.6f}'.format(
+                          solver_class.__name__, DD_threshold, t,
+                          solver.it, 1e3 * t / solver.it, pb.cost()))
+    return times
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser('Speed of the solvers with a sparse DD')
+    parser.add_argument('-K', type=int, default=50,
+                        help='# of atoms in the dictionary')
+    parser.add_argument('-S', type=int, default=200,
+                        help='length of the atoms')
+    parser.add_argument('-T', type=int, default=10000,
+                        help='length of the signal')
+    parser.add_argument('--refresh', type=int, default=1000,
+                        help='# of updates between two exact beta')
+    args = parser.parse_args()
+    bench_sparse_DD(K=args.K, S=args.S, T=args.T, beta_refresh=args.refresh)